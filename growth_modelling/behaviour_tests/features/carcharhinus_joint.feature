@@ -0,0 +1,132 @@
+@carcharhinus_joint
+Feature: Joint nonlinear growth model for blacktip and spot-tail sharks (Carcharhinus limbatus, Carcharhinus tilstoni, and Carcharhinus sorrah)
+    Background:
+        Given that our statement is:
+            """
+            The energy reallocation from somatic growth towards sexual reproduction that occurs beyond the age-at-maturity
+            contributes to decreases in somatic growth rates following the onset of sexual maturity. Reproductive
+            investment is particularly high for chondrichthyans when compared to teleosts. Hence, changes in the growth
+            trajectory of chondrichthyans following the age-at-maturity are more likely to be identified by length-at-age data alone.
+            """
+        And that our aim is to:
+            """
+            Evaluate and compare the statistical fit of biphasic growth models against monophasic growth models, under the
+            belief that biphasic growth models are better able to account for changes in the growth trajectory of chondrichthyans
+            following the age-at-maturity. Hence, biphasic models may provide more robust parameter estimates of growth to incorporate into
+            other fisheries models, such as stock assessment models.
+            """"
+        And we are fitting a "nonlinear" Bayesian growth model using "No U-Turn Sampler" ("NUTS")
+        And we are fitting a growth model with a "Gaussian" likelihood
+        And we are running "4" Markov chain Monte Carlo (MCMC) chains with parallelisation "enabled"
+        And we are taking "2000" draws per MCMC chain
+        And we specify "2000" samples for our burn-in period
+        And our MCMC samples have an acceptance probability of "0.99"
+        And our assessment metric is "Expected log pointwise predictive density" ("ELPD")
+        And our assessment method is "Pareto smoothed importance sampling leave-one-out cross-validation" ("LOO")
+        And our method to estimate the model weights is "stacking"
+        And our class is "Chondrichthyes"
+        And our order is "Carcharhiniformes"
+        And our family is "Carcharhinidae"
+        And we define parameter "L_inf" ("cm") as "The theoretical upper asymptotic size for infinite growth."
+        And we define parameter "k" ("years^-1") as "The growth coefficient representing the rate of growth."
+        And we define parameter "t_0" ("cm") as "The theoretical size at age zero."
+        And we define parameter "t_h" ("years") as "The age in which the phasic transition occurs."
+        And we define parameter "h" ("cm") as "The magnitude of the maximum difference in size-at-age between monophasic and biphasic models."
+        And we are jointly fitting the following groups
+            | species                 | sex    | locations                                                            | first year | last year |
+            | Carcharhinus limbatus   | Male   | New South Wales A, New South Wales B, Queensland A, and Queensland B | 2004       | 2013      |
+            | Carcharhinus limbatus   | Female | New South Wales A, New South Wales B, Queensland A, and Queensland B | 2004       | 2013      |
+            | Carcharhinus tilstoni   | Male   | New South Wales A, and Queensland A                                  | 2007       | 2012      |
+            | Carcharhinus tilstoni   | Female | New South Wales A, and Queensland A                                  | 2007       | 2012      |
+            | Carcharhinus sorrah     | Male   |                                                                      | 2007       | 2012      |
+            | Carcharhinus sorrah     | Female |                                                                      | 2007       | 2012      |
+        And we set our random seed to "100"
+
+    @fisheries_modelling
+    Scenario: Jointly fit von Bertalanffy growth models for male and female blacktip and spot-tail sharks
+        Given our growth curve is a "von Bertalanffy growth model (Beverton, 1957)" ("VBGM")
+        And our response variable is "Total Length" ("cm")
+        And our explanatory variable is "Age" ("years")
+        And we believe that our group parameters could plausibly be
+            | species               | sex    | parameter | mu     | sigma | lower |
+            | Carcharhinus limbatus | Male   | L_inf     | 241.9  | 20.0  | 0.0   |
+            | Carcharhinus limbatus | Male   | k         | 0.1565 | 0.1   | 0.0   |
+            | Carcharhinus limbatus | Male   | t_0       | 0.0    | 2.0   |       |
+            | Carcharhinus limbatus | Female | L_inf     | 263.6  | 20.0  | 0.0   |
+            | Carcharhinus limbatus | Female | k         | 0.142  | 0.1   | 0.0   |
+            | Carcharhinus limbatus | Female | t_0       | 0.0    | 2.0   |       |
+            | Carcharhinus tilstoni | Male   | L_inf     | 156.8  | 10.0  | 0.0   |
+            | Carcharhinus tilstoni | Male   | k         | 0.25   | 0.2   | 0.0   |
+            | Carcharhinus tilstoni | Male   | t_0       | 0.0    | 2.0   |       |
+            | Carcharhinus tilstoni | Female | L_inf     | 181.4  | 10.0  | 0.0   |
+            | Carcharhinus tilstoni | Female | k         | 0.19   | 0.15  | 0.0   |
+            | Carcharhinus tilstoni | Female | t_0       | 0.0    | 2.0   |       |
+            | Carcharhinus sorrah   | Male   | L_inf     | 102.9  | 10.0  | 0.0   |
+            | Carcharhinus sorrah   | Male   | k         | 0.9    | 0.2   | 0.0   |
+            | Carcharhinus sorrah   | Male   | t_0       | 0.0    | 2.5   |       |
+            | Carcharhinus sorrah   | Female | L_inf     | 125.25 | 15.0  | 0.0   |
+            | Carcharhinus sorrah   | Female | k         | 0.34   | 0.15  | 0.0   |
+            | Carcharhinus sorrah   | Female | t_0       | 0.0    | 2.5   |       |
+        And we fit random intercepts to "year"
+        And we fit random intercepts for "year" to "L_inf"
+        And we aim to evaluate the "0.95" highest posterior density intervals (HDIs) of our parameter estimates
+        When we retrieve our data from the "data.csv" file
+        And we fit our Bayesian model
+        Then we expect our "Effective sample size" ("ESS bulk") diagnostics to all be "greater than" "100.0"
+        And we expect our "Effective sample size" ("ESS tail") diagnostics to all be "greater than" "100.0"
+        And we expect our "Monte carlo standard error" ("MCSE mean") diagnostics to all be "less than" "1.0"
+        And we expect our "Monte carlo standard error" ("MCSE sd") diagnostics to all be "less than" "1.0"
+        And we expect our "Gelman-Rubin statistic" ("R-hat") diagnostics to all be "less than" "1.1"
+
+    @fisheries_modelling
+    Scenario: Jointly fit biphasic von Bertalanffy growth models for male and female blacktip and spot-tail sharks
+        Given our growth curve is a "biphasic von Bertalanffy growth model (Soriano et al., 1992)" ("BVBGM")
+        And our response variable is "Total Length" ("cm")
+        And our explanatory variable is "Age" ("years")
+        And we believe that our group parameters could plausibly be
+            | species               | sex    | parameter | mu     | sigma | lower |
+            | Carcharhinus limbatus | Male   | L_inf     | 241.9  | 20.0  | 0.0   |
+            | Carcharhinus limbatus | Male   | k         | 0.1565 | 0.1   | 0.0   |
+            | Carcharhinus limbatus | Male   | t_0       | 0.0    | 2.0   |       |
+            | Carcharhinus limbatus | Male   | t_h       | 8.33   | 1.0   | 0.0   |
+            | Carcharhinus limbatus | Male   | h         | 0.0    | 2.0   | 0.0   |
+            | Carcharhinus limbatus | Female | L_inf     | 263.6  | 20.0  | 0.0   |
+            | Carcharhinus limbatus | Female | k         | 0.142  | 0.1   | 0.0   |
+            | Carcharhinus limbatus | Female | t_0       | 0.0    | 2.0   |       |
+            | Carcharhinus limbatus | Female | t_h       | 8.33   | 1.0   | 0.0   |
+            | Carcharhinus limbatus | Female | h         | 0.0    | 2.0   | 0.0   |
+            | Carcharhinus tilstoni | Male   | L_inf     | 156.8  | 10.0  | 0.0   |
+            | Carcharhinus tilstoni | Male   | k         | 0.25   | 0.2   | 0.0   |
+            | Carcharhinus tilstoni | Male   | t_0       | 0.0    | 2.0   |       |
+            | Carcharhinus tilstoni | Male   | t_h       | 3.5    | 0.75  | 0.0   |
+            | Carcharhinus tilstoni | Male   | h         | 0.0    | 2.0   | 0.0   |
+            | Carcharhinus tilstoni | Female | L_inf     | 181.4  | 10.0  | 0.0   |
+            | Carcharhinus tilstoni | Female | k         | 0.19   | 0.15  | 0.0   |
+            | Carcharhinus tilstoni | Female | t_0       | 0.0    | 2.0   |       |
+            | Carcharhinus tilstoni | Female | t_h       | 4.5    | 1.0   | 0.0   |
+            | Carcharhinus tilstoni | Female | h         | 0.0    | 2.0   | 0.0   |
+            | Carcharhinus sorrah   | Male   | L_inf     | 102.9  | 10.0  | 0.0   |
+            | Carcharhinus sorrah   | Male   | k         | 0.9    | 0.2   | 0.0   |
+            | Carcharhinus sorrah   | Male   | t_0       | 0.0    | 2.5   |       |
+            | Carcharhinus sorrah   | Male   | t_h       | 2.5    | 0.75  | 0.0   |
+            | Carcharhinus sorrah   | Male   | h         | 0.0    | 0.5   | 0.0   |
+            | Carcharhinus sorrah   | Female | L_inf     | 125.25 | 15.0  | 0.0   |
+            | Carcharhinus sorrah   | Female | k         | 0.34   | 0.15  | 0.0   |
+            | Carcharhinus sorrah   | Female | t_0       | 0.0    | 2.5   |       |
+            | Carcharhinus sorrah   | Female | t_h       | 2.5    | 0.75  | 0.0   |
+            | Carcharhinus sorrah   | Female | h         | 0.0    | 0.5   | 0.0   |
+        And we fit random intercepts to "year"
+        And we fit random intercepts for "year" to "L_inf"
+        And we aim to evaluate the "0.95" highest posterior density intervals (HDIs) of our parameter estimates
+        When we retrieve our data from the "data.csv" file
+        And we fit our Bayesian model
+        Then we expect our "Effective sample size" ("ESS bulk") diagnostics to all be "greater than" "100.0"
+        And we expect our "Effective sample size" ("ESS tail") diagnostics to all be "greater than" "100.0"
+        And we expect our "Monte carlo standard error" ("MCSE mean") diagnostics to all be "less than" "1.0"
+        And we expect our "Monte carlo standard error" ("MCSE sd") diagnostics to all be "less than" "1.0"
+        And we expect our "Gelman-Rubin statistic" ("R-hat") diagnostics to all be "less than" "1.1"
+
+    @fisheries_modelling
+    Scenario: Compare joint monophasic and biphasic growth models for male and female blacktip and spot-tail sharks
+        When we compare the following candidate models "VBGM and BVBGM"
+        Then we expect the "BVBGM" to be the best performing model
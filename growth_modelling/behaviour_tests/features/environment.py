@@ -5,15 +5,76 @@
 # External
 from behave.model import Feature, Scenario
 from behave.runner import Context
+import logging
+from os.path import join as join_path
 
 # Internal
-from steps.data_model import BehaviourTestModel
+from steps.adaptation import AdaptationCache
+from steps.artifacts import ArtifactRenderer
+from steps.data_model import BehaviourTestModel, RunSettings
+from steps.elpd_cache import ElpdCache
+from steps.model_registry import ModelRegistry
+from steps.trace_cache import TraceCache, TraceRegistry
+
+######################################
+# Constants
+######################################
+
+logger = logging.getLogger("environment")
 
 ######################################
 # Functions
 ######################################
 
 
+def before_all(context: Context) -> None:
+    """
+    Before all environmental control.
+
+    Args:
+        context (Context):
+            The current test context.
+    """
+    settings = RunSettings().update(context.config.userdata)
+    context.settings = settings
+    context.trace_cache = TraceCache(
+        join_path(settings.cache_dir, "traces"),
+        settings.trace_cache_size,
+        settings.trace_cache,
+    )
+    context.model_registry = ModelRegistry(settings.model_registry)
+    context.adaptation_cache = AdaptationCache(
+        join_path(settings.cache_dir, "adaptation"), settings.adaptation_cache
+    )
+    context.elpd_cache = ElpdCache(
+        join_path(settings.cache_dir, "elpd"), settings.elpd_cache
+    )
+    context.artifacts = ArtifactRenderer(
+        settings.plot_workers, not settings.diagnostics_only
+    )
+    context.joint_fits = set()
+
+
+def after_all(context: Context) -> None:
+    """
+    After all environmental control.
+
+    The run fails if any artifact failed to render in the background, as the
+    scenarios that submitted them have already passed.
+
+    Args:
+        context (Context):
+            The current test context.
+
+    Raises:
+        RuntimeError:
+            Error raised when any artifact failed to render.
+    """
+    n_failed = context.artifacts.close()
+    if n_failed > 0:
+        raise RuntimeError(f"{n_failed} artifacts failed to render.")
+
+
 def before_feature(context: Context, feature: Feature) -> None:
     """
     Before feature environmental control.
@@ -24,7 +85,8 @@ def before_feature(context: Context, feature: Feature) -> None:
         feature (Feature):
             The current test feature.
     """
-    context.traces = {}
+    context.traces = TraceRegistry(context.settings.trace_registry_size)
+    context.elpd = {}
 
 
 def after_feature(context: Context, feature: Feature) -> None:
@@ -37,7 +99,10 @@ def after_feature(context: Context, feature: Feature) -> None:
         feature (Feature):
             The current test feature.
     """
+    stats = context.traces.clear()
+    logger.info(f"Trace registry statistics for {feature.name}: {stats}")
     context.traces = None
+    context.elpd = None
 
 
 def before_scenario(context: Context, scenario: Scenario) -> None:
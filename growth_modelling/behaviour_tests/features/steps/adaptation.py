@@ -0,0 +1,322 @@
+######################################
+# Imports
+######################################
+
+# External
+import arviz as az
+import json
+import logging
+import numpy as np
+import os
+from os.path import join as join_path
+from pathlib import Path
+import pymc as pm
+from pymc.blocking import DictToArrayBijection, RaveledVars
+from pymc.exceptions import SamplingError
+from pymc.pytensorf import floatX
+from pymc.step_methods.hmc.integration import CpuLeapfrogIntegrator
+from pymc.step_methods.hmc.quadpotential import QuadPotentialDiagAdapt
+from pymc.step_methods.step_sizes import DualAverageAdaptation
+
+######################################
+# Constants
+######################################
+
+# The PyMC defaults for NUTS step size adaptation.
+STEP_SCALE = 0.25
+DUAL_AVERAGING_KWARGS = {"gamma": 0.05, "k": 0.75, "t0": 10}
+# The number of tuning samples that the initial mass matrix of PyMC is worth.
+DEFAULT_WEIGHT = 10
+# The number of tuning samples that a reused mass matrix is worth.
+REUSED_WEIGHT = 100
+# Fall back to full tuning if the mean acceptance rate is this far below the target.
+ACCEPTANCE_TOLERANCE = 0.1
+
+logger = logging.getLogger(__name__)
+
+######################################
+# Functions
+######################################
+
+
+def get_n_parameters(step: pm.NUTS) -> int:
+    """
+    Get the number of unconstrained parameters sampled by a NUTS step method.
+
+    Args:
+        step (pm.NUTS):
+            The NUTS step method.
+
+    Returns:
+        int:
+            The number of parameters.
+    """
+    initial_point = step._model.initial_point()
+    return sum(initial_point[value_var.name].size for value_var in step.vars)
+
+
+def get_adaptation_state(trace: az.InferenceData, step: pm.NUTS) -> dict:
+    """
+    Get the adapted NUTS step size and diagonal mass matrix from a trace.
+
+    The mass matrix is estimated from the draws in the unconstrained space, so
+    the trace must include the transformed variables.
+
+    Args:
+        trace (az.InferenceData):
+            The model trace, including transformed variables.
+        step (pm.NUTS):
+            The NUTS step method.
+
+    Returns:
+        dict:
+            The adaptation state.
+    """
+    posterior = trace.posterior
+    means = []
+    variances = []
+    for value_var in step.vars:
+        draws = posterior[value_var.name].values
+        draws = draws.reshape(draws.shape[0] * draws.shape[1], -1)
+        means.append(draws.mean(axis=0))
+        variances.append(draws.var(axis=0))
+
+    sample_stats = trace.sample_stats
+    return {
+        "step_size": float(sample_stats["step_size"].values[:, -1].mean()),
+        "mean": np.concatenate(means).tolist(),
+        "variance": np.concatenate(variances).tolist(),
+        "divergence_rate": float(sample_stats["diverging"].values.mean()),
+    }
+
+
+def set_adaptation_state(step: pm.NUTS, state: dict | None = None) -> None:
+    """
+    Set the initial NUTS step size and diagonal mass matrix before tuning.
+
+    Args:
+        step (pm.NUTS):
+            The NUTS step method.
+        state (dict | None, optional):
+            The adaptation state. Reset to the PyMC defaults if None. Defaults to None.
+    """
+    size = get_n_parameters(step)
+    if state is None:
+        step_size = STEP_SCALE / size**0.25
+        mean = floatX(np.zeros(size))
+        variance = floatX(np.ones(size))
+        weight = DEFAULT_WEIGHT
+    else:
+        step_size = state["step_size"]
+        mean = floatX(np.array(state["mean"]))
+        variance = floatX(np.array(state["variance"]))
+        weight = REUSED_WEIGHT
+
+    step.step_size = step_size
+    step.step_adapt = DualAverageAdaptation(
+        step_size, step.target_accept, **DUAL_AVERAGING_KWARGS
+    )
+    step.potential = QuadPotentialDiagAdapt(size, mean, variance, weight)
+    # The integrator holds its own reference to the potential.
+    step.integrator = CpuLeapfrogIntegrator(step.potential, step._logp_dlogp_func)
+
+
+def get_adapted_initial_points(
+    step: pm.NUTS,
+    state: dict,
+    chains: int,
+    random_seed: int,
+    jitter_max_retries: int = 10,
+) -> list[dict]:
+    """
+    Get initial points for each MCMC chain from a reused adaptation state.
+
+    Initial points are drawn from a normal approximation of the posterior in the
+    unconstrained space, such that chains start in the typical set and need
+    little burn-in.
+
+    Args:
+        step (pm.NUTS):
+            The NUTS step method.
+        state (dict):
+            The adaptation state.
+        chains (int):
+            The number of MCMC chains.
+        random_seed (int):
+            The random seed.
+        jitter_max_retries (int, optional):
+            The maximum number of attempts to find a valid initial point. Defaults to 10.
+
+    Returns:
+        list[dict]:
+            The initial points for each chain.
+    """
+    rng = np.random.default_rng(random_seed)
+    initial_point = step._model.initial_point()
+    point_map_info = DictToArrayBijection.map(
+        {value_var.name: initial_point[value_var.name] for value_var in step.vars}
+    ).point_map_info
+
+    mean = np.array(state["mean"])
+    sd = np.sqrt(state["variance"])
+    initial_points = []
+    for _ in range(chains):
+        for _ in range(jitter_max_retries + 1):
+            q = floatX(mean + sd * rng.standard_normal(len(mean)))
+            point = DictToArrayBijection.rmap(RaveledVars(q, point_map_info))
+            try:
+                step._model.check_start_vals(point)
+            except SamplingError:
+                continue
+            break
+        initial_points.append(point)
+
+    return initial_points
+
+
+def is_adapted(trace: az.InferenceData, target_accept: float, state: dict) -> bool:
+    """
+    Check whether a short tuning period was long enough.
+
+    Args:
+        trace (az.InferenceData):
+            The model trace.
+        target_accept (float):
+            The target acceptance probability.
+        state (dict):
+            The reused adaptation state.
+
+    Returns:
+        bool:
+            Whether the trace has no more divergences than the run the state came
+            from, and an acceptance rate close to the target.
+    """
+    sample_stats = trace.sample_stats
+    divergence_rate = sample_stats["diverging"].values.mean()
+    acceptance_rate = sample_stats["acceptance_rate"].values.mean()
+    return (
+        divergence_rate <= state["divergence_rate"]
+        and acceptance_rate >= target_accept - ACCEPTANCE_TOLERANCE
+    )
+
+
+def get_transformed_names(model: pm.Model) -> list[str]:
+    """
+    Get the names of the transformed model variables.
+
+    Args:
+        model (pm.Model):
+            The PyMC model.
+
+    Returns:
+        list[str]:
+            The transformed variable names.
+    """
+    return [
+        value_var.name
+        for rv, value_var in model.rvs_to_values.items()
+        if value_var.name != rv.name
+    ]
+
+
+def drop_transformed(trace: az.InferenceData, model: pm.Model) -> az.InferenceData:
+    """
+    Drop the transformed variables from the posterior of a trace.
+
+    Args:
+        trace (az.InferenceData):
+            The model trace.
+        model (pm.Model):
+            The PyMC model.
+
+    Returns:
+        az.InferenceData:
+            The model trace.
+    """
+    transformed = [
+        name for name in get_transformed_names(model) if name in trace.posterior
+    ]
+    trace.posterior = trace.posterior.drop_vars(transformed)
+    return trace
+
+
+######################################
+# Classes
+######################################
+
+
+class AdaptationCache:
+    """On-disk cache for tuned NUTS step sizes and mass matrices."""
+
+    def __init__(self, cache_dir: str, enabled: bool = True) -> None:
+        """
+        The adaptation cache constructor.
+
+        Args:
+            cache_dir (str):
+                The cache directory.
+            enabled (bool, optional):
+                Enable the adaptation cache. Defaults to True.
+        """
+        self.cache_dir = cache_dir
+        self.enabled = enabled
+
+    def get_path(self, key: str) -> str:
+        """
+        Get the cache file path for an adaptation state.
+
+        Args:
+            key (str):
+                The model structure and data hash.
+
+        Returns:
+            str:
+                The cache file path.
+        """
+        return join_path(self.cache_dir, f"{key}.json")
+
+    def load(self, key: str) -> dict | None:
+        """
+        Load an adaptation state from the cache.
+
+        Args:
+            key (str):
+                The model structure and data hash.
+
+        Returns:
+            dict | None:
+                The adaptation state, or None on a cache miss.
+        """
+        path = self.get_path(key)
+        if not self.enabled or not os.path.exists(path):
+            return None
+
+        with open(path) as f:
+            state = json.load(f)
+        logger.info(f"Loaded adaptation {key} from the adaptation cache.")
+        return state
+
+    def save(self, key: str, state: dict) -> str | None:
+        """
+        Save an adaptation state to the cache.
+
+        Args:
+            key (str):
+                The model structure and data hash.
+            state (dict):
+                The adaptation state.
+
+        Returns:
+            str | None:
+                The cache file path, or None if the cache is disabled.
+        """
+        if not self.enabled:
+            return None
+
+        Path(self.cache_dir).mkdir(parents=True, exist_ok=True)
+        path = self.get_path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
+        return path
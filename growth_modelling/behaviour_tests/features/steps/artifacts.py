@@ -0,0 +1,135 @@
+######################################
+# Imports
+######################################
+
+# External
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+import logging
+from matplotlib import pyplot as plt
+import multiprocessing
+from typing import Callable
+
+######################################
+# Constants
+######################################
+
+logger = logging.getLogger(__name__)
+
+######################################
+# Functions
+######################################
+
+
+def render_artifact(func: Callable, *args, **kwargs) -> None:
+    """
+    Render an artifact, then check that no figures were left open.
+
+    Figures left open are kept in the global state of pyplot, such that
+    memory grows with every artifact rendered by the same process.
+
+    Args:
+        func (Callable):
+            The rendering function.
+        *args:
+            The positional arguments of the rendering function.
+        **kwargs:
+            The keyword arguments of the rendering function.
+
+    Raises:
+        RuntimeError:
+            Error raised when the rendering function left figures open.
+    """
+    func(*args, **kwargs)
+
+    n_figures = len(plt.get_fignums())
+    if n_figures > 0:
+        plt.close("all")
+        raise RuntimeError(f"{n_figures} figures left open by {func.__name__}.")
+
+
+######################################
+# Classes
+######################################
+
+
+class ArtifactRenderer:
+    """Renders plots and other artifacts in a background process pool."""
+
+    def __init__(self, n_workers: int = 2, enabled: bool = True) -> None:
+        """
+        The artifact renderer constructor.
+
+        Args:
+            n_workers (int, optional):
+                The number of worker processes. Artifacts are rendered
+                synchronously if 0. Defaults to 2.
+            enabled (bool, optional):
+                Render artifacts. Defaults to True.
+        """
+        self.n_workers = n_workers
+        self.enabled = enabled
+        self.pool: ProcessPoolExecutor | None = None
+        self.futures: list[Future] = []
+
+    def submit(self, func: Callable, *args, **kwargs) -> None:
+        """
+        Submit an artifact rendering function.
+
+        Rendering fails if the function leaves figures open.
+
+        Args:
+            func (Callable):
+                The rendering function. Must be a module-level function.
+            *args:
+                The positional arguments of the rendering function.
+            **kwargs:
+                The keyword arguments of the rendering function.
+        """
+        if not self.enabled:
+            return
+
+        if self.n_workers == 0:
+            render_artifact(func, *args, **kwargs)
+            return
+
+        if self.pool is None:
+            # Workers are forked, as the step modules are only importable while behave loads them.
+            self.pool = ProcessPoolExecutor(
+                max_workers=self.n_workers,
+                mp_context=multiprocessing.get_context("fork"),
+            )
+        self.futures.append(self.pool.submit(render_artifact, func, *args, **kwargs))
+
+    def wait(self) -> int:
+        """
+        Wait for all submitted artifacts to be rendered.
+
+        Returns:
+            int:
+                The number of artifacts that failed to render.
+        """
+        wait(self.futures)
+
+        n_failed = 0
+        for future in self.futures:
+            exception = future.exception()
+            if exception is not None:
+                logger.error(f"Failed to render artifact: {exception!r}")
+                n_failed += 1
+
+        self.futures = []
+        return n_failed
+
+    def close(self) -> int:
+        """
+        Wait for all submitted artifacts to be rendered, then shut down the process pool.
+
+        Returns:
+            int:
+                The number of artifacts that failed to render.
+        """
+        n_failed = self.wait()
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+        return n_failed
@@ -0,0 +1,116 @@
+######################################
+# Imports
+######################################
+
+# External
+import arviz as az
+from parse import compile as compile_pattern
+import pandas as pd
+import xarray as xr
+
+# Internal
+from online_diagnostics import ONLINE_DIAGNOSTICS
+from utils import parse_comparison, snake_case_string
+
+######################################
+# Constants
+######################################
+
+DIAGNOSTIC_STEP = 'we expect our "{diag_longname}" ("{diagnostic:SnakeCaseString}") diagnostics to all be "{comparison:QueryComparison}" "{diag_baseline:f}"'
+DIAGNOSTIC_PATTERN = compile_pattern(
+    DIAGNOSTIC_STEP,
+    extra_types={
+        "SnakeCaseString": snake_case_string,
+        "QueryComparison": parse_comparison,
+    },
+)
+
+######################################
+# Functions
+######################################
+
+
+def get_convergence_criteria(steps: list) -> list[dict]:
+    """
+    Get the convergence criteria declared by the diagnostic steps of a scenario.
+
+    Args:
+        steps (list):
+            The scenario steps.
+
+    Returns:
+        list[dict]:
+            The diagnostic, comparison operator, and baseline of each criterion.
+    """
+    criteria = []
+    for step in steps:
+        match = DIAGNOSTIC_PATTERN.parse(step.name)
+        if match is None:
+            continue
+        criteria.append(
+            {
+                "diagnostic": match["diagnostic"],
+                "comparison": match["comparison"],
+                "baseline": match["diag_baseline"],
+            }
+        )
+    return criteria
+
+
+def get_diagnostic_column(diagnostic: str, diagnostics_df: pd.DataFrame) -> str:
+    """
+    Get the column of a diagnostic, which may be the online counterpart of an ArviZ diagnostic.
+
+    Args:
+        diagnostic (str):
+            The diagnostic name.
+        diagnostics_df (pd.DataFrame):
+            The diagnostics of each parameter.
+
+    Returns:
+        str:
+            The diagnostic column.
+    """
+    if diagnostic in diagnostics_df.columns:
+        return diagnostic
+    return ONLINE_DIAGNOSTICS.get(diagnostic, diagnostic)
+
+
+def is_converged(
+    posterior: xr.Dataset,
+    criteria: list[dict],
+    diagnostics_df: pd.DataFrame | None = None,
+) -> bool:
+    """
+    Check whether the diagnostics of every posterior variable satisfy the convergence criteria.
+
+    Criteria on ArviZ diagnostics are checked against their online counterparts
+    when online diagnostics are given.
+
+    Args:
+        posterior (xr.Dataset):
+            The posterior draws.
+        criteria (list[dict]):
+            The convergence criteria.
+        diagnostics_df (pd.DataFrame | None, optional):
+            The online diagnostics of each parameter. Defaults to the ArviZ
+            diagnostics of the posterior.
+
+    Returns:
+        bool:
+            Whether all convergence criteria are satisfied.
+    """
+    if diagnostics_df is None:
+        diagnostics_df = az.summary(posterior, kind="diagnostics")
+    n_rows = diagnostics_df.shape[0]
+
+    for criterion in criteria:
+        baseline = criterion["baseline"]
+        diagnostic = get_diagnostic_column(criterion["diagnostic"], diagnostics_df)
+        filtered_df = diagnostics_df.query(
+            f"{diagnostic} {criterion['comparison']} @baseline"
+        )
+        if filtered_df.shape[0] != n_rows:
+            return False
+
+    return True
@@ -18,6 +18,9 @@ import yaml
 class BaseDataModel(ABC):
     """Abstract class for data models."""
 
+    # Fields that are left out of the dictionary while they keep their default values.
+    optional_fields: list[str] = []
+
     def to_dict(self) -> dict:
         """
         Convert data model to dictionary.
@@ -26,7 +29,12 @@ class BaseDataModel(ABC):
             dict: The dictionary of the data model.
         """
         clone_obj = deepcopy(self)
-        return vars(clone_obj)
+        model_dict = vars(clone_obj)
+        defaults = vars(type(self)())
+        for k in self.optional_fields:
+            if model_dict.get(k) == defaults[k]:
+                model_dict.pop(k, None)
+        return model_dict
 
     def to_yaml(
         self, out_dir: str, outfile: str = "meta.yaml", default_flow_style: bool = False
@@ -59,12 +67,32 @@ class BaseDataModel(ABC):
 class BayesianModel(BaseDataModel):
     """Class for Bayesian Model parameters."""
 
+    optional_fields = [
+        "approximate",
+        "n_iterations",
+        "early_stopping",
+        "n_block_draws",
+        "max_draws",
+        "convergence_criteria",
+        "n_draws_used",
+        "random_intercepts",
+        "group_priors",
+        "partial_pooling",
+    ]
+
     def __init__(self) -> None:
         self.model_type: str = "linear"
         self.likelihood: str = "gaussian"
         self.sampler_longname: str = "No U-Turn Sampler"
         self.sampler: str = "nuts"
+        self.approximate: bool = False
+        self.n_iterations: int = 20000
         self.n_draws: int = 2000
+        self.early_stopping: bool = False
+        self.n_block_draws: int = 500
+        self.max_draws: int = 10000
+        self.convergence_criteria: list[dict] = []
+        self.n_draws_used: int | None = None
         self.n_burn: int = 1000
         self.acceptance_prob: float = 0.8
         self.n_chains: int = 1
@@ -73,6 +101,9 @@ class BayesianModel(BaseDataModel):
         self.priors: dict = {}
         self.factors: list[str] = []
         self.parameter_factors: dict[str] = {}
+        self.random_intercepts: str = "separate"
+        self.group_priors: dict = {}
+        self.partial_pooling: bool = False
         self.metric_longname: str = "Expected log pointwise predictive density"
         self.metric: str = "elpd"
         self.method_longname: str = "Pareto smoothed importance sampling leave-one-out cross-validation"
@@ -83,6 +114,8 @@ class BayesianModel(BaseDataModel):
 class FisheriesModel(BaseDataModel):
     """Class for Fisheries Model parameters."""
 
+    optional_fields = ["groups"]
+
     def __init__(self) -> None:
         self.class_type: str = "chondrichthyes"
         self.order: str = "carcharhiniformes"
@@ -99,6 +132,7 @@ class FisheriesModel(BaseDataModel):
         self.growth_curve: str = "linear"
         self.growth_curve_longname: str = "linear"
         self.parameters: dict[str] = {}
+        self.groups: list[dict] = []
 
 @dataclass
 class ExperimentModel(BaseDataModel):
@@ -132,7 +166,55 @@ class BehaviourTestModel(BaseDataModel):
         clone_obj = deepcopy(self)
         model_dict = vars(clone_obj)
         for k in model_dict:
-            if not hasattr(model_dict[k], "__dict__"):
-                continue
-            model_dict[k] = vars(model_dict[k])
+            if isinstance(model_dict[k], BaseDataModel):
+                model_dict[k] = model_dict[k].to_dict()
+            elif hasattr(model_dict[k], "__dict__"):
+                model_dict[k] = vars(model_dict[k])
         return model_dict
+
+
+@dataclass
+class RunSettings(BaseDataModel):
+    """Class for behaviour test run settings."""
+
+    def __init__(self) -> None:
+        self.cache_dir: str = ".cache"
+        self.trace_cache: bool = True
+        self.trace_cache_size: int = 2 * 1024**3
+        self.trace_float32: bool = False
+        self.trace_registry_size: int = 1024**3
+        self.refit: bool = False
+        self.model_registry: bool = True
+        self.adaptation_cache: bool = True
+        self.elpd_cache: bool = True
+        self.adaptation_burn: int = 200
+        self.plot_workers: int = 2
+        self.diagnostics_only: bool = False
+        self.log_likelihood_dtype: str = "float64"
+        self.log_likelihood_on_disk: bool = False
+        self.online_diagnostics: bool = False
+        self.diagnostics_block_size: int = 100
+
+    def update(self, userdata: dict) -> "RunSettings":
+        """
+        Override the run settings using behave user data.
+
+        Args:
+            userdata (dict):
+                The behave user data, as set with "-D key=value".
+
+        Returns:
+            RunSettings:
+                The updated run settings.
+        """
+        for k, default in vars(self).items():
+            if k not in userdata:
+                continue
+
+            value = userdata[k]
+            if isinstance(default, bool) and isinstance(value, str):
+                value = value.strip().lower() in ["true", "yes", "on", "1"]
+            elif default is not None:
+                value = type(default)(value)
+            setattr(self, k, value)
+        return self
@@ -0,0 +1,174 @@
+######################################
+# Imports
+######################################
+
+# External
+import arviz as az
+import json
+import logging
+import numpy as np
+import os
+from os.path import join as join_path
+from pathlib import Path
+import xarray as xr
+
+######################################
+# Constants
+######################################
+
+logger = logging.getLogger(__name__)
+
+######################################
+# Functions
+######################################
+
+
+def elpd_to_dict(elpd: az.ELPDData) -> dict:
+    """
+    Convert an ELPD estimate to a JSON serialisable dictionary.
+
+    Args:
+        elpd (az.ELPDData):
+            The ELPD estimate.
+
+    Returns:
+        dict:
+            The estimates, with pointwise values as xarray dictionaries.
+    """
+    elpd_dict = {}
+    for k, value in elpd.items():
+        if isinstance(value, xr.DataArray):
+            value = {"pointwise": value.to_dict()}
+        elif isinstance(value, np.generic):
+            value = value.item()
+        elpd_dict[k] = value
+    return elpd_dict
+
+
+def elpd_from_dict(elpd_dict: dict) -> az.ELPDData:
+    """
+    Convert a dictionary to an ELPD estimate.
+
+    Args:
+        elpd_dict (dict):
+            The estimates, with pointwise values as xarray dictionaries.
+
+    Returns:
+        az.ELPDData:
+            The ELPD estimate.
+    """
+    values = []
+    for value in elpd_dict.values():
+        if isinstance(value, dict):
+            value = xr.DataArray.from_dict(value["pointwise"])
+        values.append(value)
+    return az.ELPDData(data=values, index=list(elpd_dict))
+
+
+######################################
+# Classes
+######################################
+
+
+class ElpdCache:
+    """On-disk cache for the ELPD estimates of model traces."""
+
+    def __init__(self, cache_dir: str, enabled: bool = True) -> None:
+        """
+        The ELPD cache constructor.
+
+        Args:
+            cache_dir (str):
+                The cache directory.
+            enabled (bool, optional):
+                Enable the ELPD cache. Defaults to True.
+        """
+        self.cache_dir = cache_dir
+        self.enabled = enabled
+
+    def get_path(self, trace_key: str) -> str:
+        """
+        Get the cache file path for the ELPD estimates of a trace.
+
+        Args:
+            trace_key (str):
+                The trace dictionary key.
+
+        Returns:
+            str:
+                The cache file path.
+        """
+        return join_path(self.cache_dir, f"{trace_key}.json")
+
+    def load(self, trace_key: str, digest: str, method: str) -> az.ELPDData | None:
+        """
+        Load the ELPD estimate of a trace from the cache.
+
+        Args:
+            trace_key (str):
+                The trace dictionary key.
+            digest (str):
+                The content hash of the pointwise log-likelihood.
+            method (str):
+                The information criterion.
+
+        Returns:
+            az.ELPDData | None:
+                The ELPD estimate, or None on a cache miss.
+        """
+        path = self.get_path(trace_key)
+        if not self.enabled or not os.path.exists(path):
+            return None
+
+        with open(path) as f:
+            entries = json.load(f)
+
+        # The trace has been refitted since if its log-likelihood has changed.
+        if entries.get("digest") != digest or method not in entries["elpd"]:
+            return None
+
+        logger.info(f"Loaded the {method} estimate of {trace_key} from the ELPD cache.")
+        return elpd_from_dict(entries["elpd"][method])
+
+    def save(
+        self, trace_key: str, digest: str, method: str, elpd: az.ELPDData
+    ) -> str | None:
+        """
+        Save the ELPD estimate of a trace to the cache.
+
+        Estimates of other information criteria are kept if the
+        log-likelihood is unchanged.
+
+        Args:
+            trace_key (str):
+                The trace dictionary key.
+            digest (str):
+                The content hash of the pointwise log-likelihood.
+            method (str):
+                The information criterion.
+            elpd (az.ELPDData):
+                The ELPD estimate.
+
+        Returns:
+            str | None:
+                The cache file path, or None if the cache is disabled.
+        """
+        if not self.enabled:
+            return None
+
+        Path(self.cache_dir).mkdir(parents=True, exist_ok=True)
+        path = self.get_path(trace_key)
+
+        entries = {"digest": digest, "elpd": {}}
+        if os.path.exists(path):
+            with open(path) as f:
+                cached = json.load(f)
+            if cached.get("digest") == digest:
+                entries = cached
+
+        entries["elpd"][method] = elpd_to_dict(elpd)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(entries, f)
+        os.replace(tmp_path, path)
+        return path
@@ -0,0 +1,337 @@
+######################################
+# Imports
+######################################
+
+# External
+import arviz as az
+import numpy as np
+import pandas as pd
+import pymc as pm
+import xarray as xr
+
+# Internal
+from utils import compact_df, get_df, get_dir_path, growth_func_map
+
+######################################
+# Constants
+######################################
+
+BOUND_KEYS = ["lower", "upper"]
+
+######################################
+# Functions
+######################################
+
+
+def get_group_name(species: str, sex: str) -> str:
+    """
+    Get the name of a species and sex group.
+
+    Args:
+        species (str):
+            The taxonomic species.
+        sex (str):
+            The sex of the animal.
+
+    Returns:
+        str:
+            The group name.
+    """
+    return f"{species}_{sex}"
+
+
+def get_joint_df(
+    data_dir: str,
+    data_file: str,
+    class_type: str,
+    order: str,
+    groups: list[dict],
+    response_var: str,
+    explanatory_var: str,
+    columns: list[str] | None = None,
+) -> pd.DataFrame:
+    """
+    Get the combined input dataframe for all species and sex groups.
+
+    Args:
+        data_dir (str):
+            The base input data directory.
+        data_file (str):
+            The input data file.
+        class_type (str):
+            The taxonomic class.
+        order (str):
+            The taxonomic order.
+        groups (list[dict]):
+            The species, sex, locations, and years of each group.
+        response_var (str):
+            The model response variable.
+        explanatory_var (str):
+            The model explanatory variable.
+        columns (list[str] | None, optional):
+            The columns to keep. Defaults to all columns.
+
+    Returns:
+        pd.DataFrame:
+            The combined input dataframe, with a group column.
+    """
+    dfs = []
+    for group in groups:
+        group_dir = get_dir_path(data_dir, class_type, order, group["species"])
+        df = get_df(
+            group_dir,
+            data_file,
+            group["years"],
+            group["sex"],
+            group["locations"],
+            response_var,
+            explanatory_var,
+            columns,
+        )
+        df["group"] = get_group_name(group["species"], group["sex"])
+        dfs.append(df)
+
+    # Categorical columns with different categories are concatenated as objects.
+    return compact_df(pd.concat(dfs, ignore_index=True))
+
+
+def get_joint_factors(
+    df: pd.DataFrame, factors: list[str]
+) -> tuple[dict, dict, dict[pd.DataFrame]]:
+    """
+    Factorize random intercept factors within each group.
+
+    Factor levels are not shared between groups, such that each group has
+    its own random intercepts.
+
+    Args:
+        df (pd.DataFrame):
+            The combined input dataframe.
+        factors (list[str]):
+            The model factors.
+
+    Returns:
+        tuple[dict, dict, dict[pd.DataFrame]]:
+            The factor level indices, the factor level labels, and the
+            group and original value of each factor level.
+    """
+    factor_idx = {}
+    coords = {}
+    factor_levels = {}
+
+    for col in factors:
+        levels = pd.MultiIndex.from_frame(df[["group", col]])
+        factor_idx[col], uniques = levels.factorize()
+        factor_levels[col] = uniques.to_frame(index=False, name=["group", "value"])
+        # Levels of categorical factors are their values.
+        factor_levels[col]["value"] = np.asarray(factor_levels[col]["value"])
+        coords[col] = [f"{group}:{value}" for group, value in uniques]
+
+    return factor_idx, coords, factor_levels
+
+
+def get_prior_bounds(k: str, group_priors: dict) -> dict:
+    """
+    Get the bounds of a parameter prior, which must be shared by all groups.
+
+    Args:
+        k (str):
+            The parameter name.
+        group_priors (dict):
+            The model priors for each group.
+
+    Raises:
+        ValueError:
+            Error raised when groups have different prior bounds.
+
+    Returns:
+        dict:
+            The prior bounds.
+    """
+    bounds = None
+    for group, priors in group_priors.items():
+        prior = priors[k]
+        group_bounds = {key: prior[key] for key in BOUND_KEYS if key in prior}
+        if bounds is not None and group_bounds != bounds:
+            raise ValueError(
+                f"The {k} prior bounds of {group} differ from other groups: {group_bounds}."
+            )
+        bounds = group_bounds
+
+    return bounds
+
+
+def fit_joint_nonlinear_model(
+    model: pm.Model,
+    group_priors: dict,
+    x,
+    y,
+    resp: str,
+    likelihood: str,
+    group_idx,
+    growth_curve: str = "",
+    factor_data: dict[pm.MutableData] = {},
+    factor_levels: dict[pd.DataFrame] = {},
+    parameter_factors: dict[list[str]] = {},
+    partial_pooling: bool = False,
+) -> None:
+    """
+    Fit a nonlinear Bayesian growth model to multiple groups.
+
+    Growth parameters, random intercepts, and the observation error are
+    indexed by group. Without partial pooling, the model is equivalent to
+    fitting each group separately.
+
+    Args:
+        model (pm.Model):
+            The PyMC model.
+        group_priors (dict):
+            The model priors for each group, in group coordinate order.
+        x (np.ndarray):
+            The explanatory variable data.
+        y (np.ndarray):
+            The response variable data.
+        resp (str):
+            The model response.
+        likelihood (str):
+            The model likelihood.
+        group_idx (np.ndarray):
+            The group index of each observation.
+        growth_curve: (str, optional):
+            The nonlinear growth curve. Defaults to "".
+        factor_data: (dict, optional):
+            The factor level data. Defaults to {}.
+        factor_levels (dict[pd.DataFrame], optional):
+            The group of each factor level. Defaults to {}.
+        parameter_factors (dict[list[str]], optional):
+            The map between parameters and factors. Defaults to {}.
+        partial_pooling (bool, optional):
+            Partially pool the growth parameters across groups, through a shared
+            standardised offset from, and scale around, each group's prior mean.
+            Defaults to False.
+    """
+    groups = list(group_priors)
+    group_codes = {group: i for i, group in enumerate(groups)}
+    params = list(group_priors[groups[0]])
+
+    sigma = pm.HalfStudentT("sigma", nu=3, sigma=10, dims="group")
+
+    growth_func = growth_func_map.get(growth_curve, "vbgm")
+    growth_func_kwargs = {"t": x}
+
+    for k in params:
+        prior_mu = np.array([group_priors[group][k]["mu"] for group in groups])
+        prior_sigma = np.array([group_priors[group][k]["sigma"] for group in groups])
+        bounds = get_prior_bounds(k, group_priors)
+
+        mu, sd = prior_mu, prior_sigma
+        if partial_pooling:
+            offset = pm.Normal(f"{k}_offset", mu=0.0, sigma=1.0)
+            scale = pm.HalfNormal(f"{k}_scale", sigma=1.0)
+            mu = prior_mu + offset * prior_sigma
+            sd = scale * prior_sigma
+
+        if len(bounds) > 0:
+            theta = pm.TruncatedNormal(k, mu=mu, sigma=sd, dims="group", **bounds)
+        else:
+            theta = pm.Normal(k, mu=mu, sigma=sd, dims="group")
+        growth_func_kwargs[k] = theta[group_idx]
+
+        for factor in parameter_factors.get(k, []):
+            alpha_name = f"{k}_{factor}_alpha"
+            level_groups = factor_levels[factor]["group"].map(group_codes).values
+            # Non-centered parameterization for random intercepts.
+            mu_a = pm.Normal(f"{alpha_name}_mu", mu=0.0, sigma=prior_sigma, dims="group")
+            sigma_a = pm.HalfStudentT(
+                f"{alpha_name}_sigma", nu=4, sigma=prior_sigma, dims="group"
+            )
+            z_a = pm.Normal(f"{alpha_name}_z", mu=0, sigma=1, dims=factor)
+            alpha = pm.Deterministic(
+                alpha_name,
+                mu_a[level_groups] + z_a * sigma_a[level_groups],
+                dims=factor,
+            )
+
+            indx = factor_data.get(factor)
+            growth_func_kwargs[k] += alpha[indx]
+
+    if likelihood == "student_t":
+        obs = pm.StudentT(
+            resp,
+            nu=3,
+            mu=growth_func(**growth_func_kwargs),
+            sigma=sigma[group_idx],
+            observed=y,
+            dims="obs_id",
+        )
+    else:
+        obs = pm.TruncatedNormal(
+            resp,
+            mu=growth_func(**growth_func_kwargs),
+            sigma=sigma[group_idx],
+            observed=y,
+            lower=0,
+            dims="obs_id",
+        )
+
+
+def split_joint_trace(
+    trace: az.InferenceData,
+    group: str,
+    group_idx: np.ndarray,
+    factor_levels: dict[pd.DataFrame],
+) -> az.InferenceData:
+    """
+    Split the trace of a single group from the trace of a joint model.
+
+    Group variables and observations are selected for the group, and
+    factor levels are relabelled with their original values, such that the
+    trace can be summarised and plotted like a trace fitted to the group alone.
+
+    Args:
+        trace (az.InferenceData):
+            The joint model trace.
+        group (str):
+            The group name.
+        group_idx (np.ndarray):
+            The group index of each observation.
+        factor_levels (dict[pd.DataFrame]):
+            The group and original value of each factor level.
+
+    Returns:
+        az.InferenceData:
+            The group trace.
+    """
+    group_codes = list(trace.posterior.group.values)
+    obs_idx = np.flatnonzero(group_idx == group_codes.index(group))
+
+    level_idx = {}
+    local_codes = {}
+    for col, levels in factor_levels.items():
+        level_idx[col] = np.flatnonzero(levels["group"].values == group)
+        local_codes[col] = np.full(len(levels), -1)
+        local_codes[col][level_idx[col]] = np.arange(len(level_idx[col]))
+
+    def __split_dataset(ds: xr.Dataset) -> xr.Dataset:
+        if "group" in ds.dims:
+            ds = ds.sel(group=group, drop=True)
+
+        if "obs_id" in ds.dims:
+            ds = ds.isel(obs_id=obs_idx).assign_coords(obs_id=np.arange(len(obs_idx)))
+
+        for col, levels in factor_levels.items():
+            if col in ds.dims:
+                values = levels["value"].values[level_idx[col]]
+                ds = ds.isel({col: level_idx[col]}).assign_coords({col: values})
+
+            indx_name = f"{col}_indx"
+            if indx_name in ds:
+                ds[indx_name] = ds[indx_name].copy(data=local_codes[col][ds[indx_name].values])
+
+        if "group_indx" in ds:
+            ds = ds.drop_vars("group_indx")
+
+        return ds
+
+    group_data = {name: __split_dataset(trace[name]) for name in trace.groups()}
+    return az.InferenceData(**group_data)
@@ -0,0 +1,138 @@
+######################################
+# Imports
+######################################
+
+# External
+import json
+import logging
+import pymc as pm
+
+######################################
+# Constants
+######################################
+
+logger = logging.getLogger(__name__)
+
+######################################
+# Functions
+######################################
+
+
+def get_model_structure_key(
+    model_type: str,
+    growth_curve: str,
+    likelihood: str,
+    priors: dict,
+    parameter_factors: dict[list[str]],
+    coords: dict,
+    target_accept: float,
+    random_intercepts: str = "separate",
+    fixed_dims: bool = False,
+) -> str:
+    """
+    Get the registry key for a model, based on its structure.
+
+    Prior means and standard deviations are model data, and are excluded
+    from the key. Prior bounds change the model graph, and are included.
+
+    Args:
+        model_type (str):
+            The model type.
+        growth_curve (str):
+            The nonlinear growth curve.
+        likelihood (str):
+            The model likelihood.
+        priors (dict):
+            The model priors.
+        parameter_factors (dict[list[str]]):
+            The map between parameters and factors.
+        coords (dict):
+            The factor levels for each factor.
+        target_accept (float):
+            The NUTS target acceptance probability.
+        random_intercepts (str, optional):
+            The random intercept construction. Defaults to "separate".
+        fixed_dims (bool, optional):
+            Whether the factor dimensions are fixed, as required by compiled
+            samplers. Defaults to False.
+
+    Returns:
+        str:
+            The model structure key.
+    """
+    prior_structure = {}
+    for k, prior in priors.items():
+        prior_structure[k] = {
+            bound_key: bound
+            for bound_key, bound in prior.items()
+            if bound_key not in ["name", "mu", "sigma"]
+        }
+
+    structure = {
+        "model_type": model_type,
+        "growth_curve": growth_curve,
+        "likelihood": likelihood,
+        "priors": prior_structure,
+        "parameter_factors": parameter_factors,
+        "n_levels": {factor: len(levels) for factor, levels in coords.items()},
+        "target_accept": target_accept,
+        "random_intercepts": random_intercepts,
+        "fixed_dims": fixed_dims,
+    }
+
+    return json.dumps(structure, sort_keys=True, default=str)
+
+
+######################################
+# Classes
+######################################
+
+
+class ModelRegistry:
+    """In-process registry of compiled models and their NUTS step methods or compiled samplers."""
+
+    def __init__(self, enabled: bool = True) -> None:
+        """
+        The model registry constructor.
+
+        Args:
+            enabled (bool, optional):
+                Enable the model registry. Defaults to True.
+        """
+        self.enabled = enabled
+        self.models: dict[str, tuple[pm.Model, pm.NUTS]] = {}
+
+    def get(self, key: str) -> tuple[pm.Model, pm.NUTS] | None:
+        """
+        Get a registered model.
+
+        Args:
+            key (str):
+                The model structure key.
+
+        Returns:
+            tuple[pm.Model, pm.NUTS] | None:
+                The model and its step method, or None if unregistered.
+        """
+        if not self.enabled:
+            return None
+
+        registered = self.models.get(key)
+        if registered is not None:
+            logger.info(f"Reusing compiled model for {key}.")
+        return registered
+
+    def add(self, key: str, model: pm.Model, step: pm.NUTS) -> None:
+        """
+        Register a model.
+
+        Args:
+            key (str):
+                The model structure key.
+            model (pm.Model):
+                The PyMC model.
+            step (pm.NUTS):
+                The compiled NUTS step method, or the model compiled by a compiled sampler.
+        """
+        if self.enabled:
+            self.models[key] = (model, step)
@@ -0,0 +1,396 @@
+######################################
+# Imports
+######################################
+
+# External
+import json
+import logging
+import numpy as np
+import pandas as pd
+
+######################################
+# Constants
+######################################
+
+logger = logging.getLogger(__name__)
+
+# The online counterparts of the ArviZ diagnostics, checked by the early stopping criteria.
+ONLINE_DIAGNOSTICS = {
+    "mcse_mean": "mcse_mean",
+    "mcse_sd": "mcse_sd",
+    "ess_bulk": "ess_batch",
+    "ess_tail": "ess_tail_batch",
+    "r_hat": "r_hat_split",
+}
+
+######################################
+# Functions
+######################################
+
+
+def merge_moments(counts: np.ndarray, means: np.ndarray, m2s: np.ndarray) -> tuple:
+    """
+    Merge the moments of blocks of draws.
+
+    Args:
+        counts (np.ndarray):
+            The number of draws of each block, with shape (block,).
+        means (np.ndarray):
+            The mean of each block, with shape (block, parameter).
+        m2s (np.ndarray):
+            The sum of squared deviations from the mean of each block, with shape (block, parameter).
+
+    Returns:
+        tuple:
+            The number of draws, mean, and sum of squared deviations of the merged blocks.
+    """
+    n = counts.sum()
+    mean = (counts[:, None] * means).sum(axis=0) / n
+    m2 = m2s.sum(axis=0) + (counts[:, None] * (means - mean) ** 2).sum(axis=0)
+    return n, mean, m2
+
+
+def get_batch_ess(block_means: np.ndarray, variance: np.ndarray, block_size: int) -> np.ndarray:
+    """
+    Estimate the effective sample size with the method of batch means.
+
+    Args:
+        block_means (np.ndarray):
+            The mean of each block of each chain, with shape (chain, block, parameter).
+        variance (np.ndarray):
+            The variance of the draws, with shape (parameter,).
+        block_size (int):
+            The number of draws per block.
+
+    Returns:
+        np.ndarray:
+            The effective sample size of each parameter.
+    """
+    n_chains, n_blocks, _ = block_means.shape
+    # The variance of the block means, around the mean of each chain.
+    deviations = block_means - block_means.mean(axis=1, keepdims=True)
+    batch_variance = (deviations**2).sum(axis=(0, 1)) / (n_chains * (n_blocks - 1))
+    asymptotic_variance = block_size * batch_variance
+
+    n_draws = n_chains * n_blocks * block_size
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ess = n_draws * variance / asymptotic_variance
+    return np.where(asymptotic_variance > 0, np.minimum(ess, n_draws), n_draws)
+
+
+######################################
+# Classes
+######################################
+
+
+class QuantileSketch:
+    """
+    Streaming estimates of a quantile of each parameter, with the P-square algorithm.
+
+    Five markers are kept per parameter, and adjusted after every draw, such
+    that the memory does not grow with the number of draws (Jain and Chlamtac, 1985).
+    """
+
+    def __init__(self, prob: float) -> None:
+        """
+        The quantile sketch constructor.
+
+        Args:
+            prob (float):
+                The quantile probability.
+        """
+        self.prob = prob
+        self.initial: list[np.ndarray] = []
+        self.heights: np.ndarray | None = None
+        self.positions: np.ndarray | None = None
+        self.desired: np.ndarray | None = None
+        self.increments = np.array([0, prob / 2, prob, (1 + prob) / 2, 1])[:, None]
+
+    def update(self, values: np.ndarray) -> None:
+        """
+        Add a draw of every parameter.
+
+        Args:
+            values (np.ndarray):
+                The draw, with shape (parameter,).
+        """
+        if self.heights is None:
+            self.initial.append(values)
+            if len(self.initial) == 5:
+                self.heights = np.sort(np.stack(self.initial), axis=0)
+                self.positions = np.tile(np.arange(1.0, 6.0)[:, None], (1, values.size))
+                prob = self.prob
+                desired = np.array([1, 1 + 2 * prob, 1 + 4 * prob, 3 + 2 * prob, 5])
+                self.desired = np.tile(desired[:, None], (1, values.size))
+            return
+
+        heights = self.heights
+        positions = self.positions
+        # Markers above the draw move up by one position.
+        positions[1:4] += values < heights[1:4]
+        positions[4] += 1
+        heights[0] = np.minimum(heights[0], values)
+        heights[4] = np.maximum(heights[4], values)
+        self.desired += self.increments
+
+        for i in range(1, 4):
+            offset = self.desired[i] - positions[i]
+            up = (offset >= 1) & (positions[i + 1] - positions[i] > 1)
+            down = (offset <= -1) & (positions[i - 1] - positions[i] < -1)
+            step = np.where(up, 1.0, np.where(down, -1.0, 0.0))
+
+            above = (heights[i + 1] - heights[i]) / (positions[i + 1] - positions[i])
+            below = (heights[i] - heights[i - 1]) / (positions[i] - positions[i - 1])
+            parabolic = heights[i] + step / (positions[i + 1] - positions[i - 1]) * (
+                (positions[i] - positions[i - 1] + step) * above
+                + (positions[i + 1] - positions[i] - step) * below
+            )
+            linear = heights[i] + step * np.where(step > 0, above, below)
+            is_ordered = (heights[i - 1] < parabolic) & (parabolic < heights[i + 1])
+
+            heights[i] = np.where(is_ordered, parabolic, linear)
+            positions[i] += step
+
+    def get(self) -> np.ndarray:
+        """
+        Get the current quantile estimates.
+
+        Returns:
+            np.ndarray:
+                The quantile of each parameter.
+        """
+        if self.heights is None:
+            return np.quantile(np.stack(self.initial), self.prob, axis=0)
+        return self.heights[2].copy()
+
+
+class OnlineDiagnostics:
+    """
+    Streaming MCMC diagnostics, accumulated per block of draws during sampling.
+
+    Instances are PyMC sampling callbacks. Only the moments of each block of
+    draws, and its proportions of draws in the tails, are kept. The tail
+    quantiles are estimated from all draws so far with quantile sketches. The
+    split R-hat, MCSE, and the ESS by the method of batch means can then be
+    updated without another pass over the draws. These diagnostics are used to
+    monitor sampling and stop it early, while the summary table keeps the
+    rank-normalised ArviZ diagnostics.
+    """
+
+    def __init__(
+        self,
+        block_size: int = 100,
+        metrics_file: str | None = None,
+        tail_prob: float = 0.05,
+        var_names: list[str] | None = None,
+    ) -> None:
+        """
+        The online diagnostics constructor.
+
+        Args:
+            block_size (int, optional):
+                The number of draws per block. Defaults to 100.
+            metrics_file (str | None, optional):
+                The JSON lines file to append the diagnostics of each block to.
+                Defaults to None.
+            tail_prob (float, optional):
+                The tail probability of the quantiles used for the tail ESS.
+                Defaults to 0.05.
+            var_names (list[str] | None, optional):
+                The variables to accumulate. Defaults to every variable recorded
+                in the trace.
+        """
+        self.block_size = block_size
+        self.metrics_file = metrics_file
+        self.tail_prob = tail_prob
+        self.var_names = var_names
+        self.reset()
+
+    def reset(self) -> None:
+        """Discard all accumulated draws, such as before resampling."""
+        self.names: list[str] = []
+        self.buffers: dict[int, list[np.ndarray]] = {}
+        self.blocks: dict[int, list[dict]] = {}
+        self.lower = QuantileSketch(self.tail_prob)
+        self.upper = QuantileSketch(1 - self.tail_prob)
+        self.n_reported = 0
+
+        if self.metrics_file is not None:
+            open(self.metrics_file, "w").close()
+
+    def __call__(self, trace, draw) -> None:
+        """
+        Accumulate a draw. Called by PyMC after every draw of every chain.
+
+        Args:
+            trace (IBaseTrace):
+                The trace of the chain.
+            draw (Draw):
+                The draw.
+        """
+        if draw.tuning:
+            return
+
+        var_names = self.var_names or trace.varnames
+        # The backend has just recorded the draw, with its deterministics.
+        point = {**draw.point, **trace.point(len(trace) - 1)}
+        if not self.names:
+            for name in var_names:
+                value = np.asarray(point[name])
+                if value.ndim == 0:
+                    self.names.append(name)
+                else:
+                    self.names.extend(f"{name}[{i}]" for i in range(value.size))
+
+        values = np.concatenate([np.ravel(point[name]) for name in var_names])
+        buffer = self.buffers.setdefault(draw.chain, [])
+        buffer.append(values)
+        if len(buffer) < self.block_size:
+            return
+
+        self.add_block(draw.chain, np.stack(buffer))
+        buffer.clear()
+
+        n_blocks = min(len(self.blocks.get(chain, [])) for chain in self.buffers)
+        if n_blocks > self.n_reported:
+            self.n_reported = n_blocks
+            self.report()
+
+    def add_block(self, chain: int, block: np.ndarray) -> None:
+        """
+        Add the moments and tail proportions of a block of draws.
+
+        The draws are then discarded.
+
+        Args:
+            chain (int):
+                The chain.
+            block (np.ndarray):
+                The draws, with shape (draw, parameter).
+        """
+        for values in block:
+            self.lower.update(values)
+            self.upper.update(values)
+
+        mean = block.mean(axis=0)
+        deviations = block - mean
+        self.blocks.setdefault(chain, []).append(
+            {
+                "mean": mean,
+                "m2": (deviations**2).sum(axis=0),
+                "m3": (deviations**3).sum(axis=0),
+                "m4": (deviations**4).sum(axis=0),
+                "lower": (block <= self.lower.get()).mean(axis=0),
+                "upper": (block >= self.upper.get()).mean(axis=0),
+            }
+        )
+
+    def get_diagnostics(self) -> pd.DataFrame | None:
+        """
+        Get the current diagnostics of each parameter.
+
+        Only blocks completed by every chain are used. Chains are split in
+        halves of whole blocks.
+
+        Returns:
+            pd.DataFrame | None:
+                The mean, standard deviation, MCSE of the mean and standard
+                deviation, bulk and tail ESS by batch means, and split R-hat of
+                each parameter, or None before every chain has completed two blocks.
+        """
+        chains = sorted(self.blocks)
+        n_blocks = min((len(self.blocks[chain]) for chain in chains), default=0)
+        if n_blocks < 2:
+            return None
+
+        def __stack(k: str) -> np.ndarray:
+            return np.stack(
+                [[block[k] for block in self.blocks[chain][:n_blocks]] for chain in chains]
+            )
+
+        means = __stack("mean")
+        m2s = __stack("m2")
+        counts = np.full(n_blocks, self.block_size)
+
+        half = n_blocks // 2
+        half_means = []
+        half_variances = []
+        for i in range(len(chains)):
+            for blocks in [slice(0, half), slice(half, 2 * half)]:
+                n, mean, m2 = merge_moments(counts[blocks], means[i, blocks], m2s[i, blocks])
+                half_means.append(mean)
+                half_variances.append(m2 / (n - 1))
+
+        n_half = half * self.block_size
+        within = np.mean(half_variances, axis=0)
+        between = n_half * np.var(half_means, axis=0, ddof=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            r_hat = np.sqrt(((n_half - 1) / n_half * within + between / n_half) / within)
+
+        n, mean, m2 = merge_moments(
+            np.tile(counts, len(chains)),
+            means.reshape(-1, means.shape[-1]),
+            m2s.reshape(-1, m2s.shape[-1]),
+        )
+        variance = m2 / (n - 1)
+        ess_batch = get_batch_ess(means, variance, self.block_size)
+
+        ess_tail = []
+        for k in ["lower", "upper"]:
+            proportions = __stack(k)
+            p = proportions.mean(axis=(0, 1))
+            ess_tail.append(get_batch_ess(proportions, p * (1 - p), self.block_size))
+
+        # The squared deviations from the overall mean, from the central moments of each block.
+        shifts = means - mean
+        square_means = m2s / self.block_size + shifts**2
+        fourth_moment = (
+            __stack("m4") + 4 * shifts * __stack("m3") + 6 * shifts**2 * m2s
+            + self.block_size * shifts**4
+        ).sum(axis=(0, 1)) / n
+        square_variance = (fourth_moment - (m2 / n) ** 2) * n / (n - 1)
+        ess_sd = get_batch_ess(square_means, square_variance, self.block_size)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mcse_sd_factor = np.sqrt(np.exp(1) * (1 - 1 / ess_sd) ** (ess_sd - 1) - 1)
+
+        sd = np.sqrt(variance)
+        return pd.DataFrame(
+            {
+                "mean": mean,
+                "sd": sd,
+                "mcse_mean": np.sqrt(variance / ess_batch),
+                "mcse_sd": sd * mcse_sd_factor,
+                "ess_batch": ess_batch,
+                "ess_tail_batch": np.minimum(*ess_tail),
+                "r_hat_split": r_hat,
+            },
+            index=self.names,
+        )
+
+    def report(self) -> dict | None:
+        """
+        Log the worst current diagnostics, and append them to the metrics file.
+
+        Returns:
+            dict | None:
+                The worst current diagnostics, or None before every chain has
+                completed two blocks.
+        """
+        diagnostics_df = self.get_diagnostics()
+        if diagnostics_df is None:
+            return None
+
+        metrics = {
+            "draws": self.n_reported * self.block_size,
+            "max_r_hat_split": float(diagnostics_df["r_hat_split"].max()),
+            "min_ess_batch": float(diagnostics_df["ess_batch"].min()),
+            "min_ess_tail_batch": float(diagnostics_df["ess_tail_batch"].min()),
+            "max_mcse_mean": float(diagnostics_df["mcse_mean"].max()),
+        }
+        logger.info(f"Online diagnostics: {metrics}")
+
+        if self.metrics_file is not None:
+            with open(self.metrics_file, "a") as f:
+                f.write(json.dumps(metrics) + "\n")
+
+        return metrics
@@ -0,0 +1,698 @@
+######################################
+# Imports
+######################################
+
+# External
+import arviz as az
+from arviz.data.base import dict_to_dataset
+from functools import partial
+import logging
+import numpy as np
+import pymc as pm
+from pymc.backends.arviz import find_constants, find_observations
+from pymc.exceptions import SamplingError
+from pymc.initial_point import make_initial_point_fn
+from typing import TYPE_CHECKING
+import xarray as xr
+
+# Internal
+from adaptation import (
+    AdaptationCache,
+    drop_transformed,
+    get_adaptation_state,
+    get_adapted_initial_points,
+    get_n_parameters,
+    get_transformed_names,
+    is_adapted,
+    set_adaptation_state,
+)
+from convergence import is_converged
+from online_diagnostics import OnlineDiagnostics
+
+# nutpie is only imported when a model is compiled, as it loads Numba.
+if TYPE_CHECKING:
+    from nutpie.compile_pymc import CompiledPyMCModel
+
+######################################
+# Constants
+######################################
+
+APPROXIMATE_SAMPLERS = ["advi", "fullrank_advi"]
+# Samplers that compile their own log-density, which requires models with fixed dimensions.
+COMPILED_SAMPLERS = ["nutpie"]
+# The PyMC default of 1e-3 is too slow to converge for the growth model parameter scales.
+ADVI_LEARNING_RATE = 0.01
+
+logger = logging.getLogger(__name__)
+
+######################################
+# Functions
+######################################
+
+
+def add_model_data(trace: az.InferenceData, model: pm.Model) -> az.InferenceData:
+    """
+    Add any missing observed and constant data groups to a trace.
+
+    Args:
+        trace (az.InferenceData):
+            The model trace.
+        model (pm.Model):
+            The PyMC model.
+
+    Returns:
+        az.InferenceData:
+            The model trace.
+    """
+    coords = {k: v for k, v in model.coords.items() if v is not None}
+    dims = {k: list(v) for k, v in model.named_vars_to_dims.items()}
+    groups = {
+        "observed_data": find_observations(model),
+        "constant_data": find_constants(model),
+    }
+
+    for group, data in groups.items():
+        if group in trace.groups() or len(data) == 0:
+            continue
+        dataset = dict_to_dataset(
+            data, library=pm, coords=coords, dims=dims, default_dims=[]
+        )
+        trace.add_groups({group: dataset})
+
+    return trace
+
+
+def sample_pymc_nuts(
+    model: pm.Model,
+    draws: int,
+    tune: int,
+    chains: int,
+    cores: int,
+    target_accept: float,
+    random_seed: int,
+    initvals: list[dict] = None,
+    step: pm.NUTS = None,
+    idata_kwargs: dict = None,
+    callback: OnlineDiagnostics = None,
+) -> az.InferenceData:
+    """
+    Sample from the posterior using the PyMC No U-Turn Sampler.
+
+    Args:
+        model (pm.Model):
+            The PyMC model.
+        draws (int):
+            The number of draws per chain.
+        tune (int):
+            The number of burn-in draws per chain.
+        chains (int):
+            The number of MCMC chains.
+        cores (int):
+            The number of chains to run in parallel.
+        target_accept (float):
+            The target acceptance probability.
+        random_seed (int):
+            The random seed.
+        initvals (list[dict], optional):
+            The initial points for each chain. Defaults to None.
+        step (pm.NUTS, optional):
+            A compiled NUTS step method to reuse. Defaults to None.
+        idata_kwargs (dict, optional):
+            Keyword arguments for the trace conversion. Defaults to None.
+        callback (OnlineDiagnostics, optional):
+            A callback called after every draw of every chain. Defaults to None.
+
+    Returns:
+        az.InferenceData:
+            The model trace.
+    """
+    if step is None:
+        step = pm.NUTS(model=model, target_accept=target_accept)
+
+    trace = pm.sample(
+        step=step,
+        initvals=initvals,
+        draws=draws,
+        tune=tune,
+        chains=chains,
+        cores=cores,
+        model=model,
+        random_seed=random_seed,
+        progressbar=False,
+        idata_kwargs=idata_kwargs,
+        callback=callback,
+    )
+    return trace
+
+
+def sample_adapted_nuts(
+    adaptation_cache: AdaptationCache,
+    key: str,
+    reuse_burn: int,
+    model: pm.Model,
+    draws: int,
+    tune: int,
+    chains: int,
+    cores: int,
+    target_accept: float,
+    random_seed: int,
+    initvals: list[dict] = None,
+    step: pm.NUTS = None,
+    keep_transformed: bool = False,
+    diagnostics: OnlineDiagnostics = None,
+) -> az.InferenceData:
+    """
+    Sample from the posterior using the PyMC No U-Turn Sampler, reusing previous adaptation.
+
+    If an adaptation state has been saved for the model, sampling starts from
+    its step size and mass matrix with a shorter burn-in period. If the short
+    burn-in period results in divergences or poor acceptance, the model is
+    sampled again with the full burn-in period. Only states adapted over the full
+    burn-in period are saved, such that refits reusing a state give the same traces.
+
+    Args:
+        adaptation_cache (AdaptationCache):
+            The adaptation cache.
+        key (str):
+            The model structure and data hash.
+        reuse_burn (int):
+            The number of burn-in draws per chain when reusing adaptation.
+        model (pm.Model):
+            The PyMC model.
+        draws (int):
+            The number of draws per chain.
+        tune (int):
+            The number of burn-in draws per chain.
+        chains (int):
+            The number of MCMC chains.
+        cores (int):
+            The number of chains to run in parallel.
+        target_accept (float):
+            The target acceptance probability.
+        random_seed (int):
+            The random seed.
+        initvals (list[dict], optional):
+            The initial points for each chain. Defaults to None.
+        step (pm.NUTS, optional):
+            A compiled NUTS step method to reuse. Defaults to None.
+        keep_transformed (bool, optional):
+            Keep the transformed variables in the posterior. Defaults to False.
+        diagnostics (OnlineDiagnostics, optional):
+            The online diagnostics to accumulate during sampling. Defaults to None.
+
+    Returns:
+        az.InferenceData:
+            The model trace.
+    """
+    if step is None:
+        step = pm.NUTS(model=model, target_accept=target_accept)
+
+    sample_kwargs = {
+        "model": model,
+        "draws": draws,
+        "chains": chains,
+        "cores": cores,
+        "target_accept": target_accept,
+        "random_seed": random_seed,
+        "initvals": initvals,
+        "step": step,
+        "idata_kwargs": {"include_transformed": True},
+        "callback": diagnostics,
+    }
+
+    trace = None
+    state = adaptation_cache.load(key)
+    if state is not None and len(state["mean"]) != get_n_parameters(step):
+        state = None
+
+    if state is not None and reuse_burn < tune:
+        set_adaptation_state(step, state)
+        try:
+            trace = sample_pymc_nuts(
+                tune=reuse_burn,
+                **{
+                    **sample_kwargs,
+                    "initvals": get_adapted_initial_points(
+                        step, state, chains, random_seed
+                    ),
+                },
+            )
+        except SamplingError:
+            trace = None
+
+        if trace is None or not is_adapted(trace, target_accept, state):
+            logger.warning(
+                f"Reused adaptation for {key} was insufficient. Falling back to full tuning."
+            )
+            trace = None
+
+    if trace is None:
+        if diagnostics is not None:
+            diagnostics.reset()
+        set_adaptation_state(step)
+        trace = sample_pymc_nuts(tune=tune, **sample_kwargs)
+        adaptation_cache.save(key, get_adaptation_state(trace, step))
+
+    if keep_transformed:
+        return trace
+    return drop_transformed(trace, model)
+
+
+def concat_draws(trace: az.InferenceData, block: az.InferenceData) -> az.InferenceData:
+    """
+    Append a block of draws to a trace.
+
+    Args:
+        trace (az.InferenceData):
+            The model trace.
+        block (az.InferenceData):
+            The block of draws, continuing each chain of the trace.
+
+    Returns:
+        az.InferenceData:
+            The model trace.
+    """
+    n_draws = trace.posterior.sizes["draw"]
+    for group in ["posterior", "sample_stats"]:
+        block_ds = block[group]
+        block_ds = block_ds.assign_coords(draw=block_ds.draw + n_draws)
+        combined = xr.concat([trace[group], block_ds], dim="draw")
+        setattr(trace, group, combined.assign_attrs(trace[group].attrs))
+
+    return trace
+
+
+def sample_until_converged(
+    adaptation_cache: AdaptationCache,
+    key: str,
+    reuse_burn: int,
+    criteria: list[dict],
+    max_draws: int,
+    model: pm.Model,
+    draws: int,
+    tune: int,
+    chains: int,
+    cores: int,
+    target_accept: float,
+    random_seed: int,
+    initvals: list[dict] = None,
+    step: pm.NUTS = None,
+    diagnostics: OnlineDiagnostics = None,
+) -> az.InferenceData:
+    """
+    Sample from the posterior in blocks using the PyMC No U-Turn Sampler, until convergence.
+
+    After each block, the criteria are checked against the ArviZ diagnostics
+    of the trace, as asserted by the diagnostic steps. When online diagnostics
+    are accumulated, they are checked first, and the ArviZ diagnostics are only
+    computed once the online diagnostics meet the criteria.
+    Until the criteria are met, each chain is continued from its last draw
+    with the step size and mass matrix adapted during the first block.
+
+    Args:
+        adaptation_cache (AdaptationCache):
+            The adaptation cache.
+        key (str):
+            The model structure and data hash.
+        reuse_burn (int):
+            The number of burn-in draws per chain when reusing adaptation.
+        criteria (list[dict]):
+            The convergence criteria.
+        max_draws (int):
+            The maximum number of draws per chain.
+        model (pm.Model):
+            The PyMC model.
+        draws (int):
+            The number of draws per chain in each block.
+        tune (int):
+            The number of burn-in draws per chain.
+        chains (int):
+            The number of MCMC chains.
+        cores (int):
+            The number of chains to run in parallel.
+        target_accept (float):
+            The target acceptance probability.
+        random_seed (int):
+            The random seed.
+        initvals (list[dict], optional):
+            The initial points for each chain. Defaults to None.
+        step (pm.NUTS, optional):
+            A compiled NUTS step method to reuse. Defaults to None.
+        diagnostics (OnlineDiagnostics, optional):
+            The online diagnostics to accumulate over all blocks. Defaults to None.
+
+    Returns:
+        az.InferenceData:
+            The model trace, with the number of draws per chain recorded in the
+            n_draws_used posterior attribute.
+    """
+    if step is None:
+        step = pm.NUTS(model=model, target_accept=target_accept)
+
+    trace = sample_adapted_nuts(
+        adaptation_cache,
+        key,
+        reuse_burn,
+        model=model,
+        draws=min(draws, max_draws),
+        tune=tune,
+        chains=chains,
+        cores=cores,
+        target_accept=target_accept,
+        random_seed=random_seed,
+        initvals=initvals,
+        step=step,
+        keep_transformed=True,
+        diagnostics=diagnostics,
+    )
+    state = get_adaptation_state(trace, step)
+    transformed = get_transformed_names(model)
+
+    def __is_converged(trace: az.InferenceData) -> bool:
+        posterior = trace.posterior.drop_vars(transformed, errors="ignore")
+        if diagnostics is not None:
+            diagnostics_df = diagnostics.get_diagnostics()
+            if diagnostics_df is not None and not is_converged(
+                posterior, criteria, diagnostics_df
+            ):
+                return False
+        return is_converged(posterior, criteria)
+
+    n_blocks = 1
+    n_draws = trace.posterior.sizes["draw"]
+    converged = __is_converged(trace)
+    while not converged and n_draws < max_draws:
+        last_draws = trace.posterior.isel(draw=-1)
+        block_initvals = [
+            {
+                value_var.name: last_draws[value_var.name].sel(chain=chain).values
+                for value_var in step.vars
+            }
+            for chain in last_draws.chain.values
+        ]
+
+        set_adaptation_state(step, state)
+        block = sample_pymc_nuts(
+            model=model,
+            draws=min(draws, max_draws - n_draws),
+            tune=0,
+            chains=chains,
+            cores=cores,
+            target_accept=target_accept,
+            random_seed=random_seed + n_blocks,
+            initvals=block_initvals,
+            step=step,
+            idata_kwargs={"include_transformed": True},
+            callback=diagnostics,
+        )
+        trace = concat_draws(trace, block)
+
+        n_blocks += 1
+        n_draws = trace.posterior.sizes["draw"]
+        converged = __is_converged(trace)
+
+    if converged:
+        logger.info(f"Converged after {n_draws} draws per chain.")
+    else:
+        logger.warning(f"Not converged after the maximum of {max_draws} draws per chain.")
+
+    trace = drop_transformed(trace, model)
+    trace.posterior.attrs["n_draws_used"] = n_draws
+    return trace
+
+
+def get_prior_median_point(
+    model: pm.Model, random_seed: int, draws: int = 1000
+) -> dict:
+    """
+    Get the prior medians of the free variables of a model, on the unconstrained scale.
+
+    Args:
+        model (pm.Model):
+            The PyMC model.
+        random_seed (int):
+            The random seed.
+        draws (int, optional):
+            The number of prior draws. Defaults to 1000.
+
+    Returns:
+        dict:
+            The prior medians, keyed by value variable name.
+    """
+    prior_draws = pm.draw(model.free_RVs, draws=draws, random_seed=random_seed)
+    overrides = {
+        rv: np.median(rv_draws, axis=0)
+        for rv, rv_draws in zip(model.free_RVs, prior_draws)
+    }
+    ipfn = make_initial_point_fn(
+        model=model, overrides=overrides, jitter_rvs=set(), return_transformed=True
+    )
+    return ipfn(random_seed)
+
+
+def compile_nutpie(model: pm.Model) -> "CompiledPyMCModel":
+    """
+    Compile the log-density of a model for the nutpie No U-Turn Sampler.
+
+    The compiled model can be sampled again with new values for the model
+    data containers, without being recompiled.
+
+    Args:
+        model (pm.Model):
+            The PyMC model, with fixed dimensions.
+
+    Returns:
+        CompiledPyMCModel:
+            The compiled model.
+    """
+    import nutpie
+
+    return nutpie.compile_pymc_model(model)
+
+
+def sample_nutpie(
+    model: pm.Model,
+    draws: int,
+    tune: int,
+    chains: int,
+    cores: int,
+    target_accept: float,
+    random_seed: int,
+    initvals: list[dict] = None,
+    step: "CompiledPyMCModel" = None,
+) -> az.InferenceData:
+    """
+    Sample from the posterior using the nutpie No U-Turn Sampler.
+
+    Args:
+        model (pm.Model):
+            The PyMC model, with fixed dimensions.
+        draws (int):
+            The number of draws per chain.
+        tune (int):
+            The number of burn-in draws per chain.
+        chains (int):
+            The number of MCMC chains.
+        cores (int):
+            The number of chains to run in parallel.
+        target_accept (float):
+            The target acceptance probability.
+        random_seed (int):
+            The random seed.
+        initvals (list[dict], optional):
+            Unused. nutpie jitters the initial point of each chain around the
+            initial point of the model. Defaults to None.
+        step (CompiledPyMCModel, optional):
+            A compiled model to reuse, holding the current model data. Defaults to None.
+
+    Returns:
+        az.InferenceData:
+            The model trace.
+    """
+    import nutpie
+
+    if step is None:
+        step = compile_nutpie(model)
+
+    # nutpie otherwise starts at zero on the unconstrained scale, which for the
+    # biphasic models can leave chains in a mode with a transition before birth.
+    initial_point = get_prior_median_point(model, random_seed)
+    init_mean = np.concatenate(
+        [np.ravel(initial_point[model.rvs_to_values[rv].name]) for rv in model.free_RVs]
+    )
+
+    trace = nutpie.sample(
+        step,
+        init_mean=init_mean,
+        draws=draws,
+        tune=tune,
+        chains=chains,
+        cores=cores,
+        seed=random_seed,
+        target_accept=target_accept,
+        save_warmup=False,
+        progress_bar=False,
+    )
+    trace = drop_transformed(trace, model)
+    return add_model_data(trace, model)
+
+
+def split_chains(trace: az.InferenceData, chains: int, draws: int) -> az.InferenceData:
+    """
+    Split the single chain of independent draws from an approximate posterior into multiple chains.
+
+    The posterior then has the same shape as an MCMC posterior.
+
+    Args:
+        trace (az.InferenceData):
+            The model trace, with a single chain of chains * draws draws.
+        chains (int):
+            The number of chains.
+        draws (int):
+            The number of draws per chain.
+
+    Returns:
+        az.InferenceData:
+            The model trace.
+    """
+    posterior = trace.posterior
+    data_vars = {}
+    for k, da in posterior.data_vars.items():
+        values = da.values.reshape((chains, draws, *da.shape[2:]))
+        coords = {dim: da.coords[dim] for dim in da.dims[2:] if dim in da.coords}
+        coords.update({"chain": range(chains), "draw": range(draws)})
+        data_vars[k] = xr.DataArray(values, dims=da.dims, coords=coords)
+
+    trace.posterior = xr.Dataset(data_vars, attrs=posterior.attrs)
+    return trace
+
+
+def sample_advi(
+    method: str,
+    model: pm.Model,
+    draws: int,
+    tune: int,
+    chains: int,
+    cores: int,
+    target_accept: float,
+    random_seed: int,
+    initvals: list[dict] = None,
+    step: pm.NUTS = None,
+    n_iterations: int = 20000,
+) -> az.InferenceData:
+    """
+    Sample from an automatic differentiation variational inference (ADVI) approximation of the posterior.
+
+    Args:
+        method (str):
+            The ADVI method, either mean-field ("advi") or full-rank ("fullrank_advi").
+        model (pm.Model):
+            The PyMC model.
+        draws (int):
+            The number of draws per chain.
+        tune (int):
+            Unused. ADVI has no burn-in period.
+        chains (int):
+            The number of chains.
+        cores (int):
+            Unused. ADVI is fitted in a single process.
+        target_accept (float):
+            Unused. ADVI has no acceptance probability.
+        random_seed (int):
+            The random seed.
+        initvals (list[dict], optional):
+            The initial points for each chain. The first is the starting point. Defaults to None.
+        step (pm.NUTS, optional):
+            Unused. Defaults to None.
+        n_iterations (int, optional):
+            The maximum number of optimisation iterations. Defaults to 20000.
+
+    Returns:
+        az.InferenceData:
+            The model trace.
+    """
+    approx = pm.fit(
+        n=n_iterations,
+        method=method,
+        model=model,
+        random_seed=random_seed,
+        start=initvals[0] if initvals else None,
+        obj_optimizer=pm.adagrad_window(learning_rate=ADVI_LEARNING_RATE),
+        progressbar=False,
+        callbacks=[pm.callbacks.CheckParametersConvergence(diff="absolute")],
+    )
+    trace = approx.sample(draws=draws * chains, random_seed=random_seed)
+    return add_model_data(split_chains(trace, chains, draws), model)
+
+
+sampler_map = {
+    "nuts": sample_pymc_nuts,
+    "nutpie": sample_nutpie,
+    "advi": partial(sample_advi, "advi"),
+    "fullrank_advi": partial(sample_advi, "fullrank_advi"),
+}
+
+
+def is_approximate(sampler: str) -> bool:
+    """
+    Check whether a sampler draws from an approximation of the posterior.
+
+    Args:
+        sampler (str):
+            The sampler backend.
+
+    Returns:
+        bool:
+            Whether the sampler is approximate.
+    """
+    return sampler in APPROXIMATE_SAMPLERS
+
+
+def is_compiled(sampler: str) -> bool:
+    """
+    Check whether a sampler compiles its own log-density.
+
+    Models sampled by these samplers must have fixed dimensions.
+
+    Args:
+        sampler (str):
+            The sampler backend.
+
+    Returns:
+        bool:
+            Whether the sampler compiles its own log-density.
+    """
+    return sampler in COMPILED_SAMPLERS
+
+
+def sample_model(sampler: str, n_iterations: int = 20000, **kwargs) -> az.InferenceData:
+    """
+    Sample from the posterior using the selected sampler backend.
+
+    Args:
+        sampler (str):
+            The sampler backend.
+        n_iterations (int, optional):
+            The maximum number of optimisation iterations for approximate samplers.
+            Defaults to 20000.
+        **kwargs:
+            The sampler arguments.
+
+    Raises:
+        ValueError:
+            Error raised when the sampler backend is unknown.
+
+    Returns:
+        az.InferenceData:
+            The model trace.
+    """
+    sample_func = sampler_map.get(sampler)
+    if sample_func is None:
+        raise ValueError(
+            f"Unknown sampler: {sampler}. Choose one of: {', '.join(sampler_map)}."
+        )
+
+    if is_approximate(sampler):
+        kwargs["n_iterations"] = n_iterations
+
+    return sample_func(**kwargs)
@@ -7,24 +7,78 @@ import arviz as az
 from behave.runner import Context
 from behave import given, when, then
 from behave import register_type
-from matplotlib import pyplot as plt
+from copy import deepcopy
+from functools import cache
+import hashlib
+from importlib.metadata import PackageNotFoundError, version
+import inspect
+import numpy as np
+import os
 from os.path import join as join_path
+import pandas as pd
 import pymc as pm
 
 # Internal
 from utils import (
+    add_log_likelihood,
+    add_posterior_predictive,
+    add_stacked_random_intercepts,
+    compute_elpd,
+    drop_log_likelihood,
+    fit_linear_model,
     fit_model,
+    fit_nonlinear_model,
     get_dir_path,
     get_df,
+    get_factor_codes,
+    get_initial_points,
+    get_model_data,
+    get_flat_draws,
     get_mu_pp,
+    get_pointwise_log_likelihood,
+    get_predictive_mean,
+    get_predictive_sigma,
+    get_prior_data,
+    get_random_intercepts,
+    get_stacked_factor_params,
+    get_summary,
     get_trace_dict_key,
+    growth_func_map,
+    hash_posterior,
     parse_comparison,
     parse_enabled_disabled,
+    parse_male_female,
     plot_bayes_model,
+    plot_model_scores,
     plot_preds,
+    render_model_graph,
+    sample_truncated_normal,
+    share_summary,
     snake_case_string,
     parse_comma_list,
 )
+from joint_model import (
+    fit_joint_nonlinear_model,
+    get_group_name,
+    get_joint_df,
+    get_joint_factors,
+    get_prior_bounds,
+    split_joint_trace,
+)
+from convergence import DIAGNOSTIC_STEP, get_convergence_criteria
+from data_model import BayesianModel, BehaviourTestModel
+from model_registry import get_model_structure_key
+from online_diagnostics import OnlineDiagnostics
+import samplers
+from samplers import (
+    compile_nutpie,
+    is_approximate,
+    is_compiled,
+    sample_adapted_nuts,
+    sample_model,
+    sample_until_converged,
+)
+from trace_cache import hash_trace_inputs, load_trace, save_trace
 
 ######################################
 # Oracles
@@ -32,6 +86,32 @@ from utils import (
 
 factor_oracle = {"year": "year", "location": "source"}
 
+######################################
+# Constants
+######################################
+
+TRACE_FILE = "trace.nc"
+LOG_LIKELIHOOD_FILE = "log_likelihood.npy"
+DIAGNOSTICS_METRICS_FILE = "diagnostics.jsonl"
+ONLINE_DIAGNOSTICS_FILE = "online_diagnostics.csv"
+# The posterior attribute holding the content hash of a dropped log-likelihood.
+LOG_LIKELIHOOD_DIGEST = "log_likelihood_digest"
+# Run settings that change the traces stored in the trace cache.
+TRACE_SETTINGS = ["trace_float32", "log_likelihood_dtype", "log_likelihood_on_disk"]
+# Bayesian model fields that only change the outputs derived from a trace.
+OUTPUT_FIELDS = [
+    "sampler_longname",
+    "n_draws_used",
+    "hdi_prob",
+    "metric_longname",
+    "metric",
+    "method_longname",
+    "method",
+    "model_weights",
+]
+# Libraries that build, sample, or add to the traces stored in the trace cache.
+TRACE_LIBRARIES = ["arviz", "numpy", "nutpie", "pymc", "pytensor"]
+
 ######################################
 # Types
 ######################################
@@ -76,6 +156,1073 @@ def get_trace_key(context: Context, growth_curve: str = "") -> str:
 
     return trace_key
 
+@cache
+def hash_trace_code() -> str:
+    """
+    Hash the code and library versions that build, sample, or add to the cached traces.
+
+    The source code of every function on the trace path is hashed, such that
+    changes to the models, samplers, or derived trace groups refit every model.
+
+    Returns:
+        str:
+            The content hash.
+    """
+    digest = hashlib.sha256()
+    trace_path = [
+        get_prior_data,
+        get_model_data,
+        get_initial_points,
+        fit_model,
+        fit_linear_model,
+        fit_nonlinear_model,
+        *growth_func_map.values(),
+        get_stacked_factor_params,
+        add_stacked_random_intercepts,
+        get_joint_factors,
+        get_prior_bounds,
+        fit_joint_nonlinear_model,
+        get_registered_model,
+        build_joint_model,
+        samplers,
+        sample_bayesian_model,
+        sample_trace,
+        compute_log_likelihood,
+        store_elpd_on_disk,
+        get_flat_draws,
+        get_random_intercepts,
+        get_predictive_mean,
+        get_predictive_sigma,
+        get_pointwise_log_likelihood,
+        add_log_likelihood,
+        sample_truncated_normal,
+        add_posterior_predictive,
+    ]
+    for func in trace_path:
+        digest.update(inspect.getsource(func).encode())
+
+    for library in TRACE_LIBRARIES:
+        try:
+            library_version = version(library)
+        except PackageNotFoundError:
+            library_version = None
+        digest.update(f"{library}=={library_version}".encode())
+
+    return digest.hexdigest()
+
+def get_sampling_inputs(bayesian_def: BayesianModel) -> dict:
+    """
+    Get the Bayesian model fields that change the sampled trace.
+
+    Args:
+        bayesian_def (BayesianModel):
+            The Bayesian model definition.
+
+    Returns:
+        dict:
+            The Bayesian model fields, without those that only change the
+            outputs derived from a trace.
+    """
+    return {
+        k: v for k, v in bayesian_def.to_dict().items() if k not in OUTPUT_FIELDS
+    }
+
+def get_cache_keys(
+    context: Context, adaptation_key: str, df: pd.DataFrame, *inputs
+) -> list[str]:
+    """
+    Get the trace cache keys of a model fit.
+
+    A fit with full NUTS tuning only depends on the model inputs, the run
+    settings, and the code and library versions that build the trace.
+    A fit reusing the cached NUTS adaptation also depends on the adaptation state
+    and its burn-in period, such that the same seed gives the same trace
+    whatever the cache history.
+
+    Args:
+        context (Context):
+            The test context.
+        adaptation_key (str):
+            The model structure and data hash, used to reuse NUTS adaptation.
+        df (pd.DataFrame):
+            The model data.
+        *inputs:
+            JSON serialisable model inputs, such as priors and sampler settings.
+
+    Returns:
+        list[str]:
+            The key of a fit with full tuning, followed by the key of a fit
+            reusing the cached adaptation if it would be reused.
+    """
+    settings = context.settings
+    bayesian_def = context.behaviour.bayesian
+    run_settings = {k: getattr(settings, k) for k in TRACE_SETTINGS}
+    run_settings["code"] = hash_trace_code()
+    cache_keys = [hash_trace_inputs(df, *inputs, run_settings)]
+
+    if bayesian_def.sampler == "nuts" and settings.adaptation_burn < bayesian_def.n_burn:
+        state = context.adaptation_cache.load(adaptation_key)
+        if state is not None:
+            cache_keys.append(
+                hash_trace_inputs(
+                    df, *inputs, run_settings, settings.adaptation_burn, state
+                )
+            )
+
+    return cache_keys
+
+def load_cached_trace(context: Context, cache_keys: list[str]) -> az.InferenceData | None:
+    """
+    Load a model trace from the trace cache, preferring a fit with full tuning.
+
+    Args:
+        context (Context):
+            The test context.
+        cache_keys (list[str]):
+            The trace cache keys of the model fit.
+
+    Returns:
+        az.InferenceData | None:
+            The cached trace, or None on a cache miss or refit.
+    """
+    if context.settings.refit:
+        return None
+
+    for cache_key in cache_keys:
+        trace = context.trace_cache.load(cache_key)
+        if trace is not None:
+            return trace
+    return None
+
+def save_cached_trace(
+    context: Context, cache_keys: list[str], trace: az.InferenceData
+) -> None:
+    """
+    Save a sampled model trace to the trace cache, under the key of how it was tuned.
+
+    Args:
+        context (Context):
+            The test context.
+        cache_keys (list[str]):
+            The trace cache keys of the model fit.
+        trace (az.InferenceData):
+            The model trace.
+    """
+    tuning_steps = trace.posterior.attrs.get("tuning_steps")
+    if len(cache_keys) > 1 and tuning_steps == context.settings.adaptation_burn:
+        context.trace_cache.save(cache_keys[1], trace)
+    else:
+        context.trace_cache.save(cache_keys[0], trace)
+
+def get_out_dir(context: Context, growth_curve: str | None = None) -> str:
+    """
+    Get the output directory for a model from the test context.
+
+    Args:
+        context (Context):
+            The test context.
+        growth_curve (str | None, optional):
+            The growth curve directory. Defaults to the current growth curve.
+            An empty string returns the output directory for model comparisons.
+
+    Returns:
+        str:
+            The output directory.
+    """
+    bayesian_def = context.behaviour.bayesian
+    fisheries_def = context.behaviour.fisheries
+
+    if growth_curve is None:
+        growth_curve = fisheries_def.growth_curve
+
+    out_dir = join_path(
+        "out",
+        fisheries_def.class_type,
+        fisheries_def.order,
+        fisheries_def.species,
+        fisheries_def.sex,
+        bayesian_def.model_type,
+    )
+
+    if growth_curve != "":
+        out_dir = join_path(out_dir, growth_curve)
+
+    return out_dir
+
+def get_trace(context: Context, growth_curve: str = "") -> az.InferenceData:
+    """
+    Get a model trace from the test context.
+
+    Traces fitted by another process, such as a parallel scenario runner,
+    are loaded from the output directory of the model.
+
+    Args:
+        context (Context):
+            The test context.
+        growth_curve (str, optional):
+            The growth curve dictionary key. Defaults to "".
+
+    Returns:
+        az.InferenceData:
+            The model trace.
+    """
+    trace_key = get_trace_key(context, growth_curve)
+    trace = context.traces.get(trace_key)
+
+    if trace is None:
+        trace_file = join_path(get_out_dir(context, growth_curve or None), TRACE_FILE)
+        trace = store_trace(context, trace_key, load_trace(trace_file), trace_file)
+
+    return trace
+
+
+def store_trace(
+    context: Context,
+    trace_key: str,
+    trace: az.InferenceData,
+    trace_file: str,
+) -> az.InferenceData:
+    """
+    Store a model trace in the test context, along with its ELPD estimate.
+
+    Args:
+        context (Context):
+            The test context.
+        trace_key (str):
+            The trace dictionary key.
+        trace (az.InferenceData):
+            The model trace.
+        trace_file (str):
+            The trace file that the trace was loaded from.
+
+    Returns:
+        az.InferenceData:
+            The stored trace.
+    """
+    trace = store_elpd(context, trace_key, trace)
+    context.traces.add(trace_key, trace, trace_file)
+    return trace
+
+
+def store_elpd(
+    context: Context, trace_key: str, trace: az.InferenceData
+) -> az.InferenceData:
+    """
+    Store the ELPD estimate of a model trace in the test context, then drop its pointwise log-likelihood.
+
+    The ELPD of the trace is estimated once, or loaded from the ELPD cache,
+    such that model comparisons do not need the pointwise log-likelihood.
+    The content hash of the log-likelihood is kept in the posterior
+    attributes, such that the ELPD of a trace written without its
+    log-likelihood can still be loaded from the ELPD cache.
+
+    Args:
+        context (Context):
+            The test context.
+        trace_key (str):
+            The trace dictionary key.
+        trace (az.InferenceData):
+            The model trace.
+
+    Returns:
+        az.InferenceData:
+            The model trace, without the pointwise log-likelihood.
+    """
+    method = context.behaviour.bayesian.method
+
+    if "log_likelihood" not in trace.groups():
+        digest = trace.posterior.attrs.get(LOG_LIKELIHOOD_DIGEST)
+        if digest is not None and trace_key not in context.elpd:
+            elpd = context.elpd_cache.load(trace_key, digest, method)
+            if elpd is not None:
+                context.elpd[trace_key] = elpd
+        return trace
+
+    digest = hash_posterior(trace.log_likelihood)
+    elpd = context.elpd_cache.load(trace_key, digest, method)
+    if elpd is None:
+        elpd = compute_elpd(trace, method)
+        context.elpd_cache.save(trace_key, digest, method, elpd)
+
+    context.elpd[trace_key] = elpd
+    trace = drop_log_likelihood(trace)
+    trace.posterior.attrs[LOG_LIKELIHOOD_DIGEST] = digest
+    return trace
+
+
+def write_trace(
+    context: Context, trace_key: str, trace: az.InferenceData, trace_file: str
+) -> az.InferenceData:
+    """
+    Write a model trace to its output directory, then store it in the test context.
+
+    The stored trace is lazily reopened from the trace file, such that its
+    draws are only read from disk when needed. Summaries of the trace are
+    reused by the stored trace.
+
+    Args:
+        context (Context):
+            The test context.
+        trace_key (str):
+            The trace dictionary key.
+        trace (az.InferenceData):
+            The model trace.
+        trace_file (str):
+            The trace file.
+
+    Returns:
+        az.InferenceData:
+            The stored trace.
+    """
+    dtype = "float32" if context.settings.trace_float32 else None
+    save_trace(trace, trace_file, dtype)
+    stored_trace = load_trace(trace_file)
+    share_summary(trace, stored_trace)
+    return store_trace(context, trace_key, stored_trace, trace_file)
+
+
+def get_elpd(context: Context, growth_curve: str = "") -> az.ELPDData:
+    """
+    Get the ELPD estimate of a model trace from the test context.
+
+    Args:
+        context (Context):
+            The test context.
+        growth_curve (str, optional):
+            The growth curve dictionary key. Defaults to "".
+
+    Raises:
+        ValueError:
+            Error raised when the trace has no pointwise log-likelihood, and its
+            ELPD estimate is not cached.
+
+    Returns:
+        az.ELPDData:
+            The ELPD estimate.
+    """
+    trace_key = get_trace_key(context, growth_curve)
+    if trace_key not in context.elpd:
+        get_trace(context, growth_curve)
+
+    if trace_key not in context.elpd:
+        raise ValueError(
+            f"The trace of {trace_key} has no pointwise log-likelihood, and its ELPD estimate is not cached."
+        )
+    return context.elpd[trace_key]
+
+
+def compute_log_likelihood(
+    context: Context,
+    trace: az.InferenceData,
+    out_dir: str,
+    params: list[str],
+    resp: str,
+) -> az.InferenceData:
+    """
+    Compute the pointwise log-likelihood of a model trace, stored as set by the run settings.
+
+    Args:
+        context (Context):
+            The test context.
+        trace (az.InferenceData):
+            The model trace.
+        out_dir (str):
+            The output directory of the model.
+        params (list[str]):
+            The growth curve parameters.
+        resp (str):
+            The model response.
+
+    Returns:
+        az.InferenceData:
+            The model trace.
+    """
+    settings = context.settings
+    bayesian_def = context.behaviour.bayesian
+
+    out_file = None
+    if settings.log_likelihood_on_disk:
+        out_file = join_path(out_dir, LOG_LIKELIHOOD_FILE)
+
+    return add_log_likelihood(
+        trace,
+        bayesian_def.model_type,
+        bayesian_def.likelihood,
+        params,
+        resp,
+        context.behaviour.fisheries.growth_curve,
+        settings.log_likelihood_dtype,
+        out_file,
+    )
+
+
+def store_elpd_on_disk(
+    context: Context,
+    trace_key: str,
+    trace: az.InferenceData,
+    out_dir: str,
+    params: list[str],
+    resp: str,
+) -> az.InferenceData:
+    """
+    Store the ELPD estimate of a model trace with its log-likelihood on disk, then drop the log-likelihood.
+
+    The ELPD is estimated from the memory-mapped log-likelihood, such that
+    the log-likelihood is never written to the trace cache or the trace file.
+    The ELPD of a trace loaded from the trace cache is loaded from the ELPD
+    cache, and its log-likelihood is only computed again when it is not cached.
+
+    Args:
+        context (Context):
+            The test context.
+        trace_key (str):
+            The trace dictionary key.
+        trace (az.InferenceData):
+            The model trace.
+        out_dir (str):
+            The output directory of the model.
+        params (list[str]):
+            The growth curve parameters.
+        resp (str):
+            The model response.
+
+    Returns:
+        az.InferenceData:
+            The model trace, without the pointwise log-likelihood.
+    """
+    context.elpd.pop(trace_key, None)
+    trace = store_elpd(context, trace_key, trace)
+    if trace_key not in context.elpd:
+        trace = compute_log_likelihood(context, trace, out_dir, params, resp)
+        trace = store_elpd(context, trace_key, trace)
+    return trace
+
+def reset_trace_file(out_dir: str) -> str:
+    """
+    Get the trace file of a model, removing any stale trace from a previous run.
+
+    Model comparisons then only use traces fitted during this run.
+
+    Args:
+        out_dir (str):
+            The output directory of the model.
+
+    Returns:
+        str:
+            The trace file.
+    """
+    trace_file = join_path(out_dir, TRACE_FILE)
+    if os.path.exists(trace_file):
+        os.remove(trace_file)
+
+    return trace_file
+
+def sample_bayesian_model(
+    context: Context, adaptation_key: str, out_dir: str, **sample_kwargs
+) -> az.InferenceData:
+    """
+    Sample from the posterior using the sampler of the test context.
+
+    For the NUTS sampler, online diagnostics are accumulated during sampling
+    when stopping early, or when requested by the run settings, in which case
+    they are also appended to a metrics file in the output directory after
+    each block of draws.
+
+    Args:
+        context (Context):
+            The test context.
+        adaptation_key (str):
+            The model structure and data hash, used to reuse NUTS adaptation.
+        out_dir (str):
+            The output directory.
+        **sample_kwargs:
+            The sampler keyword arguments.
+
+    Raises:
+        ValueError:
+            Error raised when early stopping is requested for a sampler other than NUTS.
+
+    Returns:
+        az.InferenceData:
+            The model trace.
+    """
+    bayesian_def = context.behaviour.bayesian
+    settings = context.settings
+
+    if bayesian_def.early_stopping and bayesian_def.sampler != "nuts":
+        raise ValueError(
+            f"Early stopping is only supported by the NUTS sampler. Received: {bayesian_def.sampler}."
+        )
+
+    if bayesian_def.sampler == "nuts":
+        diagnostics = None
+        if bayesian_def.early_stopping or settings.online_diagnostics:
+            metrics_file = None
+            if settings.online_diagnostics:
+                metrics_file = join_path(out_dir, DIAGNOSTICS_METRICS_FILE)
+            diagnostics = OnlineDiagnostics(
+                settings.diagnostics_block_size,
+                metrics_file,
+                var_names=[rv.name for rv in sample_kwargs["model"].unobserved_RVs],
+            )
+
+        if bayesian_def.early_stopping:
+            sample_kwargs["draws"] = bayesian_def.n_block_draws
+            trace = sample_until_converged(
+                context.adaptation_cache,
+                adaptation_key,
+                settings.adaptation_burn,
+                bayesian_def.convergence_criteria,
+                bayesian_def.max_draws,
+                diagnostics=diagnostics,
+                **sample_kwargs,
+            )
+        else:
+            trace = sample_adapted_nuts(
+                context.adaptation_cache,
+                adaptation_key,
+                settings.adaptation_burn,
+                diagnostics=diagnostics,
+                **sample_kwargs,
+            )
+
+        if settings.online_diagnostics:
+            diagnostics_df = diagnostics.get_diagnostics()
+            if diagnostics_df is not None:
+                diagnostics_df.to_csv(join_path(out_dir, ONLINE_DIAGNOSTICS_FILE))
+        return trace
+
+    return sample_model(
+        bayesian_def.sampler, n_iterations=bayesian_def.n_iterations, **sample_kwargs
+    )
+
+
+def write_model_outputs(
+    context: Context,
+    trace: az.InferenceData,
+    out_dir: str,
+    x: np.ndarray,
+    resp: str,
+    behaviour: BehaviourTestModel | None = None,
+) -> az.InferenceData:
+    """
+    Write the metadata, summary, and plots of a fitted model trace.
+
+    Traces loaded from the trace cache are written in the same way as newly
+    sampled traces, such that only the sampling is skipped.
+
+    Args:
+        context (Context):
+            The test context.
+        trace (az.InferenceData):
+            The model trace, including the posterior predictive samples.
+        out_dir (str):
+            The output directory of the model.
+        x (np.ndarray):
+            The explanatory variable data.
+        resp (str):
+            The model response.
+        behaviour (BehaviourTestModel | None, optional):
+            The behaviour of the model, such as a group of a joint model.
+            Defaults to the behaviour of the test context.
+
+    Returns:
+        az.InferenceData:
+            The model trace.
+    """
+    if behaviour is None:
+        behaviour = context.behaviour
+    bayesian_def = behaviour.bayesian
+    fisheries_def = behaviour.fisheries
+
+    if bayesian_def.early_stopping:
+        bayesian_def.n_draws_used = trace.posterior.sizes["draw"]
+    behaviour.to_yaml(out_dir)
+    trace = plot_bayes_model(trace, out_dir, bayesian_def.hdi_prob, context.artifacts)
+
+    mu_pp = get_mu_pp(
+        trace,
+        bayesian_def.model_type,
+        x,
+        bayesian_def.priors,
+        fisheries_def.growth_curve,
+    )
+    context.artifacts.submit(
+        plot_preds,
+        mu_pp,
+        out_dir,
+        trace.observed_data[resp],
+        trace.posterior_predictive[resp],
+        x,
+        fisheries_def.response_var,
+        fisheries_def.explanatory_var,
+        bayesian_def.hdi_prob,
+    )
+    return trace
+
+
+def check_joint_fits(context: Context, joint: bool) -> None:
+    """
+    Check that a run only fits either joint or separate models.
+
+    Joint fits write the outputs and traces of each group to the same
+    directories and keys as separate fits, such that both cannot run together.
+
+    Args:
+        context (Context):
+            The test context.
+        joint (bool):
+            Whether the model is a joint fit.
+
+    Raises:
+        ValueError:
+            Error raised when the run has already fitted the other kind of model.
+    """
+    context.joint_fits.add(joint)
+    if len(context.joint_fits) > 1:
+        raise ValueError(
+            "Joint and separate models cannot be fitted in the same run. "
+            "Run the joint feature on its own."
+        )
+
+
+def get_registered_model(
+    context: Context,
+    structure_key: str,
+    x: np.ndarray,
+    y: np.ndarray,
+    resp: str,
+    factor_idx: dict,
+    coords: dict,
+) -> tuple[pm.Model, pm.NUTS | None]:
+    """
+    Get the model and sampler step of a model structure, building and registering them if needed.
+
+    Registered models are reused with the model data swapped.
+
+    Args:
+        context (Context):
+            The test context.
+        structure_key (str):
+            The model structure hash.
+        x (np.ndarray):
+            The explanatory variable data.
+        y (np.ndarray):
+            The response variable data.
+        resp (str):
+            The model response.
+        factor_idx (dict):
+            The level index of each observation, for each factor.
+        coords (dict):
+            The levels of each factor.
+
+    Returns:
+        tuple[pm.Model, pm.NUTS | None]:
+            The PyMC model, and the sampler step or compiled model.
+    """
+    bayesian_def = context.behaviour.bayesian
+    fisheries_def = context.behaviour.fisheries
+    registered = context.model_registry.get(structure_key)
+
+    if is_compiled(bayesian_def.sampler):
+        model_coords = {"coords": coords}
+    else:
+        model_coords = {"coords_mutable": coords}
+
+    if registered is None:
+        with pm.Model(**model_coords) as model:
+            x_idx = pm.MutableData("x_idx", x , dims="obs_id")
+            y_data = pm.MutableData(f"{resp}_data", y, dims="obs_id")
+
+            factor_data = {}
+            for col in bayesian_def.factors:
+                factor_data[col] = pm.MutableData(
+                    f"{col}_indx", factor_idx[col], dims="obs_id"
+                )
+
+            fit_model(
+                bayesian_def.model_type,
+                model,
+                get_prior_data(bayesian_def.priors),
+                x_idx,
+                y_data,
+                resp,
+                bayesian_def.likelihood,
+                bayesian_def.factors,
+                fisheries_def.growth_curve,
+                factor_data,
+                bayesian_def.parameter_factors,
+                bayesian_def.random_intercepts,
+            )
+
+        step = None
+    else:
+        model, step = registered
+        if not is_compiled(bayesian_def.sampler):
+            for col, levels in coords.items():
+                model.set_dim(col, len(levels), coord_values=levels)
+        model_data = get_model_data(x, y, resp, factor_idx, bayesian_def.priors)
+        pm.set_data(model_data, model=model)
+        if step is not None and is_compiled(bayesian_def.sampler):
+            step = step.with_data(**model_data)
+
+    if bayesian_def.sampler == "nuts" and step is None:
+        step = pm.NUTS(model=model, target_accept=bayesian_def.acceptance_prob)
+    if bayesian_def.sampler == "nutpie" and step is None:
+        step = compile_nutpie(model)
+    context.model_registry.add(structure_key, model, step)
+    return model, step
+
+
+def sample_trace(
+    context: Context,
+    model: pm.Model,
+    adaptation_key: str,
+    cache_keys: list[str],
+    trace_key: str,
+    out_dir: str,
+    params: list[str],
+    resp: str,
+    step: pm.NUTS | None = None,
+    coords: dict = {},
+) -> az.InferenceData:
+    """
+    Sample a model, add its log-likelihood and posterior predictive samples, then cache the trace.
+
+    Args:
+        context (Context):
+            The test context.
+        model (pm.Model):
+            The PyMC model.
+        adaptation_key (str):
+            The model structure and data hash, used to reuse NUTS adaptation.
+        cache_keys (list[str]):
+            The trace cache keys of the model fit.
+        trace_key (str):
+            The trace dictionary key.
+        out_dir (str):
+            The output directory of the model.
+        params (list[str]):
+            The growth curve parameters.
+        resp (str):
+            The model response.
+        step (pm.NUTS | None, optional):
+            The sampler step or compiled model to reuse. Defaults to None.
+        coords (dict, optional):
+            The factor levels of the model data. Defaults to {}.
+
+    Returns:
+        az.InferenceData:
+            The model trace.
+    """
+    behaviour = context.behaviour
+    bayesian_def = behaviour.bayesian
+
+    if context.artifacts.enabled:
+        pgm = pm.model_to_graphviz(model = model)
+        context.artifacts.submit(render_model_graph, pgm, out_dir)
+
+    if bayesian_def.parallelisation:
+        cores = bayesian_def.n_chains
+    else:
+        cores = 1
+
+    with model:
+        sample_kwargs = {
+            "model": model,
+            "draws": bayesian_def.n_draws,
+            "tune": bayesian_def.n_burn,
+            "chains": bayesian_def.n_chains,
+            "cores": cores,
+            "target_accept": bayesian_def.acceptance_prob,
+            "random_seed": behaviour.random_seed,
+            "initvals": get_initial_points(
+                model, bayesian_def.n_chains, behaviour.random_seed
+            ),
+            "step": step,
+        }
+
+        trace = sample_bayesian_model(
+            context, adaptation_key, out_dir, **sample_kwargs
+        )
+
+    if is_compiled(bayesian_def.sampler):
+        # Fixed dimensions keep the factor levels of the data first compiled.
+        trace.posterior = trace.posterior.assign_coords(
+            {col: levels for col, levels in coords.items() if col in trace.posterior.dims}
+        )
+    trace = compute_log_likelihood(context, trace, out_dir, params, resp)
+    if context.settings.log_likelihood_on_disk:
+        trace = store_elpd_on_disk(context, trace_key, trace, out_dir, params, resp)
+    trace = add_posterior_predictive(
+        trace,
+        bayesian_def.model_type,
+        bayesian_def.likelihood,
+        params,
+        resp,
+        behaviour.fisheries.growth_curve,
+        behaviour.random_seed,
+    )
+
+    save_cached_trace(context, cache_keys, trace)
+    return trace
+
+
+def build_joint_model(
+    context: Context,
+    df: pd.DataFrame,
+    group_idx: np.ndarray,
+    group_priors: dict,
+    factor_idx: dict,
+    factor_coords: dict,
+    factor_levels: dict,
+    resp: str,
+) -> pm.Model:
+    """
+    Build a single model of all species and sex groups.
+
+    Args:
+        context (Context):
+            The test context.
+        df (pd.DataFrame):
+            The data of all groups.
+        group_idx (np.ndarray):
+            The group index of each observation.
+        group_priors (dict):
+            The priors of each group.
+        factor_idx (dict):
+            The level index of each observation, for each factor.
+        factor_coords (dict):
+            The levels of each factor.
+        factor_levels (dict):
+            The group of each factor level, for each factor.
+        resp (str):
+            The model response.
+
+    Returns:
+        pm.Model:
+            The PyMC model.
+    """
+    bayesian_def = context.behaviour.bayesian
+    fisheries_def = context.behaviour.fisheries
+
+    coords = {"group": list(group_priors), "obs_id": df.index.values, **factor_coords}
+    with pm.Model(coords=coords) as model:
+        x_idx = pm.MutableData(
+            "x_idx", df[fisheries_def.explanatory_var].values, dims="obs_id"
+        )
+        y_data = pm.MutableData(
+            f"{resp}_data", df[fisheries_def.response_var].values, dims="obs_id"
+        )
+        group_data = pm.MutableData("group_indx", group_idx, dims="obs_id")
+
+        factor_data = {}
+        for col in bayesian_def.factors:
+            factor_data[col] = pm.MutableData(
+                f"{col}_indx", factor_idx[col], dims="obs_id"
+            )
+
+        fit_joint_nonlinear_model(
+            model,
+            group_priors,
+            x_idx,
+            y_data,
+            resp,
+            bayesian_def.likelihood,
+            group_data,
+            fisheries_def.growth_curve,
+            factor_data,
+            factor_levels,
+            bayesian_def.parameter_factors,
+            bayesian_def.partial_pooling,
+        )
+
+    return model
+
+
+def write_group_outputs(
+    context: Context,
+    trace: az.InferenceData,
+    x: np.ndarray,
+    group_idx: np.ndarray,
+    group_priors: dict,
+    factor_levels: dict,
+    resp: str,
+) -> None:
+    """
+    Split a joint model trace by group, then write the outputs and trace of each group.
+
+    The outputs and traces of each group are written and keyed as those of a
+    separate fit of the group, such that later steps, such as the model
+    comparisons of the separate features, use the joint fit.
+
+    Args:
+        context (Context):
+            The test context.
+        trace (az.InferenceData):
+            The joint model trace.
+        x (np.ndarray):
+            The explanatory variable data of all groups.
+        group_idx (np.ndarray):
+            The group index of each observation.
+        group_priors (dict):
+            The priors of each group.
+        factor_levels (dict):
+            The group of each factor level, for each factor.
+        resp (str):
+            The model response.
+    """
+    behaviour = context.behaviour
+    bayesian_def = behaviour.bayesian
+    fisheries_def = behaviour.fisheries
+    group_names = list(group_priors)
+
+    for group_def, group in zip(fisheries_def.groups, group_names):
+        group_behaviour = deepcopy(behaviour)
+        group_fisheries_def = group_behaviour.fisheries
+        for k in ["species", "sex", "locations", "years"]:
+            setattr(group_fisheries_def, k, group_def[k])
+        group_behaviour.bayesian.priors = group_priors[group]
+
+        group_out_dir = join_path(
+            "out",
+            fisheries_def.class_type,
+            fisheries_def.order,
+            group_fisheries_def.species,
+            group_fisheries_def.sex,
+            bayesian_def.model_type,
+            fisheries_def.growth_curve,
+        )
+        group_trace_file = reset_trace_file(group_out_dir)
+
+        group_trace_key = get_trace_dict_key(
+            fisheries_def.class_type,
+            fisheries_def.order,
+            group_fisheries_def.species,
+            group_fisheries_def.sex,
+            bayesian_def.model_type,
+            fisheries_def.growth_curve,
+        )
+
+        group_trace = split_joint_trace(trace, group, group_idx, factor_levels)
+        if context.settings.log_likelihood_on_disk:
+            group_trace = store_elpd(context, group_trace_key, group_trace)
+        group_x = x[group_idx == group_names.index(group)]
+        group_trace = write_model_outputs(
+            context, group_trace, group_out_dir, group_x, resp, group_behaviour
+        )
+        write_trace(context, group_trace_key, group_trace, group_trace_file)
+
+
+def fit_joint_model(context: Context) -> None:
+    """
+    Fit a single model to all species and sex groups, then write the outputs of each group.
+
+    Args:
+        context (Context):
+            The test context.
+
+    Raises:
+        ValueError:
+            Error raised when the model type is not nonlinear.
+    """
+    behaviour = context.behaviour
+    bayesian_def = behaviour.bayesian
+    fisheries_def = behaviour.fisheries
+
+    if bayesian_def.model_type != "nonlinear":
+        raise ValueError(
+            f"Joint models must be nonlinear. Received: {bayesian_def.model_type}."
+        )
+
+    df = get_joint_df(
+        behaviour.data_dir,
+        behaviour.data_file,
+        fisheries_def.class_type,
+        fisheries_def.order,
+        fisheries_def.groups,
+        fisheries_def.response_var,
+        fisheries_def.explanatory_var,
+        [fisheries_def.explanatory_var, fisheries_def.response_var] + bayesian_def.factors,
+    )
+
+    out_dir = get_out_dir(context)
+    behaviour.to_yaml(out_dir)
+    trace_file = reset_trace_file(out_dir)
+
+    group_names = [
+        get_group_name(group_def["species"], group_def["sex"])
+        for group_def in fisheries_def.groups
+    ]
+    group_priors = {group: bayesian_def.group_priors[group] for group in group_names}
+    group_idx = pd.Categorical(df["group"], categories=group_names).codes
+    factor_idx, factor_coords, factor_levels = get_joint_factors(
+        df, bayesian_def.factors
+    )
+
+    trace_key = get_trace_key(context)
+    data_cols = [fisheries_def.explanatory_var, fisheries_def.response_var, "group"]
+    adaptation_key = hash_trace_inputs(
+        df[data_cols + bayesian_def.factors],
+        group_priors,
+        fisheries_def.growth_curve,
+        bayesian_def.likelihood,
+        bayesian_def.parameter_factors,
+        bayesian_def.partial_pooling,
+        bayesian_def.acceptance_prob,
+    )
+    cache_keys = get_cache_keys(
+        context,
+        adaptation_key,
+        df[data_cols + bayesian_def.factors],
+        get_sampling_inputs(bayesian_def),
+        fisheries_def.growth_curve,
+        behaviour.random_seed,
+    )
+
+    resp = "y"
+    params = list(group_priors[group_names[0]])
+    trace = load_cached_trace(context, cache_keys)
+    if trace is None:
+        model = build_joint_model(
+            context,
+            df,
+            group_idx,
+            group_priors,
+            factor_idx,
+            factor_coords,
+            factor_levels,
+            resp,
+        )
+        trace = sample_trace(
+            context,
+            model,
+            adaptation_key,
+            cache_keys,
+            trace_key,
+            out_dir,
+            params,
+            resp,
+            coords=factor_coords,
+        )
+
+    if context.settings.log_likelihood_on_disk:
+        # Group ELPD estimates are split from the log-likelihood of the joint model.
+        trace = compute_log_likelihood(context, trace, out_dir, params, resp)
+
+    x = df[fisheries_def.explanatory_var].values
+    write_group_outputs(
+        context, trace, x, group_idx, group_priors, factor_levels, resp
+    )
+
+    if context.settings.log_likelihood_on_disk:
+        trace = store_elpd(context, trace_key, trace)
+    if bayesian_def.early_stopping:
+        bayesian_def.n_draws_used = trace.posterior.sizes["draw"]
+    behaviour.to_yaml(out_dir)
+    get_summary(trace, bayesian_def.hdi_prob).to_csv(join_path(out_dir, "summary.csv"))
+    write_trace(context, trace_key, trace, trace_file)
+
 ######################################
 # Steps
 ######################################
@@ -89,6 +1236,12 @@ def step_impl(
     context.behaviour.bayesian.model_type = model_type
     context.behaviour.bayesian.sampler_longname = sampler_longname
     context.behaviour.bayesian.sampler = sampler
+    context.behaviour.bayesian.approximate = is_approximate(sampler)
+
+
+@given('we are running up to "{n_iterations:d}" iterations of approximate inference')
+def step_impl(context: Context, n_iterations: int) -> None:
+    context.behaviour.bayesian.n_iterations = n_iterations
 
 
 @given(
@@ -111,6 +1264,19 @@ def step_impl(context: Context, n_draws: int) -> None:
     context.behaviour.bayesian.n_draws = n_draws
 
 
+@given(
+    'we stop sampling once our diagnostics are satisfied, checking every "{n_block_draws:d}" draws up to "{max_draws:d}" draws per MCMC chain'
+)
+def step_impl(context: Context, n_block_draws: int, max_draws: int) -> None:
+    bayesian_def = context.behaviour.bayesian
+    bayesian_def.early_stopping = True
+    bayesian_def.n_block_draws = n_block_draws
+    bayesian_def.max_draws = max_draws
+    bayesian_def.convergence_criteria = get_convergence_criteria(
+        context.scenario.all_steps
+    )
+
+
 @given('we specify "{n_burn:d}" samples for our burn-in period')
 def step_impl(context: Context, n_burn: int) -> None:
     context.behaviour.bayesian.n_burn = n_burn
@@ -159,6 +1325,33 @@ def step_impl(context: Context, factor_list: list[str], parameter: str) -> None:
     context.behaviour.bayesian.parameter_factors[parameter] = factors
 
 
+@given('we construct our random intercepts as "{random_intercepts:SnakeCaseString}" tensors')
+def step_impl(context: Context, random_intercepts: str) -> None:
+    context.behaviour.bayesian.random_intercepts = random_intercepts
+
+
+@given("we believe that our group parameters could plausibly be")
+def step_impl(context: Context) -> None:
+    group_priors = {}
+    for row in context.table:
+        group = get_group_name(
+            snake_case_string(row["species"]), parse_male_female(row["sex"])
+        )
+        parameter = snake_case_string(row["parameter"])
+        prior = {"name": parameter, "mu": float(row["mu"]), "sigma": float(row["sigma"])}
+        for bound_key in ["lower", "upper"]:
+            if bound_key in row.headings and row[bound_key].strip() != "":
+                prior[bound_key] = float(row[bound_key])
+        group_priors.setdefault(group, {})[parameter] = prior
+
+    context.behaviour.bayesian.group_priors = group_priors
+
+
+@given("we partially pool our growth parameters across groups")
+def step_impl(context: Context) -> None:
+    context.behaviour.bayesian.partial_pooling = True
+
+
 @given(
     'we aim to evaluate the "{hdi_prob:f}" highest posterior density intervals (HDIs) of our parameter estimates'
 )
@@ -194,6 +1387,11 @@ def step_impl(context: Context) -> None:
     bayesian_def = behaviour.bayesian
     fisheries_def = behaviour.fisheries
 
+    check_joint_fits(context, len(fisheries_def.groups) > 0)
+    if len(fisheries_def.groups) > 0:
+        fit_joint_model(context)
+        return
+
     data_dir = get_dir_path(
         behaviour.data_dir,
         fisheries_def.class_type,
@@ -201,6 +1399,7 @@ def step_impl(context: Context) -> None:
         fisheries_def.species,
     )
 
+    data_cols = [fisheries_def.explanatory_var, fisheries_def.response_var]
     df = get_df(
         data_dir,
         behaviour.data_file,
@@ -209,134 +1408,98 @@ def step_impl(context: Context) -> None:
         fisheries_def.locations,
         fisheries_def.response_var,
         fisheries_def.explanatory_var,
+        data_cols + bayesian_def.factors,
     )
 
-    out_dir = join_path(
-        "out",
-        fisheries_def.class_type,
-        fisheries_def.order,
-        fisheries_def.species,
-        fisheries_def.sex,
-        bayesian_def.model_type,
-        fisheries_def.growth_curve,
-    )
+    out_dir = get_out_dir(context)
     behaviour.to_yaml(out_dir)
+    trace_file = reset_trace_file(out_dir)
 
+    trace_key = get_trace_key(context)
     x = df[fisheries_def.explanatory_var].values
     y = df[fisheries_def.response_var].values
     resp = "y"
 
     coords = {}
+    factor_idx = {}
     for col in bayesian_def.factors:
-        _, mn_factor = df[col].factorize()
-        coords[col] = mn_factor
+        factor_idx[col], coords[col] = get_factor_codes(df[col])
 
-    with pm.Model(coords = coords) as model:
-        factor_data = {}
-        for col in bayesian_def.factors:
-            factor, _ = df[col].factorize()
-            factor_data[col] = pm.MutableData(f"{col}_indx", factor, dims="obs_id")
+    structure_key = get_model_structure_key(
+        bayesian_def.model_type,
+        fisheries_def.growth_curve,
+        bayesian_def.likelihood,
+        bayesian_def.priors,
+        bayesian_def.parameter_factors,
+        coords,
+        bayesian_def.acceptance_prob,
+        bayesian_def.random_intercepts,
+        is_compiled(bayesian_def.sampler),
+    )
+    adaptation_key = hash_trace_inputs(
+        df[data_cols + bayesian_def.factors], structure_key, bayesian_def.priors
+    )
+    cache_keys = get_cache_keys(
+        context,
+        adaptation_key,
+        df[data_cols + bayesian_def.factors],
+        get_sampling_inputs(bayesian_def),
+        fisheries_def.growth_curve,
+        behaviour.random_seed,
+    )
 
-        x_idx = pm.MutableData("x_idx", x , dims="obs_id")
-   
-        fit_model(
-            bayesian_def.model_type,
+    trace = load_cached_trace(context, cache_keys)
+    if trace is None:
+        model, step = get_registered_model(
+            context, structure_key, x, y, resp, factor_idx, coords
+        )
+        trace = sample_trace(
+            context,
             model,
-            bayesian_def.priors,
-            x_idx,
-            y,
+            adaptation_key,
+            cache_keys,
+            trace_key,
+            out_dir,
+            list(bayesian_def.priors),
             resp,
-            bayesian_def.likelihood,
-            bayesian_def.factors,
-            fisheries_def.growth_curve,
-            factor_data,
-            bayesian_def.parameter_factors
+            step,
+            coords,
         )
-
-        if bayesian_def.parallelisation:
-            cores = bayesian_def.n_chains
-        else:
-            cores = 1
-
-        pgm = pm.model_to_graphviz(model = model)
-        pgm.render(format = "png", directory = out_dir, filename = "model_graph")
-
-        trace = pm.sample(
-            init = "auto",
-            draws=bayesian_def.n_draws,
-            tune=bayesian_def.n_burn,
-            chains=bayesian_def.n_chains,
-            cores=cores,
-            target_accept=bayesian_def.acceptance_prob,
-            model=model,
-            random_seed=behaviour.random_seed,
-            progressbar=False,
-        )
-        pm.compute_log_likelihood(trace)
-        trace = plot_bayes_model(trace, out_dir, bayesian_def.hdi_prob)
-
-        mu_pp = get_mu_pp(
-            trace,
-            bayesian_def.model_type,
-            x,
-            bayesian_def.priors,
-            fisheries_def.growth_curve,
-        )
-        plot_preds(
-            mu_pp,
-            out_dir,
-            trace.observed_data[resp],
-            trace.posterior_predictive[resp],
-            x,
-            fisheries_def.response_var,
-            fisheries_def.explanatory_var,
-            bayesian_def.hdi_prob,
+    elif context.settings.log_likelihood_on_disk:
+        trace = store_elpd_on_disk(
+            context, trace_key, trace, out_dir, list(bayesian_def.priors), resp
         )
 
-        trace_key = get_trace_key(context)
-        context.traces[trace_key] = trace
+    trace = write_model_outputs(context, trace, out_dir, x, resp)
+    write_trace(context, trace_key, trace, trace_file)
 
 
 @when('we compare the following candidate models "{growth_curve_list:CommaList}"')
 def step_impl(context: Context, growth_curve_list: list[str]) -> None:
     behaviour = context.behaviour
     bayesian_def = behaviour.bayesian
-    fisheries_def = behaviour.fisheries
     candidate_models = {}
 
     for k in growth_curve_list:
-        trace_key = get_trace_key(context, k.lower())
-        candidate_models[k] = context.traces[trace_key]
+        candidate_models[k] = get_elpd(context, k.lower())
 
     model_scores_df = az.compare(
         candidate_models, ic = bayesian_def.method, method = bayesian_def.model_weights
     )
     model_scores_df["model"] = model_scores_df.index
 
-    out_dir = join_path(
-        "out",
-        fisheries_def.class_type,
-        fisheries_def.order,
-        fisheries_def.species,
-        fisheries_def.sex,
-        bayesian_def.model_type,
-    )
+    out_dir = get_out_dir(context, "")
 
     outfile = join_path(out_dir, "model_scores.csv")
     model_scores_df.to_csv(outfile, index=False)
 
     outfile = join_path(out_dir, "model_scores.png")
-    az.plot_compare(
-        model_scores_df, plot_standard_error=True, plot_ic_diff=True, order_by_rank=True, legend=True, title=True
-    )
-    plt.savefig(outfile)
+    context.artifacts.submit(plot_model_scores, model_scores_df, outfile)
 
     context.model_scores = model_scores_df
 
 
-@then(
-    'we expect our "{diag_longname}" ("{diagnostic:SnakeCaseString}") diagnostics to all be "{comparison:QueryComparison}" "{diag_baseline:f}"'
-)
+@then(DIAGNOSTIC_STEP)
 def step_impl(
     context: Context,
     diag_longname: str,
@@ -344,11 +1507,10 @@ def step_impl(
     comparison: str,
     diag_baseline: float,
 ) -> None:
-    trace_key = get_trace_key(context)
-    trace = context.traces[trace_key]
+    trace = get_trace(context)
 
     hdi_prob = context.behaviour.bayesian.hdi_prob
-    trace_df = az.summary(trace, hdi_prob=hdi_prob)
+    trace_df = get_summary(trace, hdi_prob)
     n_rows = trace_df.shape[0]
 
     filtered_df = trace_df.query(f"{diagnostic} {comparison} @diag_baseline")
@@ -363,11 +1525,10 @@ def step_impl(
 def step_impl(
     context: Context, parameter: str, estimate: float, error_prop: float
 ) -> None:
-    trace_key = get_trace_key(context)
-    trace = context.traces[trace_key]
+    trace = get_trace(context)
 
     hdi_prob = context.behaviour.bayesian.hdi_prob
-    trace_df = az.summary(trace, hdi_prob=hdi_prob)
+    trace_df = get_summary(trace, hdi_prob)
     trace_df["parameter"] = trace_df.index
 
     error = estimate * error_prop
@@ -94,6 +94,36 @@ def step_impl(context: Context, location_list: list[str]) -> None:
     context.behaviour.fisheries.locations = locations
 
 
+@given("we are jointly fitting the following groups")
+def step_impl(context: Context) -> None:
+    groups = []
+    for row in context.table:
+        locations = []
+        if row["locations"].strip() != "":
+            locations = [
+                location_oracle.get(location)
+                for location in parse_comma_list(row["locations"])
+            ]
+
+        years = []
+        if row["first year"].strip() != "" and row["last year"].strip() != "":
+            years = [int(row["first year"]), int(row["last year"])]
+
+        groups.append(
+            {
+                "species": snake_case_string(row["species"]),
+                "sex": parse_male_female(row["sex"]),
+                "locations": locations,
+                "years": years,
+            }
+        )
+
+    # Joint model outputs are written to the joint species directory.
+    context.behaviour.fisheries.groups = groups
+    context.behaviour.fisheries.species = "joint"
+    context.behaviour.fisheries.sex = "all"
+
+
 @given("recorded location data are unavailable")
 def step_impl(context):
     context.behaviour.fisheries.locations = []
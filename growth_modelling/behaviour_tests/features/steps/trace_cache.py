@@ -0,0 +1,422 @@
+######################################
+# Imports
+######################################
+
+# External
+import arviz as az
+from collections import OrderedDict
+import hashlib
+from importlib.util import find_spec
+import json
+import logging
+import numpy as np
+import os
+from os.path import join as join_path
+import pandas as pd
+from pathlib import Path
+import xarray as xr
+
+######################################
+# Constants
+######################################
+
+CACHE_VERSION = 1
+
+TRACE_COMPLEVEL = 4
+# The maximum number of draws per chunk of a stored trace variable.
+TRACE_CHUNK_DRAWS = 1000
+# Groups that may be stored in reduced precision.
+SAMPLED_GROUPS = ["posterior", "posterior_predictive", "log_likelihood"]
+
+logger = logging.getLogger(__name__)
+
+######################################
+# Functions
+######################################
+
+
+def hash_trace_inputs(df: pd.DataFrame, *inputs) -> str:
+    """
+    Hash the data and model inputs of a Bayesian model fit.
+
+    Args:
+        df (pd.DataFrame):
+            The model data.
+        *inputs:
+            JSON serialisable model inputs, such as priors and sampler settings.
+
+    Returns:
+        str:
+            The content hash.
+    """
+    digest = hashlib.sha256()
+    digest.update(str(CACHE_VERSION).encode())
+    digest.update(json.dumps(list(df.columns)).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+
+    for model_input in inputs:
+        digest.update(json.dumps(model_input, sort_keys=True, default=str).encode())
+
+    return digest.hexdigest()
+
+
+def get_trace_encoding(
+    group: str, dataset: xr.Dataset, dtype: str | None = None
+) -> dict:
+    """
+    Get the NetCDF encoding of a trace group.
+
+    Numeric variables are compressed, and chunked by chain and draw, such that
+    slices of draws can be read without decompressing the whole variable.
+
+    Args:
+        group (str):
+            The trace group.
+        dataset (xr.Dataset):
+            The trace group data.
+        dtype (str | None, optional):
+            The floating point dtype of the sampled groups. Unchanged if None.
+            Defaults to None.
+
+    Returns:
+        dict:
+            The encoding of each variable.
+    """
+    encoding = {}
+    for name, values in dataset.data_vars.items():
+        if not np.issubdtype(values.dtype, np.number):
+            continue
+
+        var_encoding = {"zlib": True, "complevel": TRACE_COMPLEVEL, "shuffle": True}
+        if values.ndim > 0:
+            chunks = []
+            for dim, size in values.sizes.items():
+                if dim == "chain":
+                    size = 1
+                elif dim == "draw":
+                    size = min(size, TRACE_CHUNK_DRAWS)
+                chunks.append(max(size, 1))
+            var_encoding["chunksizes"] = tuple(chunks)
+
+        if (
+            dtype is not None
+            and group in SAMPLED_GROUPS
+            and np.issubdtype(values.dtype, np.floating)
+        ):
+            var_encoding["dtype"] = dtype
+        encoding[name] = var_encoding
+
+    return encoding
+
+
+def save_trace(trace: az.InferenceData, path: str, dtype: str | None = None) -> str:
+    """
+    Save a trace to a compressed and chunked NetCDF file.
+
+    Args:
+        trace (az.InferenceData):
+            The model trace.
+        path (str):
+            The NetCDF file path.
+        dtype (str | None, optional):
+            The floating point dtype of the sampled groups, such as "float32".
+            Unchanged if None. Defaults to None.
+
+    Returns:
+        str:
+            The NetCDF file path.
+    """
+    mode = "w"
+    for group in trace.groups():
+        dataset = trace[group]
+        dataset.to_netcdf(
+            path,
+            mode=mode,
+            group=group,
+            engine="h5netcdf",
+            encoding=get_trace_encoding(group, dataset, dtype),
+        )
+        mode = "a"
+
+    return path
+
+
+def load_trace(path: str, lazy: bool = True) -> az.InferenceData:
+    """
+    Load a trace from a NetCDF file.
+
+    Lazily loaded variables are only read from disk when accessed, and are
+    backed by dask arrays if dask is installed.
+
+    Args:
+        path (str):
+            The NetCDF file path.
+        lazy (bool, optional):
+            Load variables lazily. Defaults to True.
+
+    Returns:
+        az.InferenceData:
+            The model trace.
+    """
+    if not lazy:
+        return az.from_netcdf(path).map(lambda ds: ds.load())
+
+    group_kwargs = None
+    if find_spec("dask") is not None:
+        group_kwargs = {".*": {"chunks": {}}}
+    with az.rc_context({"data.load": "lazy"}):
+        return az.from_netcdf(path, group_kwargs=group_kwargs, regex=True)
+
+
+def get_trace_size(trace: az.InferenceData) -> int:
+    """
+    Get the size of the trace variables loaded into memory.
+
+    Variables of a lazily loaded trace are only charged once their draws have
+    been read from disk, and cached in memory.
+
+    Args:
+        trace (az.InferenceData):
+            The model trace.
+
+    Returns:
+        int:
+            The size in bytes.
+    """
+    return sum(
+        variable.nbytes
+        for group in trace.groups()
+        for variable in trace[group].variables.values()
+        if variable._in_memory
+    )
+
+
+######################################
+# Classes
+######################################
+
+
+class TraceCache:
+    """Size-bounded, content-addressed on-disk cache for model traces."""
+
+    def __init__(self, cache_dir: str, max_size: int, enabled: bool = True) -> None:
+        """
+        The trace cache constructor.
+
+        Args:
+            cache_dir (str):
+                The cache directory.
+            max_size (int):
+                The maximum total size of the cache in bytes.
+            enabled (bool, optional):
+                Enable the trace cache. Defaults to True.
+        """
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.enabled = enabled
+
+    def get_path(self, key: str) -> str:
+        """
+        Get the cache file path for a trace.
+
+        Args:
+            key (str):
+                The trace content hash.
+
+        Returns:
+            str:
+                The cache file path.
+        """
+        return join_path(self.cache_dir, f"{key}.nc")
+
+    def load(self, key: str) -> az.InferenceData | None:
+        """
+        Load a trace from the cache.
+
+        Args:
+            key (str):
+                The trace content hash.
+
+        Returns:
+            az.InferenceData | None:
+                The cached trace, or None on a cache miss.
+        """
+        path = self.get_path(key)
+        if not self.enabled or not os.path.exists(path):
+            return None
+
+        trace = load_trace(path, lazy=False)
+        # Touch the file so that eviction is least-recently-used.
+        os.utime(path)
+        logger.info(f"Loaded trace {key} from the trace cache.")
+        return trace
+
+    def save(self, key: str, trace: az.InferenceData) -> str | None:
+        """
+        Save a trace to the cache, then evict old traces.
+
+        Args:
+            key (str):
+                The trace content hash.
+            trace (az.InferenceData):
+                The model trace.
+
+        Returns:
+            str | None:
+                The cache file path, or None if the cache is disabled.
+        """
+        if not self.enabled:
+            return None
+
+        Path(self.cache_dir).mkdir(parents=True, exist_ok=True)
+        path = self.get_path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        save_trace(trace, tmp_path)
+        os.replace(tmp_path, path)
+
+        self.evict()
+        return path
+
+    def evict(self) -> list[str]:
+        """
+        Evict the least-recently-used traces until the cache fits its size bound.
+
+        Returns:
+            list[str]:
+                The evicted cache file paths.
+        """
+        if not os.path.isdir(self.cache_dir):
+            return []
+
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and entry.name.endswith(".nc"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total_size = sum(size for _, size, _ in entries)
+        evicted = []
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            os.remove(path)
+            total_size -= size
+            evicted.append(path)
+            logger.info(f"Evicted {path} from the trace cache.")
+
+        return evicted
+
+
+class TraceRegistry:
+    """
+    Memory-bounded LRU registry of file-backed model traces.
+
+    Every trace is backed by the NetCDF file that it was written to. Traces
+    over the memory budget are released, and lazily reopened from their file
+    when needed again.
+    """
+
+    def __init__(self, max_size: int) -> None:
+        """
+        The trace registry constructor.
+
+        Args:
+            max_size (int):
+                The maximum total size of the trace data loaded into memory in bytes.
+        """
+        self.max_size = max_size
+        self.traces: OrderedDict[str, az.InferenceData] = OrderedDict()
+        self.trace_files: dict[str, tuple[str, list[str]]] = {}
+        self.stats = {"hits": 0, "misses": 0, "reloads": 0, "releases": 0}
+
+    def add(self, key: str, trace: az.InferenceData, trace_file: str) -> None:
+        """
+        Add a trace to the registry, then release old traces.
+
+        Args:
+            key (str):
+                The trace dictionary key.
+            trace (az.InferenceData):
+                The model trace.
+            trace_file (str):
+                The NetCDF file that the trace was loaded from, which released
+                traces are reopened from.
+        """
+        self.trace_files[key] = (trace_file, list(trace.groups()))
+        self.traces[key] = trace
+        self.traces.move_to_end(key)
+        self.release()
+
+    def get_size(self) -> int:
+        """
+        Get the total size of the trace data loaded into memory.
+
+        Returns:
+            int:
+                The total size in bytes.
+        """
+        return sum(get_trace_size(trace) for trace in self.traces.values())
+
+    def get(self, key: str) -> az.InferenceData | None:
+        """
+        Get a trace, reopening it from its file if it has been released.
+
+        Args:
+            key (str):
+                The trace dictionary key.
+
+        Returns:
+            az.InferenceData | None:
+                The model trace, or None if the trace is not registered.
+        """
+        if key in self.traces:
+            self.stats["hits"] += 1
+            self.traces.move_to_end(key)
+            return self.traces[key]
+
+        if key not in self.trace_files:
+            self.stats["misses"] += 1
+            return None
+
+        trace_file, groups = self.trace_files[key]
+        trace = load_trace(trace_file)
+        # Groups dropped from the stored trace stay dropped.
+        trace = az.InferenceData(**{group: trace[group] for group in groups})
+
+        self.stats["reloads"] += 1
+        self.traces[key] = trace
+        self.release()
+        return trace
+
+    def release(self) -> list[str]:
+        """
+        Release the least-recently-used traces until the registry fits its memory bound.
+
+        The most recently used trace is always kept.
+
+        Returns:
+            list[str]:
+                The released trace keys.
+        """
+        released = []
+        total_size = self.get_size()
+        while total_size > self.max_size and len(self.traces) > 1:
+            key, trace = self.traces.popitem(last=False)
+            total_size -= get_trace_size(trace)
+            released.append(key)
+            self.stats["releases"] += 1
+            logger.info(f"Released trace {key}, backed by {self.trace_files[key][0]}.")
+
+        return released
+
+    def clear(self) -> dict:
+        """
+        Remove all traces.
+
+        Returns:
+            dict:
+                The hit, miss, reload, and release counts.
+        """
+        self.trace_files.clear()
+        self.traces.clear()
+        return dict(self.stats)
@@ -4,15 +4,62 @@
 
 # External
 import arviz as az
+from arviz.data.base import dict_to_dataset
+from collections import OrderedDict
+import hashlib
+import matplotlib
 from matplotlib import pyplot as plt
 import numpy as np
+import os
 from os.path import join as join_path
 import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
 import pymc as pm
+from pymc.exceptions import SamplingError
+from pymc.initial_point import make_initial_point_fns_per_chain
 from parse_type import TypeBuilder
+import pytensor.tensor as pt
 from pytensor.tensor import TensorVariable
+from scipy import special, stats
 import xarray as xr
 
+# Internal
+from artifacts import ArtifactRenderer
+
+# Plots are only written to files.
+matplotlib.use("Agg")
+
+######################################
+# Constants
+######################################
+
+SUMMARY_CACHE_SIZE = 32
+DATA_CACHE_SIZE = 16
+# The typed copy of each data file, written by the preprocessing pipeline.
+PARQUET_SUFFIX = ".parquet"
+PARQUET_PARTITIONING = ds.partitioning(
+    pa.schema([("sex", pa.string()), ("year", pa.float64())]), flavor="hive"
+)
+# The compact dtypes of the loaded data columns.
+DATA_DTYPES = {
+    "sex": "category",
+    "source": "category",
+    "species": "category",
+    "stl": "float32",
+    "fl": "float32",
+    "age": "float32",
+}
+# The maximum number of pointwise predictions or log-likelihoods computed at once.
+POINTWISE_CHUNK_SIZE = 2**20
+# The number of explanatory variable values to plot the mean posterior predictions at.
+MU_PP_GRID_SIZE = 200
+
+# Summary tables, keyed by posterior file or content hash, and HDI probability.
+summary_cache: OrderedDict[tuple, pd.DataFrame] = OrderedDict()
+# Filtered input dataframes, keyed by data file, modification time, and filters.
+data_cache: OrderedDict[tuple, pd.DataFrame] = OrderedDict()
+
 ######################################
 # Functions
 ######################################
@@ -39,6 +86,126 @@ def get_dir_path(base_dir: str, class_name: str, order: str, species: str) -> st
     return data_dir
 
 
+def read_parquet_df(
+    parquet_path: str,
+    year_interval: list[str],
+    sex: str,
+    locations: str,
+    columns: list[str] | None = None,
+) -> pd.DataFrame:
+    """
+    Read the filtered rows of a Parquet dataset partitioned by sex and year.
+
+    Only the partitions and columns needed are read. The dtypes, column order,
+    and row labels of the CSV file that the dataset was written from are
+    restored.
+
+    Args:
+        parquet_path (str):
+            The Parquet dataset directory.
+        year_interval (list[str]):
+            The lower and upper bound for years.
+        sex (str):
+            The sex of the sample.
+        locations (str):
+            The locations of the sample.
+        columns (list[str] | None, optional):
+            The columns to read. Defaults to all columns.
+
+    Returns:
+        pd.DataFrame:
+            The filtered dataframe.
+    """
+    dataset = ds.dataset(parquet_path, format="parquet", partitioning=PARQUET_PARTITIONING)
+    pandas_metadata = dataset.schema.pandas_metadata
+    dtypes = {
+        col["name"]: "category" if col["pandas_type"] == "categorical" else col["numpy_type"]
+        for col in pandas_metadata["columns"]
+        if col["name"] in dataset.schema.names
+    }
+    index_cols = pandas_metadata["index_columns"]
+
+    source_type = dataset.schema.field("source").type
+    if pa.types.is_dictionary(source_type):
+        source_type = source_type.value_type
+
+    expression = ds.field("sex") == sex
+    if len(locations) > 0:
+        if pa.types.is_string(source_type):
+            expression &= ds.field("source").isin(locations)
+        else:
+            # A source column without any strings, such as when all are missing.
+            expression &= ds.scalar(False)
+    if len(year_interval) > 0:
+        lower_year, upper_year = year_interval
+        expression &= (ds.field("year") >= float(lower_year)) & (
+            ds.field("year") <= float(upper_year)
+        )
+
+    if columns is None:
+        columns = [col for col in dtypes if col not in index_cols]
+    table = dataset.to_table(columns=index_cols + columns, filter=expression)
+
+    # The row labels are restored from the pandas metadata.
+    df = table.to_pandas().sort_index()
+    return df.astype({col: dtypes[col] for col in columns})
+
+
+def compact_df(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convert the data columns of a dataframe to their compact dtypes.
+
+    Categories are the sorted labels that are present, whichever file or
+    partitions the dataframe was read from.
+
+    Args:
+        df (pd.DataFrame):
+            The input dataframe.
+
+    Returns:
+        pd.DataFrame:
+            The dataframe, with categorical labels and single precision measurements.
+    """
+    df = df.astype({col: dtype for col, dtype in DATA_DTYPES.items() if col in df})
+    for col in df.select_dtypes("category"):
+        labels = df[col].cat.remove_unused_categories()
+        df[col] = labels.cat.reorder_categories(sorted(labels.cat.categories))
+    return df
+
+
+def get_factor_codes(values: pd.Series) -> tuple[np.ndarray, pd.Index]:
+    """
+    Get the integer codes and levels of a model factor.
+
+    Levels are in order of appearance, and missing values are coded as -1.
+    Categorical factors are coded from their category codes, such that the
+    values themselves are not hashed.
+
+    Args:
+        values (pd.Series):
+            The factor values.
+
+    Returns:
+        tuple[np.ndarray, pd.Index]:
+            The factor level index of each value, and the factor levels.
+    """
+    if not isinstance(values.dtype, pd.CategoricalDtype):
+        codes, levels = values.factorize()
+        return codes, pd.Index(np.asarray(levels))
+
+    category_codes = values.cat.codes.to_numpy()
+    present_codes = category_codes[category_codes >= 0]
+    _, first_index = np.unique(present_codes, return_index=True)
+    level_codes = present_codes[np.sort(first_index)]
+
+    # The last entry maps missing values to -1.
+    lookup = np.full(len(values.cat.categories) + 1, -1)
+    lookup[level_codes] = np.arange(len(level_codes))
+    codes = lookup[category_codes]
+    levels = values.cat.categories[level_codes]
+    return codes, pd.Index(np.asarray(levels))
+
+
 def get_df(
     data_dir: str,
     data_file: str,
@@ -47,10 +214,16 @@ def get_df(
     locations: str,
     response_var: str,
     explanatory_var: str,
+    columns: list[str] | None = None,
 ) -> pd.DataFrame:
     """
     Get the input dataframe.
 
+    If the preprocessing pipeline has written a Parquet copy of the data file
+    that is at least as recent, only the needed partitions and columns are read
+    from it. Loaded dataframes are cached by the modification time of the data.
+    Labels are categorical and measurements are single precision.
+
     Args:
         data_dir (str):
             The input data directory.
@@ -66,26 +239,64 @@ def get_df(
             The model response variable.
         explanatory_var (str):
             The model explanatory variable.
+        columns (list[str] | None, optional):
+            The columns to keep. Defaults to all columns.
 
     Returns:
         pd.DataFrame:
-            The loaded input dataframe.
+            A copy of the loaded input dataframe.
     """
     data_file = join_path(data_dir, data_file)
-    df = (
-        pd.read_csv(data_file)
-        .query("sex == @sex")
-        .dropna(subset=[response_var, explanatory_var])
+    parquet_path = os.path.splitext(data_file)[0] + PARQUET_SUFFIX
+    use_parquet = os.path.isdir(parquet_path) and (
+        os.path.getmtime(parquet_path) >= os.path.getmtime(data_file)
+    )
+    source_file = parquet_path if use_parquet else data_file
+
+    key = (
+        source_file,
+        os.path.getmtime(source_file),
+        tuple(year_interval),
+        sex,
+        tuple(locations),
+        response_var,
+        explanatory_var,
+        None if columns is None else tuple(columns),
     )
+    df = data_cache.get(key)
+    if df is not None:
+        data_cache.move_to_end(key)
+        return df.copy()
+
+    if use_parquet:
+        read_cols = None
+        if columns is not None:
+            read_cols = list(dict.fromkeys(columns + [response_var, explanatory_var]))
+        df = read_parquet_df(parquet_path, year_interval, sex, locations, read_cols)
+        df = df.dropna(subset=[response_var, explanatory_var])
+    else:
+        df = (
+            pd.read_csv(data_file, dtype=DATA_DTYPES)
+            .query("sex == @sex")
+            .dropna(subset=[response_var, explanatory_var])
+        )
 
-    if len(locations) > 0:
-        df = df.query("source in @locations")
+        if len(locations) > 0:
+            df = df.query("source in @locations")
 
-    if len(year_interval) > 0:
-        lower_year, upper_year = year_interval
-        df = df.query("year >= @lower_year & year <= @upper_year")
+        if len(year_interval) > 0:
+            lower_year, upper_year = year_interval
+            df = df.query("year >= @lower_year & year <= @upper_year")
 
-    return df
+    if columns is not None:
+        df = df[columns]
+    df = compact_df(df)
+
+    data_cache[key] = df
+    if len(data_cache) > DATA_CACHE_SIZE:
+        data_cache.popitem(last=False)
+
+    return df.copy()
 
 
 def fit_model(
@@ -99,7 +310,8 @@ def fit_model(
     factors: list[str],
     growth_curve: str = "",
     factor_data: dict[pm.MutableData] = {},
-    parameter_factors: dict[list[str]] = {}
+    parameter_factors: dict[list[str]] = {},
+    random_intercepts: str = "separate",
 ) -> None:
     """
     Fit a Bayesian model.
@@ -127,11 +339,13 @@ def fit_model(
             The factor level data. Defaults to {}.
         parameter_factors (dict[list[str]], optional):
             The map between parameters and factors. Defaults to {}.
+        random_intercepts (str, optional):
+            The random intercept construction. Defaults to "separate".
     """
     if model_type == "nonlinear":
         fit_nonlinear_model(
             model, priors, x, y, resp, likelihood, factors, 
-            growth_curve, factor_data, parameter_factors
+            growth_curve, factor_data, parameter_factors, random_intercepts
         )
     else:
         fit_linear_model(
@@ -140,6 +354,107 @@ def fit_model(
         )
 
 
+def get_prior_data(priors: dict) -> dict:
+    """
+    Create data containers for the prior means and standard deviations.
+
+    Args:
+        priors (dict):
+            The model priors.
+
+    Returns:
+        dict:
+            The model priors, with data containers for the means and standard deviations.
+    """
+    prior_data = {}
+    for k, prior in priors.items():
+        prior = dict(prior)
+        for param in ["mu", "sigma"]:
+            prior[param] = pm.MutableData(f"{k}_prior_{param}", prior[param])
+        prior_data[k] = prior
+
+    return prior_data
+
+
+def get_model_data(
+    x: np.ndarray,
+    y: np.ndarray,
+    resp: str,
+    factor_idx: dict[np.ndarray],
+    priors: dict,
+) -> dict:
+    """
+    Get the values of the model data containers.
+
+    Args:
+        x (np.ndarray):
+            The explanatory variable data.
+        y (np.ndarray):
+            The response variable data.
+        resp (str):
+            The model response.
+        factor_idx (dict[np.ndarray]):
+            The factor level indices for each factor.
+        priors (dict):
+            The model priors.
+
+    Returns:
+        dict:
+            The data container values, in model creation order.
+    """
+    model_data = {"x_idx": x, f"{resp}_data": y}
+    for col, factor in factor_idx.items():
+        model_data[f"{col}_indx"] = factor
+
+    for k, prior in priors.items():
+        for param in ["mu", "sigma"]:
+            model_data[f"{k}_prior_{param}"] = np.asarray(prior[param], dtype="float64")
+
+    return model_data
+
+
+def get_initial_points(
+    model: pm.Model, chains: int, random_seed: int, jitter_max_retries: int = 10
+) -> list[dict]:
+    """
+    Get jittered initial points for each MCMC chain.
+
+    Args:
+        model (pm.Model):
+            The PyMC model.
+        chains (int):
+            The number of MCMC chains.
+        random_seed (int):
+            The random seed.
+        jitter_max_retries (int, optional):
+            The maximum number of attempts to find a valid initial point. Defaults to 10.
+
+    Returns:
+        list[dict]:
+            The initial points for each chain.
+    """
+    rng = np.random.default_rng(random_seed)
+    ipfns = make_initial_point_fns_per_chain(
+        model=model,
+        overrides=None,
+        jitter_rvs=set(model.free_RVs),
+        chains=chains,
+    )
+
+    initial_points = []
+    for ipfn in ipfns:
+        for _ in range(jitter_max_retries + 1):
+            point = ipfn(int(rng.integers(2**30)))
+            try:
+                model.check_start_vals(point)
+            except SamplingError:
+                continue
+            break
+        initial_points.append(point)
+
+    return initial_points
+
+
 def vbgm(l_inf: float, k: float, t_0: float, t: np.ndarray) -> np.ndarray:
     """
     Fit a von Bertalanffy growth model.
@@ -206,7 +521,8 @@ def fit_nonlinear_model(
     factors: list[str],
     growth_curve: str = "",
     factor_data: dict[pm.MutableData] = {},
-    parameter_factors: dict[list[str]] = {}
+    parameter_factors: dict[list[str]] = {},
+    random_intercepts: str = "separate",
 ) -> None:
     """
     Fit a nonlinear Bayesian growth model.
@@ -232,6 +548,10 @@ def fit_nonlinear_model(
             The factor level data. Defaults to {}.
         parameter_factors (dict[list[str]], optional):
             The map between parameters and factors. Defaults to {}.
+        random_intercepts (str, optional):
+            The random intercept construction. Either "separate" random intercepts
+            for each parameter and factor, or "stacked" random intercepts for
+            each factor. Defaults to "separate".
     """
     sigma = pm.HalfStudentT("sigma", nu=3, sigma=10)
 
@@ -245,6 +565,9 @@ def fit_nonlinear_model(
             growth_func_kwargs[k] = pm.TruncatedNormal(**prior)
         else:
             growth_func_kwargs[k] = pm.Normal(**prior)
+
+        if random_intercepts == "stacked":
+            continue
         
         factor_levels = parameter_factors.get(k, [])
         for factor in factor_levels:
@@ -257,6 +580,11 @@ def fit_nonlinear_model(
 
             indx = factor_data.get(factor)
             growth_func_kwargs[k] += alpha[indx]
+
+    if random_intercepts == "stacked":
+        add_stacked_random_intercepts(
+            model, growth_func_kwargs, priors, factor_data, parameter_factors
+        )
         
     if likelihood == "student_t":
         obs = pm.StudentT(
@@ -268,6 +596,80 @@ def fit_nonlinear_model(
         )
 
 
+def get_stacked_factor_params(priors: dict, parameter_factors: dict[list[str]]) -> dict[list[str]]:
+    """
+    Get the parameters with random intercepts for each factor.
+
+    Args:
+        priors (dict):
+            The model priors.
+        parameter_factors (dict[list[str]]):
+            The map between parameters and factors.
+
+    Returns:
+        dict[list[str]]:
+            The map between factors and parameters, in prior order.
+    """
+    factor_params = {}
+    for k in priors:
+        for factor in parameter_factors.get(k, []):
+            factor_params.setdefault(factor, []).append(k)
+
+    return factor_params
+
+
+def add_stacked_random_intercepts(
+    model: pm.Model,
+    growth_func_kwargs: dict,
+    priors: dict,
+    factor_data: dict[pm.MutableData],
+    parameter_factors: dict[list[str]],
+) -> None:
+    """
+    Add stacked random intercepts to the growth curve parameters.
+
+    The random intercepts of all parameters sharing a factor are stacked into
+    a single (parameter, level) tensor, with a single index gather per factor.
+    The model is equivalent to separate random intercepts for each parameter
+    and factor.
+
+    Args:
+        model (pm.Model):
+            The PyMC model.
+        growth_func_kwargs (dict):
+            The growth curve parameters. Updated in place.
+        priors (dict):
+            The model priors.
+        factor_data (dict[pm.MutableData]):
+            The factor level data.
+        parameter_factors (dict[list[str]]):
+            The map between parameters and factors.
+    """
+    factor_params = get_stacked_factor_params(priors, parameter_factors)
+
+    for factor, params in factor_params.items():
+        param_dim = f"{factor}_param"
+        if param_dim not in model.coords:
+            model.add_coord(param_dim, params)
+
+        alpha_name = f"{factor}_alpha"
+        prior_sigma = pt.stack([priors[k]["sigma"] for k in params])
+        # Non-centered parameterization for random intercepts.
+        mu_a = pm.Normal(f"{alpha_name}_mu", mu=0.0, sigma=prior_sigma, dims=param_dim)
+        sigma_a = pm.HalfStudentT(
+            f"{alpha_name}_sigma", nu=4, sigma=prior_sigma, dims=param_dim
+        )
+        z_a = pm.Normal(f"{alpha_name}_z", mu=0, sigma=1, dims=(param_dim, factor))
+        alpha = pm.Deterministic(
+            alpha_name, mu_a[:, None] + z_a * sigma_a[:, None], dims=(param_dim, factor)
+        )
+
+        indx = factor_data.get(factor)
+        alpha_obs = alpha[:, indx]
+        for i, k in enumerate(params):
+            growth_func_kwargs[k] += alpha_obs[i]
+
+
 def fit_linear_model(
     model: pm.Model, priors: dict, x, y, resp: str, likelihood: str, 
     factors: list[str], factor_data: dict[pm.MutableData] = {}, 
@@ -319,9 +721,116 @@ def fit_linear_model(
         obs = pm.Normal(resp, mu=intercept + slope * x, sigma=sigma, observed=y)
 
 
-def plot_bayes_model(trace, out_dir: str, hdi_prob: float = 0.95):
+def hash_posterior(posterior: xr.Dataset) -> str:
+    """
+    Hash the draws and coordinates of a posterior.
+
+    Args:
+        posterior (xr.Dataset):
+            The posterior draws.
+
+    Returns:
+        str:
+            The content hash.
+    """
+    digest = hashlib.sha256()
+    for name in sorted(posterior.coords):
+        digest.update(name.encode())
+        digest.update(str(posterior.coords[name].values.tolist()).encode())
+
+    for name in sorted(posterior.data_vars):
+        values = np.ascontiguousarray(posterior[name].values)
+        digest.update(name.encode())
+        digest.update(str(values.shape).encode())
+        digest.update(values.tobytes())
+
+    return digest.hexdigest()
+
+
+def get_summary_key(posterior: xr.Dataset) -> tuple:
+    """
+    Get the cache key of the summary table of a posterior.
+
+    Posteriors loaded from a file are keyed by the file path, modification
+    time, and size, such that their draws are not read from disk. Other
+    posteriors are keyed by their content hash.
+
+    Args:
+        posterior (xr.Dataset):
+            The posterior draws.
+
+    Returns:
+        tuple:
+            The cache key.
+    """
+    source = posterior.encoding.get("source")
+    if source is not None and os.path.exists(source):
+        stat = os.stat(source)
+        return (source, stat.st_mtime_ns, stat.st_size)
+    return (hash_posterior(posterior),)
+
+
+def get_summary(trace, hdi_prob: float = 0.95) -> pd.DataFrame:
+    """
+    Get the summary table of a trace, computing it only once per posterior.
+
+    Summaries are cached by the trace file or the content of the posterior,
+    such that a changed trace is summarised again.
+
+    Args:
+        trace (Trace):
+            The model trace.
+        hdi_prob (float, optional):
+            The highest density interval probability. Defaults to 0.95.
+
+    Returns:
+        pd.DataFrame: A copy of the summary table.
+    """
+    key = (*get_summary_key(trace.posterior), hdi_prob)
+    summary_df = summary_cache.get(key)
+
+    if summary_df is None:
+        summary_df = az.summary(trace, hdi_prob=hdi_prob)
+        summary_cache[key] = summary_df
+        if len(summary_cache) > SUMMARY_CACHE_SIZE:
+            summary_cache.popitem(last=False)
+    else:
+        summary_cache.move_to_end(key)
+
+    return summary_df.copy()
+
+
+def share_summary(trace, other_trace) -> None:
     """
-    Plot Bayesian modelling results.
+    Cache the summary tables of a trace under the key of another copy of its posterior.
+
+    A trace reloaded from the file it was saved to is keyed by the file,
+    such that it would otherwise be summarised again.
+
+    Args:
+        trace (Trace):
+            The summarised model trace.
+        other_trace (Trace):
+            The copy of the model trace.
+    """
+    if not summary_cache:
+        return
+
+    trace_key = get_summary_key(trace.posterior)
+    other_key = get_summary_key(other_trace.posterior)
+    for key, summary_df in list(summary_cache.items()):
+        if key[:-1] == trace_key:
+            summary_cache[(*other_key, key[-1])] = summary_df
+
+    while len(summary_cache) > SUMMARY_CACHE_SIZE:
+        summary_cache.popitem(last=False)
+
+
+def plot_bayes_model(
+    trace, out_dir: str, hdi_prob: float = 0.95, artifacts: ArtifactRenderer = None
+):
+    """
+    Summarise and plot Bayesian modelling results.
 
     Args:
         trace (Trace):
@@ -330,22 +839,75 @@ def plot_bayes_model(trace, out_dir: str, hdi_prob: float = 0.95):
             The output directory.
         hdi_prob (float, optional):
             The highest density interval probability. Defaults to 0.95.
+        artifacts (ArtifactRenderer, optional):
+            The renderer for the plots. Plots are rendered synchronously if None.
+            Defaults to None.
 
     Returns:
         Trace: The model trace.
     """
+    outfile = join_path(out_dir, "summary.csv")
+    get_summary(trace, hdi_prob).to_csv(outfile)
+
+    if artifacts is None:
+        plot_trace_diagnostics(trace, out_dir)
+    else:
+        artifacts.submit(plot_trace_diagnostics, trace, out_dir)
+
+    return trace
+
+
+def save_figure(
+    outfile: str, fig: plt.Figure | None = None, tight_layout: bool = True
+) -> str:
+    """
+    Save a figure, then close it.
+
+    Figures are closed even if saving fails, such that they are never kept
+    in the global state of pyplot.
+
+    Args:
+        outfile (str):
+            The output file.
+        fig (plt.Figure | None, optional):
+            The figure. Defaults to the current figure.
+        tight_layout (bool, optional):
+            Adjust the subplot padding before saving. Defaults to True.
+
+    Returns:
+        str: The output file.
+    """
+    if fig is None:
+        fig = plt.gcf()
+
+    try:
+        if tight_layout:
+            fig.tight_layout()
+        fig.savefig(outfile)
+    finally:
+        plt.close(fig)
+
+    return outfile
+
+
+def plot_trace_diagnostics(trace, out_dir: str) -> None:
+    """
+    Plot the trace, rank, pair, violin, posterior, and posterior predictive plots.
+
+    Args:
+        trace (Trace):
+            The model trace, including the posterior predictive group.
+        out_dir (str):
+            The output directory.
+    """
     textsize = 7
     for plot in ["trace", "rank_vlines", "rank_bars"]:
         az.plot_trace(trace, kind=plot, plot_kwargs={"textsize": textsize})
-        outfile = join_path(out_dir, f"{plot}.png")
-        plt.tight_layout()
-        plt.savefig(outfile)
+        save_figure(join_path(out_dir, f"{plot}.png"))
 
     def __create_plot(trace, plot_func, plot_name, kwargs):
         plot_func(trace, **kwargs)
-        outfile = join_path(out_dir, f"{plot_name}.png")
-        plt.tight_layout()
-        plt.savefig(outfile)
+        save_figure(join_path(out_dir, f"{plot_name}.png"))
 
     kwargs = {
         "figsize": (12, 12),
@@ -361,22 +923,447 @@ def plot_bayes_model(trace, out_dir: str, hdi_prob: float = 0.95):
     kwargs = {"figsize": (12, 12), "textsize": 5}
     __create_plot(trace, az.plot_posterior, "posterior", kwargs)
 
-    outfile = join_path(out_dir, "summary.csv")
-    az.summary(trace, hdi_prob=hdi_prob).to_csv(outfile)
-
-    pm.sample_posterior_predictive(trace, extend_inferencedata=True, progressbar=False)
-
     kwargs = {"figsize": (12, 12), "textsize": textsize}
     __create_plot(trace, az.plot_ppc, "ppc", kwargs)
 
+
+def render_model_graph(pgm, out_dir: str) -> str:
+    """
+    Render the graph of a model.
+
+    Args:
+        pgm (graphviz.Digraph):
+            The model graph.
+        out_dir (str):
+            The output directory.
+
+    Returns:
+        str: The output file.
+    """
+    return pgm.render(format="png", directory=out_dir, filename="model_graph")
+
+
+def get_flat_draws(draws: xr.DataArray, samples: slice = slice(None)) -> np.ndarray:
+    """
+    Get a slice of the draws of a posterior variable, flattened over chains.
+
+    Args:
+        draws (xr.DataArray):
+            The posterior draws, with leading chain and draw dimensions.
+        samples (slice, optional):
+            The flattened draws to select. Defaults to slice(None).
+
+    Returns:
+        np.ndarray:
+            The selected draws.
+    """
+    values = draws.values
+    return values.reshape(-1, *values.shape[2:])[samples]
+
+
+def get_random_intercepts(
+    posterior: xr.Dataset, constant_data: xr.Dataset, k: str, samples: slice = slice(None)
+) -> list[tuple[np.ndarray, np.ndarray]]:
+    """
+    Get the random intercepts of a growth curve parameter.
+
+    Args:
+        posterior (xr.Dataset):
+            The posterior draws.
+        constant_data (xr.Dataset):
+            The model data.
+        k (str):
+            The growth curve parameter.
+        samples (slice, optional):
+            The flattened draws to select. Defaults to slice(None).
+
+    Returns:
+        list[tuple[np.ndarray, np.ndarray]]:
+            The random intercepts, with shape (draw, level), and the factor level
+            index of each observation, for each factor.
+    """
+    factors = [
+        name.removesuffix("_indx")
+        for name in constant_data.data_vars
+        if name.endswith("_indx") and name != "group_indx"
+    ]
+
+    random_intercepts = []
+    for factor in factors:
+        indx = constant_data[f"{factor}_indx"].values
+
+        alpha_name = f"{k}_{factor}_alpha"
+        if alpha_name in posterior:
+            alpha = get_flat_draws(posterior[alpha_name], samples)
+            random_intercepts.append((alpha, indx))
+
+        # Stacked random intercepts share a single (parameter, level) variable per factor.
+        param_dim = f"{factor}_param"
+        if f"{factor}_alpha" in posterior and k in posterior[param_dim]:
+            alpha = posterior[f"{factor}_alpha"].sel({param_dim: k})
+            random_intercepts.append((get_flat_draws(alpha, samples), indx))
+
+    return random_intercepts
+
+
+def get_predictive_mean(
+    posterior: xr.Dataset,
+    constant_data: xr.Dataset,
+    model_type: str,
+    params: list[str],
+    growth_curve: str = "",
+    samples: slice = slice(None),
+) -> np.ndarray:
+    """
+    Get the mean of the likelihood for each posterior draw and observation.
+
+    Growth parameters indexed by group are selected for the group of each
+    observation, and the random intercepts of each factor level are added
+    to the growth parameters.
+
+    Args:
+        posterior (xr.Dataset):
+            The posterior draws.
+        constant_data (xr.Dataset):
+            The model data.
+        model_type (str):
+            The model type.
+        params (list[str]):
+            The growth curve parameters.
+        growth_curve (str, optional):
+            The nonlinear growth curve. Defaults to "".
+        samples (slice, optional):
+            The flattened draws to select. Defaults to slice(None).
+
+    Returns:
+        np.ndarray:
+            The mean, with shape (draw, observation).
+    """
+    x = constant_data["x_idx"].values
+
+    if model_type != "nonlinear":
+        intercept = get_flat_draws(posterior["intercept"], samples)
+        slope = get_flat_draws(posterior["slope"], samples)
+        return intercept[:, None] + slope[:, None] * x
+
+    group_idx = None
+    if "group_indx" in constant_data:
+        group_idx = constant_data["group_indx"].values
+
+    growth_func_kwargs = {"t": x}
+    for k in params:
+        theta = get_flat_draws(posterior[k], samples)
+        if theta.ndim > 1:
+            theta = theta[:, group_idx]
+        else:
+            theta = theta[:, None]
+
+        for alpha, indx in get_random_intercepts(posterior, constant_data, k, samples):
+            theta = theta + alpha[:, indx]
+
+        growth_func_kwargs[k] = theta
+
+    growth_func = growth_func_map.get(growth_curve, vbgm)
+    return growth_func(**growth_func_kwargs)
+
+
+def get_predictive_sigma(
+    posterior: xr.Dataset, constant_data: xr.Dataset, samples: slice = slice(None)
+) -> np.ndarray:
+    """
+    Get the observation error for each posterior draw and observation.
+
+    Args:
+        posterior (xr.Dataset):
+            The posterior draws.
+        constant_data (xr.Dataset):
+            The model data.
+        samples (slice, optional):
+            The flattened draws to select. Defaults to slice(None).
+
+    Returns:
+        np.ndarray:
+            The observation error, with shape (draw, observation).
+    """
+    sigma = get_flat_draws(posterior["sigma"], samples)
+    if sigma.ndim > 1:
+        return sigma[:, constant_data["group_indx"].values]
+    return sigma[:, None]
+
+
+def sample_truncated_normal(
+    rng: np.random.Generator, mu: np.ndarray, sigma: np.ndarray, lower: float = 0.0
+) -> np.ndarray:
+    """
+    Sample from a lower truncated normal distribution by inverting its CDF.
+
+    Args:
+        rng (np.random.Generator):
+            The random number generator.
+        mu (np.ndarray):
+            The mean of the untruncated distribution.
+        sigma (np.ndarray):
+            The standard deviation of the untruncated distribution.
+        lower (float, optional):
+            The lower bound. Defaults to 0.0.
+
+    Returns:
+        np.ndarray:
+            The samples.
+    """
+    # Invert the upper tail, which stays accurate when the mean is far below the bound.
+    tail = special.ndtr((mu - lower) / sigma)
+    u = 1.0 - rng.uniform(size=np.shape(mu))
+    return mu - sigma * special.ndtri(u * tail)
+
+
+def add_posterior_predictive(
+    trace,
+    model_type: str,
+    likelihood: str,
+    params: list[str],
+    resp: str = "y",
+    growth_curve: str = "",
+    random_seed: int | None = None,
+    chunk_size: int = POINTWISE_CHUNK_SIZE,
+):
+    """
+    Sample the posterior predictive distribution, and add it to the trace.
+
+    Predictions are computed from the posterior draws with NumPy, rather than
+    by compiling the model's forward graph. Draws are processed in chunks,
+    such that the memory of intermediate arrays stays bounded.
+
+    Args:
+        trace (Trace):
+            The model trace.
+        model_type (str):
+            The model type.
+        likelihood (str):
+            The model likelihood.
+        params (list[str]):
+            The growth curve parameters.
+        resp (str, optional):
+            The model response. Defaults to "y".
+        growth_curve (str, optional):
+            The nonlinear growth curve. Defaults to "".
+        random_seed (int | None, optional):
+            The random seed. Defaults to None.
+        chunk_size (int, optional):
+            The maximum number of predictions per chunk. Defaults to POINTWISE_CHUNK_SIZE.
+
+    Returns:
+        Trace: The model trace.
+    """
+    rng = np.random.default_rng(random_seed)
+    posterior = trace.posterior
+    constant_data = trace.constant_data
+    observed = trace.observed_data[resp]
+
+    n_chains = posterior.sizes["chain"]
+    n_draws = posterior.sizes["draw"]
+    n_obs = observed.size
+    y_pp = np.empty((n_chains * n_draws, n_obs))
+
+    chunk_draws = max(1, chunk_size // n_obs)
+    for start in range(0, n_chains * n_draws, chunk_draws):
+        samples = slice(start, start + chunk_draws)
+        mu = get_predictive_mean(
+            posterior, constant_data, model_type, params, growth_curve, samples
+        )
+        sigma = get_predictive_sigma(posterior, constant_data, samples)
+
+        if likelihood == "student_t":
+            y_pp[samples] = mu + sigma * rng.standard_t(3, size=mu.shape)
+        elif model_type == "nonlinear":
+            y_pp[samples] = sample_truncated_normal(rng, mu, sigma)
+        else:
+            y_pp[samples] = rng.normal(mu, sigma)
+
+    coords = {"chain": posterior.chain.values, "draw": posterior.draw.values}
+    coords.update({dim: observed[dim].values for dim in observed.dims})
+    dataset = dict_to_dataset(
+        {resp: y_pp.reshape(n_chains, n_draws, *observed.shape)},
+        library=pm,
+        coords=coords,
+        dims={resp: list(observed.dims)},
+    )
+    trace.extend(az.InferenceData(posterior_predictive=dataset), join="right")
+    return trace
+
+
+def get_pointwise_log_likelihood(
+    y: np.ndarray,
+    mu: np.ndarray,
+    sigma: np.ndarray,
+    model_type: str,
+    likelihood: str,
+) -> np.ndarray:
+    """
+    Get the log-likelihood of each observation.
+
+    Args:
+        y (np.ndarray):
+            The response variable data.
+        mu (np.ndarray):
+            The mean of the likelihood.
+        sigma (np.ndarray):
+            The observation error.
+        model_type (str):
+            The model type.
+        likelihood (str):
+            The model likelihood.
+
+    Returns:
+        np.ndarray:
+            The pointwise log-likelihood.
+    """
+    if likelihood == "student_t":
+        return stats.t.logpdf(y, 3, loc=mu, scale=sigma)
+
+    log_lik = stats.norm.logpdf(y, loc=mu, scale=sigma)
+    if model_type == "nonlinear":
+        # Normalise by the probability mass above the lower bound of zero.
+        log_lik -= special.log_ndtr(mu / sigma)
+    return log_lik
+
+
+def add_log_likelihood(
+    trace,
+    model_type: str,
+    likelihood: str,
+    params: list[str],
+    resp: str = "y",
+    growth_curve: str = "",
+    dtype: str = "float64",
+    out_file: str | None = None,
+    chunk_size: int = POINTWISE_CHUNK_SIZE,
+):
+    """
+    Compute the pointwise log-likelihood, and add it to the trace.
+
+    The log-likelihood is computed from the posterior draws with NumPy, in
+    chunks of draws, such that only the stored array grows with the number
+    of draws and observations. The stored array may use a smaller dtype, or
+    be memory-mapped from disk.
+
+    Args:
+        trace (Trace):
+            The model trace.
+        model_type (str):
+            The model type.
+        likelihood (str):
+            The model likelihood.
+        params (list[str]):
+            The growth curve parameters.
+        resp (str, optional):
+            The model response. Defaults to "y".
+        growth_curve (str, optional):
+            The nonlinear growth curve. Defaults to "".
+        dtype (str, optional):
+            The dtype of the stored log-likelihood. Defaults to "float64".
+        out_file (str | None, optional):
+            The .npy file to memory-map the log-likelihood to. Kept in memory if None.
+            Defaults to None.
+        chunk_size (int, optional):
+            The maximum number of log-likelihoods per chunk. Defaults to POINTWISE_CHUNK_SIZE.
+
+    Returns:
+        Trace: The model trace.
+    """
+    posterior = trace.posterior
+    constant_data = trace.constant_data
+    observed = trace.observed_data[resp]
+    y = observed.values.reshape(-1)
+
+    n_chains = posterior.sizes["chain"]
+    n_draws = posterior.sizes["draw"]
+    shape = (n_chains * n_draws, y.size)
+    if out_file is None:
+        log_lik = np.empty(shape, dtype=dtype)
+    else:
+        # Traces still in use keep their mapping of a replaced file.
+        if os.path.exists(out_file):
+            os.remove(out_file)
+        log_lik = np.lib.format.open_memmap(out_file, mode="w+", dtype=dtype, shape=shape)
+
+    chunk_draws = max(1, chunk_size // y.size)
+    for start in range(0, n_chains * n_draws, chunk_draws):
+        samples = slice(start, start + chunk_draws)
+        mu = get_predictive_mean(
+            posterior, constant_data, model_type, params, growth_curve, samples
+        )
+        sigma = get_predictive_sigma(posterior, constant_data, samples)
+        log_lik[samples] = get_pointwise_log_likelihood(
+            y, mu, sigma, model_type, likelihood
+        )
+
+    coords = {"chain": posterior.chain.values, "draw": posterior.draw.values}
+    coords.update({dim: observed[dim].values for dim in observed.dims})
+    dataset = dict_to_dataset(
+        {resp: log_lik.reshape(n_chains, n_draws, *observed.shape)},
+        library=pm,
+        coords=coords,
+        dims={resp: list(observed.dims)},
+    )
+    trace.extend(az.InferenceData(log_likelihood=dataset), join="right")
     return trace
 
 
+def compute_elpd(trace, method: str = "loo") -> az.ELPDData:
+    """
+    Estimate the expected log pointwise predictive density of a trace.
+
+    Args:
+        trace (Trace):
+            The model trace, including the pointwise log-likelihood.
+        method (str, optional):
+            The information criterion, either "loo" or "waic". Defaults to "loo".
+
+    Returns:
+        az.ELPDData:
+            The ELPD estimate, with pointwise values.
+    """
+    if method == "waic":
+        return az.waic(trace, pointwise=True)
+    return az.loo(trace, pointwise=True)
+
+
+def drop_log_likelihood(trace):
+    """
+    Drop the pointwise log-likelihood from a trace.
+
+    A new trace is returned that shares the remaining groups, as the original
+    trace may still be queued for rendering.
+
+    Args:
+        trace (Trace):
+            The model trace.
+
+    Returns:
+        Trace: The model trace, without the pointwise log-likelihood.
+    """
+    return az.InferenceData(
+        **{group: trace[group] for group in trace.groups() if group != "log_likelihood"}
+    )
+
+
 def get_mu_pp(
-    trace, model_type: str, x: np.ndarray, priors: dict, growth_curve: str = ""
+    trace,
+    model_type: str,
+    x: np.ndarray,
+    priors: dict,
+    growth_curve: str = "",
+    n_grid: int | None = MU_PP_GRID_SIZE,
+    thin: int = 1,
+    chunk_size: int = POINTWISE_CHUNK_SIZE,
 ) -> xr.DataArray:
     """
-    Get the mean posterior predictions.
+    Get the mean posterior predictions over a grid of explanatory variable values.
+
+    The growth curve parameters include the mean random intercept over the
+    observations. Draws are evaluated in chunks, such that memory scales
+    with the grid size rather than the number of observations.
 
     Args:
         trace (Trace):
@@ -389,23 +1376,55 @@ def get_mu_pp(
             The model priors.
         growth_curve: (str):
             The nonlinear growth curve.
+        n_grid (int | None, optional):
+            The number of evenly spaced grid values over the range of x. The unique
+            values of x are used if None. Defaults to MU_PP_GRID_SIZE.
+        thin (int, optional):
+            Keep every thin-th draw of each chain. Defaults to 1.
+        chunk_size (int, optional):
+            The maximum number of predictions per chunk. Defaults to POINTWISE_CHUNK_SIZE.
 
     Returns:
-        xr.DataArray: The mean posterior predictions.
+        xr.DataArray: The mean posterior predictions, with the grid as the "x" coordinate.
     """
-    post = trace.posterior
-
-    if model_type == "nonlinear":
-        kwargs = {"t": xr.DataArray(x, dims=["obs_id"])}
-        for k in priors:
-            kwargs[k] = post[k]
-
-        growth_func = growth_func_map.get(growth_curve, "vbgm")
-        mu_pp = growth_func(**kwargs)
+    post = trace.posterior.isel(draw=slice(None, None, thin))
+    if n_grid is None:
+        grid = np.unique(x)
     else:
-        mu_pp = post["intercept"] + post["slope"] * xr.DataArray(x, dims=["obs_id"])
-
-    return mu_pp
+        grid = np.linspace(np.min(x), np.max(x), n_grid)
+
+    n_chains = post.sizes["chain"]
+    n_draws = post.sizes["draw"]
+    mu_pp = np.empty((n_chains * n_draws, grid.size))
+
+    chunk_draws = max(1, chunk_size // grid.size)
+    for start in range(0, n_chains * n_draws, chunk_draws):
+        samples = slice(start, start + chunk_draws)
+        if model_type != "nonlinear":
+            intercept = get_flat_draws(post["intercept"], samples)
+            slope = get_flat_draws(post["slope"], samples)
+            mu_pp[samples] = intercept[:, None] + slope[:, None] * grid
+            continue
+
+        growth_func_kwargs = {"t": grid}
+        for k in priors:
+            theta = get_flat_draws(post[k], samples)
+            for alpha, indx in get_random_intercepts(
+                post, trace.constant_data, k, samples
+            ):
+                # The mean over observations weights each level by its number of observations.
+                weights = np.bincount(indx, minlength=alpha.shape[1]) / indx.size
+                theta = theta + alpha @ weights
+            growth_func_kwargs[k] = theta[:, None]
+
+        growth_func = growth_func_map.get(growth_curve, vbgm)
+        mu_pp[samples] = growth_func(**growth_func_kwargs)
+
+    return xr.DataArray(
+        mu_pp.reshape(n_chains, n_draws, grid.size),
+        dims=["chain", "draw", "x"],
+        coords={"chain": post.chain.values, "draw": post.draw.values, "x": grid},
+    )
 
 
 def plot_preds(
@@ -442,10 +1461,10 @@ def plot_preds(
     Returns:
         str: The output file.
     """
-    _, ax = plt.subplots()
+    fig, ax = plt.subplots()
 
     ax.plot(
-        x,
+        mu_pp["x"],
         mu_pp.mean(("chain", "draw")),
         label=f"Mean {response_var}",
         color="C1",
@@ -456,10 +1475,27 @@ def plot_preds(
 
     ax.set_xlabel(explanatory_var)
     ax.set_ylabel(response_var)
-    plt.tight_layout()
     outfile = join_path(out_dir, f"{response_var}_{explanatory_var}.png")
-    plt.savefig(outfile)
-    return outfile
+    return save_figure(outfile, fig)
+
+
+def plot_model_scores(model_scores_df: pd.DataFrame, outfile: str) -> str:
+    """
+    Plot the comparison of candidate models.
+
+    Args:
+        model_scores_df (pd.DataFrame):
+            The model comparison scores.
+        outfile (str):
+            The output file.
+
+    Returns:
+        str: The output file.
+    """
+    az.plot_compare(
+        model_scores_df, plot_standard_error=True, plot_ic_diff=True, order_by_rank=True, legend=True, title=True
+    )
+    return save_figure(outfile, tight_layout=False)
 
 
 def get_trace_dict_key(
@@ -0,0 +1,382 @@
+######################################
+# Imports
+######################################
+
+# External
+import argparse
+from behave.parser import parse_file
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from glob import glob
+import os
+from os.path import basename, join as join_path
+from pathlib import Path
+import re
+import subprocess
+import sys
+import tempfile
+import xml.etree.ElementTree as ElementTree
+
+# Internal
+from features.steps.data_model import RunSettings
+
+######################################
+# Constants
+######################################
+
+FIT_STEP = "we fit our Bayesian model"
+JOINT_STEP = "we are jointly fitting the following groups"
+COMPARE_PATTERN = re.compile(r'we compare the following candidate models "(.*)"')
+CHAINS_PATTERN = re.compile(
+    r'we are running "(\d+)" Markov chain Monte Carlo \(MCMC\) chains with parallelisation "(\w+)"'
+)
+GROWTH_CURVE_PATTERN = re.compile(r'our growth curve is a ".*" \("(.*)"\)')
+SEX_PATTERN = re.compile(r'our sex is "(.*)"')
+LIST_PATTERN = re.compile(r",\s*(?:and\s+)?|\s+and\s+")
+
+######################################
+# Classes
+######################################
+
+
+@dataclass
+class ScenarioNode:
+    """A scenario in the dependency graph of the behaviour tests."""
+
+    index: int
+    feature_file: str
+    line: int
+    name: str
+    cost: int = 1
+    sex: str = ""
+    growth_curve: str = ""
+    joint: bool | None = None
+    candidate_models: list[str] = field(default_factory=list)
+    dependencies: list[int] = field(default_factory=list)
+
+    @property
+    def location(self) -> str:
+        return f"{self.feature_file}:{self.line}"
+
+
+######################################
+# Functions
+######################################
+
+
+def match_steps(steps: list, pattern: re.Pattern) -> re.Match | None:
+    """
+    Get the last step matching a pattern.
+
+    Args:
+        steps (list):
+            The scenario steps.
+        pattern (re.Pattern):
+            The step pattern.
+
+    Returns:
+        re.Match | None:
+            The pattern match, or None if no step matches.
+    """
+    matched = None
+    for step in steps:
+        match = pattern.fullmatch(step.name)
+        if match is not None:
+            matched = match
+    return matched
+
+
+def build_graph(
+    feature_files: list[str], tags: list[str], cores: int, plot_workers: int = 0
+) -> list[ScenarioNode]:
+    """
+    Build the dependency graph of fit and compare scenarios.
+
+    A compare scenario depends on the fit scenarios of its candidate models
+    that precede it in the same feature and share its sex.
+
+    Args:
+        feature_files (list[str]):
+            The feature files.
+        tags (list[str]):
+            Run scenarios with any of these tags. Run all scenarios if empty.
+        cores (int):
+            The core budget. Scenario costs are capped at this budget.
+        plot_workers (int, optional):
+            The number of plot rendering processes of each scenario. Defaults to 0.
+
+    Returns:
+        list[ScenarioNode]:
+            The scenarios in serial execution order.
+    """
+    nodes = []
+
+    for feature_file in feature_files:
+        feature = parse_file(feature_file)
+        if feature is None:
+            continue
+
+        background = feature.background.steps if feature.background else []
+        fits = []
+        for scenario in feature.walk_scenarios():
+            scenario_tags = set(feature.tags) | set(scenario.tags)
+            if len(tags) > 0 and scenario_tags.isdisjoint(tags):
+                continue
+
+            steps = list(background) + list(scenario.steps)
+            node = ScenarioNode(len(nodes), feature_file, scenario.line, scenario.name)
+            n_chains = 1
+
+            sex = match_steps(steps, SEX_PATTERN)
+            if sex is not None:
+                node.sex = sex.group(1)
+
+            if any(step.name == FIT_STEP for step in steps):
+                growth_curve = match_steps(steps, GROWTH_CURVE_PATTERN)
+                if growth_curve is not None:
+                    node.growth_curve = growth_curve.group(1)
+
+                chains = match_steps(steps, CHAINS_PATTERN)
+                if chains is not None and chains.group(2).lower() == "enabled":
+                    n_chains = int(chains.group(1))
+                node.joint = any(step.name == JOINT_STEP for step in steps)
+                fits.append(node)
+
+            node.cost = min(n_chains + plot_workers, cores)
+
+            compare = match_steps(steps, COMPARE_PATTERN)
+            if compare is not None:
+                node.candidate_models = LIST_PATTERN.split(compare.group(1).strip())
+                node.dependencies = [
+                    fit.index
+                    for fit in fits
+                    if fit.sex == node.sex
+                    and fit.growth_curve in node.candidate_models
+                ]
+
+            nodes.append(node)
+
+    return nodes
+
+
+def check_joint_fits(nodes: list[ScenarioNode]) -> None:
+    """
+    Check that the selected scenarios only fit either joint or separate models.
+
+    Joint fits write the outputs and traces of each group to the same
+    directories as separate fits, such that both cannot run together.
+
+    Args:
+        nodes (list[ScenarioNode]):
+            The scenarios of the run.
+
+    Raises:
+        ValueError:
+            Error raised when both joint and separate fit scenarios are selected.
+    """
+    joint_fits = {node.joint for node in nodes if node.joint is not None}
+    if len(joint_fits) > 1:
+        raise ValueError(
+            "Joint and separate models cannot be fitted in the same run. "
+            "Run the joint feature on its own."
+        )
+
+
+def run_scenario(
+    node: ScenarioNode, junit_dir: str | None, behave_args: list[str]
+) -> tuple[int, str]:
+    """
+    Run a single scenario in a behave subprocess.
+
+    Args:
+        node (ScenarioNode):
+            The scenario.
+        junit_dir (str | None):
+            The junit output directory of the scenario. Disabled if None.
+        behave_args (list[str]):
+            Additional behave arguments.
+
+    Returns:
+        tuple[int, str]:
+            The exit code and output of behave.
+    """
+    cmd = [sys.executable, "-m", "behave", node.location, *behave_args]
+    if junit_dir is not None:
+        cmd += ["--junit", "--junit-directory", junit_dir]
+
+    result = subprocess.run(
+        cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True
+    )
+    return result.returncode, result.stdout
+
+
+def merge_junit(nodes: list[ScenarioNode], tmp_dir: str, junit_dir: str) -> list[str]:
+    """
+    Merge the junit reports of each scenario into a report per feature.
+
+    Test cases are ordered as they would be in a serial run.
+
+    Args:
+        nodes (list[ScenarioNode]):
+            The scenarios in serial execution order.
+        tmp_dir (str):
+            The directory containing the junit reports of each scenario.
+        junit_dir (str):
+            The junit output directory.
+
+    Returns:
+        list[str]:
+            The merged junit report files.
+    """
+    suites = {}
+    for node in nodes:
+        for report in sorted(glob(join_path(tmp_dir, str(node.index), "*.xml"))):
+            suite = ElementTree.parse(report).getroot()
+            report_name = basename(report)
+
+            if report_name not in suites:
+                merged = ElementTree.Element("testsuite", suite.attrib)
+                for counter in ["tests", "errors", "failures", "skipped"]:
+                    merged.set(counter, "0")
+                merged.set("time", "0")
+                suites[report_name] = merged
+
+            merged = suites[report_name]
+            for counter in ["tests", "errors", "failures", "skipped"]:
+                count = int(merged.get(counter)) + int(suite.get(counter, 0))
+                merged.set(counter, str(count))
+            time = float(merged.get("time")) + float(suite.get("time", 0))
+            merged.set("time", str(round(time, 6)))
+            merged.extend(suite.findall("testcase"))
+
+    Path(junit_dir).mkdir(parents=True, exist_ok=True)
+    report_files = []
+    for report_name, suite in suites.items():
+        report_file = join_path(junit_dir, report_name)
+        ElementTree.ElementTree(suite).write(
+            report_file, encoding="UTF-8", xml_declaration=True
+        )
+        report_files.append(report_file)
+
+    return report_files
+
+
+def run_graph(
+    nodes: list[ScenarioNode],
+    cores: int,
+    junit_dir: str | None,
+    behave_args: list[str],
+) -> dict[int, int]:
+    """
+    Run the scenario dependency graph under a core budget.
+
+    Scenarios are started in serial order once their dependencies have finished
+    and enough cores are free. A scenario costs one core per parallel chain,
+    and one core per plot rendering process.
+
+    Args:
+        nodes (list[ScenarioNode]):
+            The scenarios in serial execution order.
+        cores (int):
+            The core budget.
+        junit_dir (str | None):
+            The directory for the junit reports of each scenario. Disabled if None.
+        behave_args (list[str]):
+            Additional behave arguments.
+
+    Returns:
+        dict[int, int]:
+            The exit code of each scenario.
+    """
+    pending = list(nodes)
+    running = {}
+    exit_codes = {}
+    free_cores = cores
+
+    with ThreadPoolExecutor(max_workers=max(len(nodes), 1)) as executor:
+        while len(pending) > 0 or len(running) > 0:
+            for node in list(pending):
+                ready = all(index in exit_codes for index in node.dependencies)
+                if not ready or node.cost > free_cores:
+                    continue
+
+                node_junit_dir = None
+                if junit_dir is not None:
+                    node_junit_dir = join_path(junit_dir, str(node.index))
+                future = executor.submit(run_scenario, node, node_junit_dir, behave_args)
+                running[future] = node
+                pending.remove(node)
+                free_cores -= node.cost
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                node = running.pop(future)
+                free_cores += node.cost
+                exit_code, output = future.result()
+                exit_codes[node.index] = exit_code
+
+                status = "passed" if exit_code == 0 else "failed"
+                print(f"{node.location} {node.name} ... {status}", flush=True)
+                if exit_code != 0:
+                    print(output, flush=True)
+
+    return exit_codes
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Run the behaviour test scenarios in parallel, respecting the dependencies between fit and compare scenarios."
+    )
+    parser.add_argument(
+        "paths", nargs="*", default=["features"], help="The feature files or directories."
+    )
+    parser.add_argument(
+        "--tags", default="", help="Run scenarios with any of these comma-separated tags."
+    )
+    parser.add_argument(
+        "--cores", type=int, default=os.cpu_count(), help="The total core budget."
+    )
+    parser.add_argument("--junit", action="store_true", help="Write junit reports.")
+    parser.add_argument(
+        "--junit-directory", default="reports", help="The junit output directory."
+    )
+    parser.add_argument(
+        "-D", "--define", action="append", default=[], help="behave user data."
+    )
+    args = parser.parse_args()
+
+    feature_files = []
+    for path in args.paths:
+        if os.path.isdir(path):
+            feature_files += sorted(glob(join_path(path, "**", "*.feature"), recursive=True))
+        else:
+            feature_files.append(path)
+
+    tags = [tag.strip().lstrip("@") for tag in args.tags.split(",") if tag.strip()]
+
+    behave_args = []
+    userdata = {}
+    for define in args.define:
+        behave_args += ["-D", define]
+        key, _, value = define.partition("=")
+        userdata[key] = value or "true"
+
+    # Plots are rendered synchronously when there are no workers, or not at all.
+    settings = RunSettings().update(userdata)
+    plot_workers = 0 if settings.diagnostics_only else settings.plot_workers
+    nodes = build_graph(feature_files, tags, args.cores, plot_workers)
+    check_joint_fits(nodes)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        junit_dir = tmp_dir if args.junit else None
+        exit_codes = run_graph(nodes, args.cores, junit_dir, behave_args)
+        if args.junit:
+            merge_junit(nodes, tmp_dir, args.junit_directory)
+
+    n_failed = sum(exit_code != 0 for exit_code in exit_codes.values())
+    print(f"{len(nodes) - n_failed} scenarios passed, {n_failed} failed")
+    sys.exit(int(n_failed > 0))
+
+
+if __name__ == "__main__":
+    main()
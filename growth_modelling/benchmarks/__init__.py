@@ -0,0 +1,18 @@
+######################################
+# Imports
+######################################
+
+# External
+from os.path import abspath, dirname, join as join_path
+import sys
+
+######################################
+# Main
+######################################
+
+# The behaviour test steps import each other as top-level modules.
+STEPS_DIR = join_path(
+    dirname(dirname(abspath(__file__))), "behaviour_tests", "features", "steps"
+)
+if STEPS_DIR not in sys.path:
+    sys.path.insert(0, STEPS_DIR)
@@ -0,0 +1,104 @@
+######################################
+# Imports
+######################################
+
+# External
+import arviz as az
+import numpy as np
+
+# Internal
+from benchmarks.synthetic import SCALES, get_species_df
+from utils import add_log_likelihood, compute_elpd
+
+######################################
+# Constants
+######################################
+
+# The posterior means and standard deviations of the synthetic draws.
+POSTERIORS = {
+    "l_inf": (240.0, 5.0),
+    "k": (0.15, 0.01),
+    "t_0": (0.0, 0.2),
+    "t_h": (8.33, 0.5),
+    "h": (0.1, 0.02),
+}
+GROWTH_CURVE_PARAMS = {
+    "vbgm": ["l_inf", "k", "t_0"],
+    "bvbgm": ["l_inf", "k", "t_0", "t_h", "h"],
+}
+
+######################################
+# Functions
+######################################
+
+
+def build_growth_trace(
+    x: np.ndarray,
+    y: np.ndarray,
+    growth_curve: str,
+    chains: int = 2,
+    draws: int = 200,
+    random_seed: int = 100,
+) -> az.InferenceData:
+    """
+    Build a nonlinear growth model trace from synthetic draws, with its log-likelihood.
+
+    Args:
+        x (np.ndarray):
+            The ages of the observations.
+        y (np.ndarray):
+            The sizes of the observations.
+        growth_curve (str):
+            The nonlinear growth curve.
+        chains (int, optional):
+            The number of MCMC chains. Defaults to 2.
+        draws (int, optional):
+            The number of draws per chain. Defaults to 200.
+        random_seed (int, optional):
+            The random seed. Defaults to 100.
+
+    Returns:
+        az.InferenceData:
+            The model trace.
+    """
+    rng = np.random.default_rng(random_seed)
+    params = GROWTH_CURVE_PARAMS[growth_curve]
+
+    shape = (chains, draws)
+    posterior = {k: rng.normal(*POSTERIORS[k], shape) for k in params}
+    posterior["sigma"] = np.abs(rng.normal(20.0, 1.0, shape))
+
+    trace = az.from_dict(
+        posterior=posterior,
+        observed_data={"y": y},
+        constant_data={"x_idx": x},
+    )
+    return add_log_likelihood(trace, "nonlinear", "gaussian", params, "y", growth_curve)
+
+
+######################################
+# Benchmarks
+######################################
+
+
+class ModelComparison:
+    """Time of estimating the ELPD of candidate models, and comparing them."""
+
+    params = SCALES
+    param_names = ["scale"]
+    timeout = 1200
+
+    def setup(self, scale: int) -> None:
+        df = get_species_df(scale=scale)
+        x, y = df["age"].values, df["stl"].values
+        self.traces = {
+            growth_curve: build_growth_trace(x, y, growth_curve)
+            for growth_curve in GROWTH_CURVE_PARAMS
+        }
+        self.elpds = {k: compute_elpd(trace, "loo") for k, trace in self.traces.items()}
+
+    def time_compute_elpd(self, scale: int) -> None:
+        compute_elpd(self.traces["bvbgm"], "loo")
+
+    def time_compare(self, scale: int) -> None:
+        az.compare(self.elpds, ic="loo", method="stacking")
@@ -0,0 +1,77 @@
+######################################
+# Imports
+######################################
+
+# External
+import os
+from os.path import join as join_path
+
+# Internal
+from benchmarks.synthetic import (
+    DATA_FILE,
+    SCALES,
+    SPECIES,
+    SPECIES_DIR,
+    write_scaled_csv,
+)
+from utils import get_df
+
+######################################
+# Functions
+######################################
+
+
+def get_data_dir(cache_dir: str, species: str, scale: int) -> str:
+    """
+    Get the data directory of a species at a scale.
+
+    Args:
+        cache_dir (str):
+            The directory of the scaled data.
+        species (str):
+            The taxonomic species.
+        scale (int):
+            The number of synthetic rows per real row.
+
+    Returns:
+        str:
+            The data directory.
+    """
+    if scale == 1:
+        return join_path(SPECIES_DIR, species)
+    return join_path(cache_dir, species, str(scale))
+
+
+######################################
+# Benchmarks
+######################################
+
+
+class LoadData:
+    """Loading time of the species data, as in the data retrieval step."""
+
+    params = (SPECIES, SCALES)
+    param_names = ["species", "scale"]
+    timeout = 600
+
+    def setup_cache(self) -> str:
+        cache_dir = os.getcwd()
+        for species in SPECIES:
+            for scale in SCALES[1:]:
+                write_scaled_csv(
+                    join_path(SPECIES_DIR, species, DATA_FILE),
+                    join_path(get_data_dir(cache_dir, species, scale), DATA_FILE),
+                    scale,
+                )
+        return cache_dir
+
+    def time_get_df(self, cache_dir: str, species: str, scale: int) -> None:
+        get_df(
+            get_data_dir(cache_dir, species, scale),
+            DATA_FILE,
+            [2004, 2013],
+            "m",
+            [],
+            "stl",
+            "age",
+        )
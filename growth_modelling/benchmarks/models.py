@@ -0,0 +1,132 @@
+######################################
+# Imports
+######################################
+
+# External
+import pandas as pd
+import pymc as pm
+
+# Internal
+from benchmarks.synthetic import SCALES, get_species_df
+from utils import fit_model, get_factor_codes, get_prior_data
+
+######################################
+# Constants
+######################################
+
+PRIORS = {
+    "linear": {
+        "intercept": {"name": "intercept", "mu": 60.0, "sigma": 20.0},
+        "slope": {"name": "slope", "mu": 15.0, "sigma": 5.0},
+    },
+    "vbgm": {
+        "l_inf": {"name": "l_inf", "mu": 241.9, "sigma": 20.0, "lower": 0.0},
+        "k": {"name": "k", "mu": 0.1565, "sigma": 0.1, "lower": 0.0},
+        "t_0": {"name": "t_0", "mu": 0.0, "sigma": 2.0},
+    },
+    "bvbgm": {
+        "l_inf": {"name": "l_inf", "mu": 241.9, "sigma": 20.0, "lower": 0.0},
+        "k": {"name": "k", "mu": 0.1565, "sigma": 0.1, "lower": 0.0},
+        "t_0": {"name": "t_0", "mu": 0.0, "sigma": 2.0},
+        "t_h": {"name": "t_h", "mu": 8.33, "sigma": 1.0, "lower": 0.0},
+        "h": {"name": "h", "mu": 0.0, "sigma": 2.0, "lower": 0.0},
+    },
+}
+FACTORS = ["year", "source"]
+
+######################################
+# Functions
+######################################
+
+
+def build_model(df: pd.DataFrame, model: str, n_factors: int) -> pm.Model:
+    """
+    Build a growth model, as in the model fitting step.
+
+    Random intercepts for each factor are fitted to the asymptotic size of
+    nonlinear models.
+
+    Args:
+        df (pd.DataFrame):
+            The modelling data.
+        model (str):
+            Either a "linear" model, or the growth curve of a nonlinear model.
+        n_factors (int):
+            The number of random intercept factors.
+
+    Returns:
+        pm.Model:
+            The PyMC model.
+    """
+    model_type = "linear" if model == "linear" else "nonlinear"
+    growth_curve = "" if model == "linear" else model
+    priors = PRIORS[model]
+    factors = FACTORS[:n_factors]
+
+    coords = {}
+    factor_idx = {}
+    for col in factors:
+        factor_idx[col], coords[col] = get_factor_codes(df[col])
+
+    with pm.Model(coords_mutable=coords) as pymc_model:
+        x_idx = pm.MutableData("x_idx", df["age"].values, dims="obs_id")
+        y_data = pm.MutableData("y_data", df["stl"].values, dims="obs_id")
+        factor_data = {
+            col: pm.MutableData(f"{col}_indx", factor_idx[col], dims="obs_id")
+            for col in factors
+        }
+
+        fit_model(
+            model_type,
+            pymc_model,
+            get_prior_data(priors),
+            x_idx,
+            y_data,
+            "y",
+            "gaussian",
+            factors,
+            growth_curve,
+            factor_data,
+            {"l_inf": factors} if model_type == "nonlinear" else {},
+        )
+
+    return pymc_model
+
+
+######################################
+# Benchmarks
+######################################
+
+
+class ModelConstruction:
+    """Construction time of the growth models, as in the model fitting step."""
+
+    params = (["linear", "vbgm", "bvbgm"], [0, 1, 2], SCALES)
+    param_names = ["model", "n_factors", "scale"]
+    timeout = 600
+
+    def setup(self, model: str, n_factors: int, scale: int) -> None:
+        self.df = get_species_df(scale=scale)
+
+    def time_build_model(self, model: str, n_factors: int, scale: int) -> None:
+        build_model(self.df, model, n_factors)
+
+
+class ModelGradients:
+    """Log-probability and gradient evaluation time of the growth models."""
+
+    params = (["linear", "vbgm", "bvbgm"], [0, 1, 2], SCALES)
+    param_names = ["model", "n_factors", "scale"]
+    timeout = 600
+
+    def setup(self, model: str, n_factors: int, scale: int) -> None:
+        pymc_model = build_model(get_species_df(scale=scale), model, n_factors)
+        self.point = pymc_model.initial_point()
+        self.logp = pymc_model.compile_logp()
+        self.dlogp = pymc_model.compile_dlogp()
+
+    def time_logp(self, model: str, n_factors: int, scale: int) -> None:
+        self.logp(self.point)
+
+    def time_dlogp(self, model: str, n_factors: int, scale: int) -> None:
+        self.dlogp(self.point)
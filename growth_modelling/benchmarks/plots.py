@@ -0,0 +1,185 @@
+######################################
+# Imports
+######################################
+
+# External
+import arviz as az
+import gc
+import numpy as np
+import psutil
+import shutil
+import tempfile
+from matplotlib import pyplot as plt
+
+# Internal
+from benchmarks.synthetic import SCALES, get_species_df
+from utils import get_mu_pp, plot_bayes_model, plot_preds, vbgm
+
+######################################
+# Constants
+######################################
+
+PRIORS = {"l_inf": {}, "k": {}, "t_0": {}}
+N_REPEATS = 10
+# The maximum memory growth over the repeated plots. Leaked figures grow it
+# by hundreds of megabytes, while caches warming up grow it by tens.
+MAX_RSS_GROWTH_MB = 100.0
+
+######################################
+# Functions
+######################################
+
+
+def build_trace(
+    n_obs: int = 200,
+    chains: int = 2,
+    draws: int = 200,
+    random_seed: int = 100,
+    x: np.ndarray | None = None,
+    y: np.ndarray | None = None,
+) -> tuple[az.InferenceData, np.ndarray]:
+    """
+    Build a von Bertalanffy growth model trace from synthetic draws.
+
+    Args:
+        n_obs (int, optional):
+            The number of synthetic observations. Defaults to 200.
+        chains (int, optional):
+            The number of MCMC chains. Defaults to 2.
+        draws (int, optional):
+            The number of draws per chain. Defaults to 200.
+        random_seed (int, optional):
+            The random seed. Defaults to 100.
+        x (np.ndarray | None, optional):
+            The ages of the observations. Synthetic observations are used if None.
+            Defaults to None.
+        y (np.ndarray | None, optional):
+            The sizes of the observations. Defaults to None.
+
+    Returns:
+        tuple[az.InferenceData, np.ndarray]:
+            The model trace, and the ages of the observations.
+    """
+    rng = np.random.default_rng(random_seed)
+    if x is None:
+        x = np.sort(rng.uniform(0, 20, n_obs))
+        y = np.abs(vbgm(240.0, 0.15, 0.0, x) + rng.normal(0, 10, n_obs))
+
+    shape = (chains, draws)
+    posterior = {
+        "l_inf": rng.normal(240.0, 5.0, shape),
+        "k": rng.normal(0.15, 0.01, shape),
+        "t_0": rng.normal(0.0, 0.2, shape),
+        "sigma": np.abs(rng.normal(10.0, 0.5, shape)),
+    }
+    mu = vbgm(
+        posterior["l_inf"][..., None],
+        posterior["k"][..., None],
+        posterior["t_0"][..., None],
+        x,
+    )
+    y_pp = mu + posterior["sigma"][..., None] * rng.standard_normal(mu.shape)
+
+    trace = az.from_dict(
+        posterior=posterior,
+        posterior_predictive={"y": y_pp},
+        observed_data={"y": y},
+        constant_data={"x_idx": x},
+    )
+    return trace, x
+
+
+######################################
+# Benchmarks
+######################################
+
+
+class PlotMemory:
+    """
+    Memory held by pyplot over repeated plotting of Bayesian modelling results.
+
+    The benchmarks fail if figures are left open, or if memory grows beyond
+    MAX_RSS_GROWTH_MB, rather than only tracking the growth.
+    """
+
+    timeout = 600
+
+    def setup(self) -> None:
+        self.trace, self.x = build_trace()
+        self.out_dir = tempfile.mkdtemp()
+        # Warm up the font and colour caches of matplotlib.
+        plot_bayes_model(self.trace, self.out_dir)
+
+    def teardown(self) -> None:
+        shutil.rmtree(self.out_dir, ignore_errors=True)
+
+    def track_plot_bayes_model_rss(self) -> float:
+        process = psutil.Process()
+        gc.collect()
+        rss = process.memory_info().rss
+
+        for _ in range(N_REPEATS):
+            plot_bayes_model(self.trace, self.out_dir)
+
+        gc.collect()
+        rss_growth = (process.memory_info().rss - rss) / 1024**2
+
+        n_figures = len(plt.get_fignums())
+        assert n_figures == 0, f"{n_figures} figures left open after plotting."
+        assert (
+            rss_growth < MAX_RSS_GROWTH_MB
+        ), f"Memory grew by {rss_growth:.1f} MB over {N_REPEATS} plots."
+        return rss_growth
+
+    track_plot_bayes_model_rss.unit = "MB"
+
+    def track_open_figures(self) -> int:
+        plot_bayes_model(self.trace, self.out_dir)
+        mu_pp = get_mu_pp(self.trace, "nonlinear", self.x, PRIORS, "vbgm")
+        plot_preds(
+            mu_pp,
+            self.out_dir,
+            self.trace.observed_data["y"],
+            self.trace.posterior_predictive["y"],
+            self.x,
+            "length",
+            "age",
+        )
+        n_figures = len(plt.get_fignums())
+        assert n_figures == 0, f"{n_figures} figures left open after plotting."
+        return n_figures
+
+    track_open_figures.unit = "figures"
+
+
+class PlotTimes:
+    """Time of summarising and plotting Bayesian modelling results."""
+
+    params = SCALES
+    param_names = ["scale"]
+    timeout = 1200
+
+    def setup(self, scale: int) -> None:
+        df = get_species_df(scale=scale)
+        self.trace, self.x = build_trace(x=df["age"].values, y=df["stl"].values)
+        self.out_dir = tempfile.mkdtemp()
+
+    def teardown(self, scale: int) -> None:
+        shutil.rmtree(self.out_dir, ignore_errors=True)
+
+    def time_plot_bayes_model(self, scale: int) -> None:
+        plot_bayes_model(self.trace, self.out_dir)
+
+
+class MeanPredictions:
+    """Time of the mean posterior predictions for plotting."""
+
+    params = SCALES
+    param_names = ["scale"]
+
+    def setup(self, scale: int) -> None:
+        df = get_species_df(scale=scale)
+        self.trace, self.x = build_trace(x=df["age"].values, y=df["stl"].values)
+
+    def time_get_mu_pp(self, scale: int) -> None:
+        get_mu_pp(self.trace, "nonlinear", self.x, PRIORS, "vbgm")
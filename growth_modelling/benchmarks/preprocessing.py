@@ -0,0 +1,90 @@
+######################################
+# Imports
+######################################
+
+# External
+from hydra import compose, initialize_config_dir
+import os
+from os.path import abspath, dirname, join as join_path
+import pandas as pd
+from pathlib import Path
+import shutil
+
+# Internal
+from benchmarks.synthetic import DATA_DIR, SCALES, write_scaled_csv
+from src.preprocess import main as preprocess
+
+######################################
+# Constants
+######################################
+
+CONF_DIR = join_path(dirname(dirname(abspath(__file__))), "conf")
+INDEX_FILE = "index.csv"
+JITTER_COLS = ["FL", "STL", "AgeAgree"]
+CHUNK_SIZE = 10000
+
+######################################
+# Benchmarks
+######################################
+
+
+class Preprocess:
+    """Time of the preprocessing pipeline, from the raw datasets to the species data."""
+
+    params = SCALES
+    param_names = ["scale"]
+    timeout = 1200
+
+    def setup_cache(self) -> str:
+        cache_dir = os.getcwd()
+        index_file = join_path(DATA_DIR, INDEX_FILE)
+        datasets = pd.read_csv(index_file)["dataset"].unique()
+
+        for scale in SCALES:
+            data_dir = join_path(cache_dir, str(scale))
+            Path(data_dir).mkdir(parents=True, exist_ok=True)
+            shutil.copy(index_file, data_dir)
+            for dataset in datasets:
+                write_scaled_csv(
+                    join_path(DATA_DIR, dataset),
+                    join_path(data_dir, dataset),
+                    scale,
+                    JITTER_COLS,
+                )
+        return cache_dir
+
+    def setup(self, cache_dir: str, scale: int) -> None:
+        data_dir = join_path(cache_dir, str(scale))
+        with initialize_config_dir(version_base=None, config_dir=CONF_DIR):
+            self.config = compose(
+                config_name="config",
+                overrides=[f"data.dir={data_dir}", "preprocess.incremental=false"],
+            )
+            self.streaming_config = compose(
+                config_name="config",
+                overrides=[
+                    f"data.dir={data_dir}",
+                    "preprocess.incremental=false",
+                    f"preprocess.chunk_size={CHUNK_SIZE}",
+                ],
+            )
+            self.incremental_config = compose(
+                config_name="config", overrides=[f"data.dir={data_dir}"]
+            )
+        # Record the manifest for the unchanged reruns.
+        preprocess(self.incremental_config)
+
+    def time_preprocess(self, cache_dir: str, scale: int) -> None:
+        preprocess(self.config)
+
+    def time_preprocess_streaming(self, cache_dir: str, scale: int) -> None:
+        preprocess(self.streaming_config)
+
+    def peakmem_preprocess(self, cache_dir: str, scale: int) -> None:
+        preprocess(self.config)
+
+    def peakmem_preprocess_streaming(self, cache_dir: str, scale: int) -> None:
+        preprocess(self.streaming_config)
+
+    def time_preprocess_unchanged(self, cache_dir: str, scale: int) -> None:
+        preprocess(self.incremental_config)
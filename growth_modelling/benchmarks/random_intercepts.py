@@ -0,0 +1,111 @@
+######################################
+# Imports
+######################################
+
+# External
+import numpy as np
+import pymc as pm
+
+# Internal
+from benchmarks import STEPS_DIR  # noqa: F401
+from utils import fit_model, get_prior_data
+
+######################################
+# Constants
+######################################
+
+PRIORS = {
+    "l_inf": {"name": "l_inf", "mu": 240.0, "sigma": 20.0, "lower": 0.0},
+    "k": {"name": "k", "mu": 0.15, "sigma": 0.1, "lower": 0.0},
+    "t_0": {"name": "t_0", "mu": 0.0, "sigma": 2.0},
+}
+
+######################################
+# Functions
+######################################
+
+
+def build_model(
+    n_levels: int,
+    random_intercepts: str,
+    n_obs: int = 1000,
+    factors: tuple[str] = ("year", "source"),
+    random_seed: int = 100,
+) -> pm.Model:
+    """
+    Build a nonlinear growth model with random intercepts on synthetic data.
+
+    Every parameter has a random intercept for every factor.
+
+    Args:
+        n_levels (int):
+            The number of levels per factor.
+        random_intercepts (str):
+            The random intercept construction.
+        n_obs (int, optional):
+            The number of observations. Defaults to 1000.
+        factors (tuple[str], optional):
+            The model factors. Defaults to ("year", "source").
+        random_seed (int, optional):
+            The random seed. Defaults to 100.
+
+    Returns:
+        pm.Model:
+            The PyMC model.
+    """
+    rng = np.random.default_rng(random_seed)
+    x = rng.uniform(0, 20, n_obs)
+    y = 240.0 * (1 - np.exp(-0.15 * x)) + rng.normal(0, 10, n_obs)
+    y = np.abs(y)
+
+    coords = {factor: np.arange(n_levels) for factor in factors}
+    with pm.Model(coords_mutable=coords) as model:
+        x_idx = pm.MutableData("x_idx", x, dims="obs_id")
+        y_data = pm.MutableData("y_data", y, dims="obs_id")
+        factor_data = {
+            factor: pm.MutableData(
+                f"{factor}_indx", rng.integers(n_levels, size=n_obs), dims="obs_id"
+            )
+            for factor in factors
+        }
+
+        fit_model(
+            "nonlinear",
+            model,
+            get_prior_data(PRIORS),
+            x_idx,
+            y_data,
+            "y",
+            "gaussian",
+            list(factors),
+            "vbgm",
+            factor_data,
+            {k: list(factors) for k in PRIORS},
+            random_intercepts,
+        )
+
+    return model
+
+
+######################################
+# Benchmarks
+######################################
+
+
+class RandomIntercepts:
+    """Gradient evaluation time of the random intercept constructions."""
+
+    params = ([10, 100, 1000], ["separate", "stacked"])
+    param_names = ["n_levels", "random_intercepts"]
+
+    def setup(self, n_levels: int, random_intercepts: str) -> None:
+        model = build_model(n_levels, random_intercepts)
+        self.point = model.initial_point()
+        self.logp = model.compile_logp()
+        self.dlogp = model.compile_dlogp()
+
+    def time_logp(self, n_levels: int, random_intercepts: str) -> None:
+        self.logp(self.point)
+
+    def time_dlogp(self, n_levels: int, random_intercepts: str) -> None:
+        self.dlogp(self.point)
@@ -0,0 +1,124 @@
+######################################
+# Imports
+######################################
+
+# External
+import numpy as np
+from os.path import abspath, dirname, join as join_path
+import pandas as pd
+from pathlib import Path
+
+# Internal
+from benchmarks import STEPS_DIR  # noqa: F401
+from utils import get_df
+
+######################################
+# Constants
+######################################
+
+DATA_DIR = join_path(dirname(dirname(abspath(__file__))), "data")
+SPECIES_DIR = join_path(DATA_DIR, "chondrichthyes", "carcharhiniformes")
+SPECIES = ["carcharhinus_limbatus", "carcharhinus_tilstoni", "carcharhinus_sorrah"]
+DATA_FILE = "data.csv"
+
+# A scale of 1 is the real data. Larger scales are synthetic data.
+SCALES = [1, 10, 100, 1000]
+JITTER_COLS = ["stl", "fl", "age"]
+JITTER_SD = 0.05
+
+######################################
+# Functions
+######################################
+
+
+def scale_df(
+    df: pd.DataFrame,
+    scale: int,
+    jitter_cols: list[str] = JITTER_COLS,
+    random_seed: int = 100,
+) -> pd.DataFrame:
+    """
+    Scale up a dataframe with synthetic rows.
+
+    Rows are resampled with replacement, and numeric columns are jittered
+    with Gaussian noise relative to their standard deviation.
+
+    Args:
+        df (pd.DataFrame):
+            The real dataframe.
+        scale (int):
+            The number of synthetic rows per real row. A scale of 1 returns the real dataframe.
+        jitter_cols (list[str], optional):
+            The numeric columns to jitter. Defaults to JITTER_COLS.
+        random_seed (int, optional):
+            The random seed. Defaults to 100.
+
+    Returns:
+        pd.DataFrame:
+            The scaled dataframe.
+    """
+    if scale == 1:
+        return df
+
+    rng = np.random.default_rng(random_seed)
+    scaled_df = df.iloc[rng.integers(len(df), size=len(df) * scale)].reset_index(drop=True)
+    for col in jitter_cols:
+        if col not in scaled_df:
+            continue
+        values = scaled_df[col]
+        noise = rng.normal(0, JITTER_SD * values.std(), len(values))
+        scaled_df[col] = (values + noise).abs()
+
+    return scaled_df
+
+
+def write_scaled_csv(
+    in_file: str,
+    out_file: str,
+    scale: int,
+    jitter_cols: list[str] = JITTER_COLS,
+) -> str:
+    """
+    Write a scaled copy of a CSV file.
+
+    Args:
+        in_file (str):
+            The real CSV file.
+        out_file (str):
+            The scaled CSV file.
+        scale (int):
+            The number of synthetic rows per real row.
+        jitter_cols (list[str], optional):
+            The numeric columns to jitter. Defaults to JITTER_COLS.
+
+    Returns:
+        str:
+            The scaled CSV file.
+    """
+    Path(dirname(out_file)).mkdir(parents=True, exist_ok=True)
+    df = pd.read_csv(in_file)
+    scale_df(df, scale, jitter_cols).to_csv(out_file, index=False)
+    return out_file
+
+
+def get_species_df(
+    species: str = "carcharhinus_limbatus", scale: int = 1, sex: str = "m"
+) -> pd.DataFrame:
+    """
+    Get the modelling data of a species, scaled up with synthetic rows.
+
+    Args:
+        species (str, optional):
+            The taxonomic species. Defaults to "carcharhinus_limbatus".
+        scale (int, optional):
+            The number of synthetic rows per real row. Defaults to 1.
+        sex (str, optional):
+            The sex of the sample. Defaults to "m".
+
+    Returns:
+        pd.DataFrame:
+            The modelling data, with the total length as the response and age
+            as the explanatory variable.
+    """
+    df = get_df(join_path(SPECIES_DIR, species), DATA_FILE, [], sex, [], "stl", "age")
+    return scale_df(df.reset_index(drop=True), scale)
@@ -0,0 +1,72 @@
+######################################
+# Imports
+######################################
+
+# External
+import numpy as np
+from os.path import join as join_path
+import shutil
+import tempfile
+
+# Internal
+from benchmarks.plots import build_trace
+from trace_cache import TraceRegistry, get_trace_size, load_trace, save_trace
+
+######################################
+# Constants
+######################################
+
+N_TRACES = 4
+
+######################################
+# Benchmarks
+######################################
+
+
+class TraceRegistryReleases:
+    """
+    Releasing and reopening of file-backed traces by a trace registry over its memory budget.
+
+    The traces are registered fully loaded into memory, and the budget fits
+    one trace and a half, so registering every trace releases the older ones.
+    The benchmarks fail if the registry exceeds its budget, or if released
+    traces are not reopened with the same draws.
+    """
+
+    timeout = 600
+
+    def setup(self) -> None:
+        self.tmp_dir = tempfile.mkdtemp()
+        self.traces = [build_trace(random_seed=seed)[0] for seed in range(N_TRACES)]
+        self.trace_files = [
+            save_trace(trace, join_path(self.tmp_dir, f"trace_{i}.nc"))
+            for i, trace in enumerate(self.traces)
+        ]
+        self.max_size = int(1.5 * get_trace_size(self.traces[0]))
+
+    def teardown(self) -> None:
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def track_file_backed_reloads(self) -> int:
+        registry = TraceRegistry(self.max_size)
+        for i, trace_file in enumerate(self.trace_files):
+            registry.add(str(i), load_trace(trace_file, lazy=False), trace_file)
+
+        reloads = registry.stats["reloads"]
+        for i, trace in enumerate(self.traces):
+            reloaded = registry.get(str(i))
+            assert reloaded is not None, f"Trace {i} was not reloaded."
+            np.testing.assert_array_equal(
+                reloaded.posterior["l_inf"].values, trace.posterior["l_inf"].values
+            )
+            size = registry.get_size()
+            assert (
+                size <= registry.max_size
+            ), f"The registry holds {size} bytes over its budget of {registry.max_size}."
+
+        stats = registry.clear()
+        assert stats["releases"] >= N_TRACES - 1, f"Too few traces were released: {stats}."
+        assert stats["reloads"] >= N_TRACES - 1, f"Too few traces were reloaded: {stats}."
+        return stats["reloads"] - reloads
+
+    track_file_backed_reloads.unit = "traces"
@@ -6,11 +6,192 @@
 
 # External
 import hydra
+import logging
+import matplotlib
 from matplotlib import pyplot as plt
 from omegaconf import DictConfig
 from os.path import join as join_path
 import pandas as pd
+import queue
 import seaborn as sns
+import threading
+import time
+
+# Plots are only written to files.
+matplotlib.use("Agg")
+
+######################################
+# Constants
+######################################
+
+# The MLflow limits on the entities of a single batch.
+MAX_BATCH_SIZE = 1000
+MAX_PARAMS_PER_BATCH = 100
+MAX_TAGS_PER_BATCH = 100
+# The maximum number of batches waiting to be logged.
+BATCH_QUEUE_SIZE = 16
+
+logger = logging.getLogger(__name__)
+
+######################################
+# Classes
+######################################
+
+
+class BatchLogger:
+    """Logs the metrics, parameters, and tags of an MLflow run in batches from a background thread."""
+
+    def __init__(
+        self,
+        client,
+        run_id: str,
+        batch_size: int = MAX_BATCH_SIZE,
+        queue_size: int = BATCH_QUEUE_SIZE,
+    ) -> None:
+        """
+        The batch logger constructor.
+
+        Args:
+            client (mlflow.MlflowClient):
+                The MLflow tracking client.
+            run_id (str):
+                The MLflow run ID.
+            batch_size (int, optional):
+                The maximum number of entities per batch. Defaults to MAX_BATCH_SIZE.
+            queue_size (int, optional):
+                The maximum number of batches waiting to be logged. Logging blocks
+                while the queue is full. Defaults to BATCH_QUEUE_SIZE.
+        """
+        self.client = client
+        self.run_id = run_id
+        self.batch_size = min(batch_size, MAX_BATCH_SIZE)
+        self.metrics: list[tuple] = []
+        self.params: list[tuple] = []
+        self.tags: list[tuple] = []
+        self.n_failed = 0
+        self.queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.thread = threading.Thread(target=self.log_batches, daemon=True)
+        self.thread.start()
+
+    def __enter__(self) -> "BatchLogger":
+        return self
+
+    def __exit__(self, exc_type, *exc_info) -> None:
+        """
+        Close the batch logger on leaving its context.
+
+        Raises:
+            RuntimeError:
+                Error raised when any batch failed to be logged, unless the
+                context is already exiting with an error.
+        """
+        n_failed = self.close()
+        if n_failed > 0 and exc_type is None:
+            raise RuntimeError(f"Failed to log {n_failed} batches to run {self.run_id}.")
+
+    def log_batches(self) -> None:
+        """Log queued batches until the logger is closed."""
+        from mlflow.entities import Metric, Param, RunTag
+
+        while True:
+            batch = self.queue.get()
+            if batch is None:
+                return
+
+            metrics, params, tags = batch
+            try:
+                self.client.log_batch(
+                    self.run_id,
+                    metrics=[Metric(*metric) for metric in metrics],
+                    params=[Param(*param) for param in params],
+                    tags=[RunTag(*tag) for tag in tags],
+                )
+            except Exception as e:
+                logger.error(f"Failed to log batch: {e!r}")
+                self.n_failed += 1
+
+    def is_full(self) -> bool:
+        """
+        Whether the current batch has reached the MLflow limits.
+
+        Returns:
+            bool:
+                Whether the current batch is full.
+        """
+        return (
+            len(self.metrics) + len(self.params) + len(self.tags) >= self.batch_size
+            or len(self.params) >= MAX_PARAMS_PER_BATCH
+            or len(self.tags) >= MAX_TAGS_PER_BATCH
+        )
+
+    def log_metric(self, key: str, value: float, step: int = 0) -> None:
+        """
+        Add a metric to the current batch.
+
+        Args:
+            key (str):
+                The metric name.
+            value (float):
+                The metric value.
+            step (int, optional):
+                The metric step. Defaults to 0.
+        """
+        timestamp = int(time.time() * 1000)
+        self.metrics.append((key, float(value), timestamp, int(step)))
+        if self.is_full():
+            self.flush()
+
+    def log_param(self, key: str, value) -> None:
+        """
+        Add a parameter to the current batch.
+
+        Args:
+            key (str):
+                The parameter name.
+            value (Any):
+                The parameter value.
+        """
+        self.params.append((key, str(value)))
+        if self.is_full():
+            self.flush()
+
+    def set_tag(self, key: str, value) -> None:
+        """
+        Add a tag to the current batch.
+
+        Args:
+            key (str):
+                The tag name.
+            value (Any):
+                The tag value.
+        """
+        self.tags.append((key, str(value)))
+        if self.is_full():
+            self.flush()
+
+    def flush(self) -> None:
+        """Queue the current batch to be logged."""
+        if len(self.metrics) + len(self.params) + len(self.tags) == 0:
+            return
+        self.queue.put((self.metrics, self.params, self.tags))
+        self.metrics = []
+        self.params = []
+        self.tags = []
+
+    def close(self) -> int:
+        """
+        Wait for all batches to be logged, then stop the background thread.
+
+        Returns:
+            int:
+                The number of batches that failed to be logged.
+        """
+        if self.thread.is_alive():
+            self.flush()
+            self.queue.put(None)
+            self.thread.join()
+        return self.n_failed
+
 
 ######################################
 # Main
@@ -71,7 +252,7 @@ def plot_curves(
     for cat_col in as_cat:
         data_df[cat_col] = data_df[cat_col].astype("category")
 
-    sns.catplot(
+    grid = sns.catplot(
         x=x,
         y=y,
         hue=hue,
@@ -83,7 +264,8 @@ def plot_curves(
         aspect=0.8,
     )
     outfile = join_path(in_dir, f"{y}_{x}.png")
-    plt.savefig(outfile)
+    grid.savefig(outfile)
+    plt.close(grid.figure)
 
     if enable_experiment_tracking is False or tracking_uri is None:
         return
@@ -96,24 +278,26 @@ def plot_curves(
     if not existing_exp:
         mlflow.create_experiment(experiment_name)
     mlflow.set_experiment(experiment_name)
-    mlflow.set_tag("species", species)
-
-    mlflow.log_param("species", species)
-    mlflow.log_param("class", class_type)
-    mlflow.log_param("order", order)
 
-    def log_series(df, interval=0.01):
+    def log_series(batch_logger, df, interval=0.01):
         series = df[y].dropna().sort_values().values
-        series_interval = int(len(series) * interval)
-        for i, value in enumerate(series):
-            if i % series_interval != 0:
-                continue
-            mlflow.log_metric(y, value, step=i)
+        # Short series log each value.
+        series_interval = max(int(len(series) * interval), 1)
+        for i in range(0, len(series), series_interval):
+            batch_logger.log_metric(y, series[i], step=i)
+
+    with mlflow.start_run() as run:
+        with BatchLogger(mlflow.MlflowClient(), run.info.run_id) as batch_logger:
+            batch_logger.set_tag("species", species)
+
+            batch_logger.log_param("species", species)
+            batch_logger.log_param("class", class_type)
+            batch_logger.log_param("order", order)
 
-    data_df.groupby(hue).apply(log_series)
+            for _, df in data_df.groupby(hue, observed=True):
+                log_series(batch_logger, df)
 
-    mlflow.log_artifact(outfile)
-    mlflow.end_run()
+        mlflow.log_artifact(outfile)
 
 
 @hydra.main(version_base=None, config_path="../conf", config_name="config")
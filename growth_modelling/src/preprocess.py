@@ -5,34 +5,477 @@
 ######################################
 
 # External
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
 import hydra
-from omegaconf import DictConfig
+import inspect
+import json
+import logging
+import numpy as np
+from omegaconf import DictConfig, OmegaConf
+import os
 from os.path import join as join_path
 import pandas as pd
 from pathlib import Path
+import pyarrow as pa
+import pyarrow.parquet as pq
+import shutil
+
+######################################
+# Constants
+######################################
+
+PARTITION_COLS = ["sex", "year"]
+
+logger = logging.getLogger(__name__)
 
 ######################################
 # Main
 ######################################
 
 
+def get_raw_cols(cols: list[str]):
+    """
+    Get a filter for the source dataset columns needed by the species outputs.
+
+    Args:
+        cols (list[str]):
+            The dataframe column list.
+
+    Returns:
+        Callable:
+            Whether a source column is needed.
+    """
+    return lambda col: col.lower() in cols or col in ["AgeAgree", "Species"]
+
+
+def preprocess_species_df(
+    data_df: pd.DataFrame, cols: list[str], lowercase_list=[], drop_na=False
+) -> pd.DataFrame:
+    """
+    Preprocess rows of the source dataset for a species.
+
+    Args:
+        data_df (pd.DataFrame):
+            The rows of the source dataset for the species.
+        cols (list[str]):
+            The dataframe column list.
+        lowercase_list (list, optional):
+            Columns to convert all values to lowercase.
+        drop_na (bool, optional):
+            Drop missing values
+
+    Returns:
+        pd.DataFrame:
+            The preprocessed rows.
+    """
+    data_df = data_df.copy()
+    data_df["age"] = data_df["AgeAgree"]
+    data_df.columns = data_df.columns.str.lower()
+    data_df = data_df[cols]
+    if drop_na:
+        data_df = data_df.dropna(axis=0)
+    for lower_col in lowercase_list:
+        data_df[lower_col] = data_df[lower_col].astype("str").str.lower()
+    return data_df
+
+
+def resolve_dtypes(chunk_dtypes: list[pd.Series]) -> dict:
+    """
+    Combine the dtypes inferred for each chunk of a CSV file.
+
+    As when the whole file is read at once, integer and float columns are
+    widened to floats, and any other mixture of dtypes is read as objects.
+
+    Args:
+        chunk_dtypes (list[pd.Series]):
+            The column dtypes of each chunk.
+
+    Returns:
+        dict:
+            The dtype of each column.
+    """
+    if len(chunk_dtypes) == 0:
+        return {}
+
+    dtypes = {}
+    for col in chunk_dtypes[0].index:
+        col_dtypes = {chunk[col] for chunk in chunk_dtypes}
+        if len(col_dtypes) == 1:
+            dtypes[col] = col_dtypes.pop()
+        elif all(np.issubdtype(dtype, np.number) for dtype in col_dtypes):
+            dtypes[col] = np.result_type(*col_dtypes)
+        else:
+            dtypes[col] = np.dtype("object")
+    return dtypes
+
+
+def get_parquet_schema(data_df: pd.DataFrame, dtypes: dict) -> pa.Schema:
+    """
+    Get the Parquet schema of a species dataframe.
+
+    Labels are strings, even where all are missing, such that the schema does
+    not depend on the rows read at once.
+
+    Args:
+        data_df (pd.DataFrame):
+            The species dataframe, or a chunk of it.
+        dtypes (dict):
+            The dtype of each column.
+
+    Returns:
+        pa.Schema:
+            The Parquet schema.
+    """
+    schema = pa.Schema.from_pandas(data_df, preserve_index=True)
+    for col, dtype in dtypes.items():
+        if dtype == np.dtype("object"):
+            field = pa.field(col, pa.string())
+        elif isinstance(dtype, pd.CategoricalDtype):
+            field = pa.field(col, pa.dictionary(pa.int32(), pa.string()))
+        else:
+            continue
+        schema = schema.set(schema.get_field_index(col), field)
+    return schema
+
+
+def write_species_parquet(
+    csv_file: str,
+    parquet_file: str,
+    chunk_size: int | None = None,
+    out_dtypes: dict = {},
+    dtypes: dict | None = None,
+) -> None:
+    """
+    Write a typed copy of a species CSV file as it is read back, partitioned by sex and year.
+
+    Args:
+        csv_file (str):
+            The species CSV file.
+        parquet_file (str):
+            The output Parquet dataset.
+        chunk_size (int | None, optional):
+            The number of rows read at once. The whole file is read if None.
+        out_dtypes (dict, optional):
+            The compact dtypes of the output columns. Other columns have
+            the dtypes inferred when reading the CSV file. Defaults to {}.
+        dtypes (dict | None, optional):
+            The dtypes of the CSV columns, collected while the CSV file was
+            written. Only used when reading in chunks, in which case they are
+            otherwise resolved from another pass over the CSV file. Defaults to None.
+    """
+    shutil.rmtree(parquet_file, ignore_errors=True)
+    if chunk_size is None:
+        data_df = pd.read_csv(csv_file, dtype=out_dtypes)
+        schema = get_parquet_schema(data_df, data_df.dtypes.to_dict())
+        table = pa.Table.from_pandas(data_df, schema=schema, preserve_index=True)
+        pq.write_to_dataset(table, parquet_file, partition_cols=PARTITION_COLS)
+        return
+
+    if dtypes is None:
+        dtypes = resolve_dtypes(
+            [chunk.dtypes for chunk in pd.read_csv(csv_file, chunksize=chunk_size)]
+        )
+    dtypes = dict(dtypes)
+    dtypes.update({col: pd.api.types.pandas_dtype(dtype) for col, dtype in out_dtypes.items()})
+    schema = None
+    for chunk in pd.read_csv(csv_file, dtype=dtypes, chunksize=chunk_size):
+        if schema is None:
+            schema = get_parquet_schema(chunk, dtypes)
+
+        table = pa.Table.from_pandas(chunk, schema=schema, preserve_index=True)
+        pq.write_to_dataset(table, parquet_file, partition_cols=PARTITION_COLS)
+
+
+def get_species_dir(data_dir: str, species_meta: dict) -> str:
+    """
+    Get the output directory of a species, creating it if needed.
+
+    Args:
+        data_dir (str):
+            The data directory.
+        species_meta (dict):
+            The index metadata of the species.
+
+    Returns:
+        str:
+            The output directory.
+    """
+    out_dir = join_path(
+        data_dir, species_meta["class"], species_meta["order"], species_meta["species"]
+    )
+    Path(out_dir).mkdir(parents=True, exist_ok=True)
+    return out_dir
+
+
+def write_species_readme(out_dir: str, species_meta: dict) -> None:
+    """
+    Write the data source of a species.
+
+    Args:
+        out_dir (str):
+            The output directory of the species.
+        species_meta (dict):
+            The index metadata of the species.
+    """
+    source = species_meta["source"]
+    outfile = join_path(out_dir, "README.md")
+    with open(outfile, "w+") as f:
+        f.writelines(source)
+
+
 def write_species_csv(
-    species_code: str,
-    index_df: pd.DataFrame,
+    data_df: pd.DataFrame,
+    species_meta: dict,
     data_dir: str,
     cols: str,
     outfile: str,
     lowercase_list=[],
     drop_na=False,
-) -> None:
+    parquet_outfile: str | None = None,
+    parquet_dtypes: dict = {},
+) -> str:
     """
     Creates a species dataframe and writes it to a CSV file.
 
     Args:
+        data_df (pd.DataFrame):
+            The rows of the source dataset for the species.
+        species_meta (dict):
+            The index metadata of the species.
+        data_dir (str):
+            The data directory.
+        cols (str):
+            The dataframe column list.
+        outfile (str):
+            The output file name.
+        lowercase_list (list, optional):
+            Columns to convert all values to lowercase.
+        drop_na (bool, optional):
+            Drop missing values
+        parquet_outfile (str | None, optional):
+            The output Parquet dataset name. Only the CSV file is written if None.
+        parquet_dtypes (dict, optional):
+            The compact dtypes of the Parquet dataset columns. Defaults to {}.
+
+    Returns:
+        str:
+            The species code.
+    """
+    out_dir = get_species_dir(data_dir, species_meta)
+    data_df = preprocess_species_df(data_df, cols, lowercase_list, drop_na)
+
+    # Write data
+    outfile = join_path(out_dir, outfile)
+    data_df.to_csv(outfile, index=False)
+
+    if parquet_outfile is not None:
+        write_species_parquet(
+            outfile, join_path(out_dir, parquet_outfile), out_dtypes=parquet_dtypes
+        )
+
+    write_species_readme(out_dir, species_meta)
+    return species_meta["species_code"]
+
+
+def new_species_digest(species_meta: dict, settings: dict, columns: list[str]):
+    """
+    Start a hash of the index metadata and preprocessing settings of a species.
+
+    The source code of every function on the species write path is also
+    hashed, such that changes to the preprocessing steps or output formats
+    rewrite every species.
+
+    Args:
+        species_meta (dict):
+            The index metadata of the species.
+        settings (dict):
+            The preprocessing settings.
+        columns (list[str]):
+            The source dataset columns.
+
+    Returns:
+        hashlib._Hash:
+            The hash, to be updated with the source rows of the species.
+    """
+    digest = hashlib.sha256()
+    write_path = [
+        get_raw_cols,
+        preprocess_species_df,
+        resolve_dtypes,
+        get_parquet_schema,
+        write_species_parquet,
+        get_species_dir,
+        write_species_readme,
+        write_species_csv,
+        write_species_chunks,
+        stream_species_csv,
+    ]
+    for func in write_path:
+        digest.update(inspect.getsource(func).encode())
+    digest.update(json.dumps([species_meta, settings], sort_keys=True).encode())
+    digest.update(json.dumps(list(columns)).encode())
+    return digest
+
+
+def hash_species_inputs(
+    data_df: pd.DataFrame, species_meta: dict, settings: dict
+) -> str:
+    """
+    Hash the source rows, index metadata, and preprocessing settings of a species.
+
+    Args:
+        data_df (pd.DataFrame):
+            The rows of the source dataset for the species.
+        species_meta (dict):
+            The index metadata of the species.
+        settings (dict):
+            The preprocessing settings.
+
+    Returns:
+        str:
+            The hexadecimal digest.
+    """
+    digest = new_species_digest(species_meta, settings, data_df.columns)
+    digest.update(pd.util.hash_pandas_object(data_df, index=False).values.tobytes())
+    return digest.hexdigest()
+
+
+def is_species_unchanged(
+    manifest: dict,
+    species_code: str,
+    species_meta: dict,
+    digest: str,
+    data_dir: str,
+    outfile: str,
+) -> bool:
+    """
+    Check whether a species was written from the same inputs by a previous run.
+
+    Args:
+        manifest (dict):
+            The digest of each species code written by the previous run.
         species_code (str):
-            The shark species code.
-        index_df (pd.DataFrame):
-            The index dataframe containing metadata.
+            The species code.
+        species_meta (dict):
+            The index metadata of the species.
+        digest (str):
+            The hexadecimal digest of the species inputs.
+        data_dir (str):
+            The data directory.
+        outfile (str):
+            The output file name.
+
+    Returns:
+        bool:
+            Whether the species can be skipped.
+    """
+    species_outfile = join_path(
+        data_dir,
+        species_meta["class"],
+        species_meta["order"],
+        species_meta["species"],
+        outfile,
+    )
+    if manifest.get(species_code) == digest and os.path.exists(species_outfile):
+        logger.info(f"Skipping unchanged species: {species_code}")
+        return True
+    return False
+
+
+def write_species_chunks(
+    data_path: str,
+    outfiles: dict[str, str],
+    cols: str,
+    lowercase_list=[],
+    drop_na=False,
+    chunk_size: int = 100000,
+    dtypes: dict = {},
+    digests: dict | None = None,
+) -> tuple[list[pd.Series], dict[str, list[pd.Series]]]:
+    """
+    Read a source dataset in chunks, and append the rows of each species to its CSV file.
+
+    Args:
+        data_path (str):
+            The source dataset.
+        outfiles (dict[str, str]):
+            The CSV file of each species in the dataset.
+        cols (str):
+            The dataframe column list.
+        lowercase_list (list, optional):
+            Columns to convert all values to lowercase.
+        drop_na (bool, optional):
+            Drop missing values
+        chunk_size (int, optional):
+            The number of rows read at once. Defaults to 100000.
+        dtypes (dict, optional):
+            The dtypes of the source dataset columns. Defaults to {}.
+        digests (dict | None, optional):
+            The hash of each species, to update with its source rows. Defaults to None.
+
+    Returns:
+        tuple[list[pd.Series], dict[str, list[pd.Series]]]:
+            The column dtypes of each chunk, and of each chunk of the CSV file
+            of each species.
+    """
+    for species_file in outfiles.values():
+        pd.DataFrame(columns=cols).to_csv(species_file, index=False)
+
+    chunk_dtypes = []
+    species_dtypes = {species: [] for species in outfiles}
+    reader = pd.read_csv(
+        data_path, usecols=get_raw_cols(cols), dtype=dtypes, chunksize=chunk_size
+    )
+    for chunk in reader:
+        chunk_dtypes.append(chunk.dtypes)
+        for species, data_df in chunk.groupby("Species", sort=False):
+            if species not in outfiles:
+                continue
+            if digests is not None:
+                digests[species].update(
+                    pd.util.hash_pandas_object(data_df, index=False).values.tobytes()
+                )
+            data_df = preprocess_species_df(data_df, cols, lowercase_list, drop_na)
+            species_dtypes[species].append(data_df.dtypes)
+            data_df.to_csv(outfiles[species], mode="a", header=False, index=False)
+
+    return chunk_dtypes, species_dtypes
+
+
+def stream_species_csv(
+    data_path: str,
+    species_metas: dict[str, dict],
+    settings: dict,
+    manifest: dict,
+    data_dir: str,
+    cols: str,
+    outfile: str,
+    lowercase_list=[],
+    drop_na=False,
+    parquet_outfile: str | None = None,
+    chunk_size: int = 100000,
+    dtypes: dict = {},
+    parquet_dtypes: dict = {},
+) -> dict[str, str]:
+    """
+    Stream a source dataset in chunks, writing the rows of each species to its CSV file.
+
+    The source rows of each species are hashed while they are written to a
+    temporary file, which only replaces the CSV file of the species if its
+    inputs have changed. The CSV files are identical to those of
+    write_species_csv, and the Parquet datasets have the same schema and rows,
+    while only a chunk of rows is held in memory at once.
+
+    Args:
+        data_path (str):
+            The source dataset.
+        species_metas (dict[str, dict]):
+            The index metadata of each species code in the dataset.
+        settings (dict):
+            The preprocessing settings.
+        manifest (dict):
+            The digest of each species code written by the previous run.
         data_dir (str):
             The data directory.
         cols (str):
@@ -43,41 +486,99 @@ def write_species_csv(
             Columns to convert all values to lowercase.
         drop_na (bool, optional):
             Drop missing values
+        parquet_outfile (str | None, optional):
+            The output Parquet dataset name. Only the CSV file is written if None.
+        chunk_size (int, optional):
+            The number of rows read at once. Defaults to 100000.
+        dtypes (dict, optional):
+            The declared dtypes of the source dataset columns. Defaults to {}.
+        parquet_dtypes (dict, optional):
+            The compact dtypes of the Parquet dataset columns. Defaults to {}.
+
+    Returns:
+        dict[str, str]:
+            The hexadecimal digest of each species code that was written.
     """
-    species_df = index_df.query("species_code == @species_code")
-    extract_val = lambda key: species_df[key].values.item()
+    if len(species_metas) == 0:
+        return {}
 
-    species = extract_val("species")
-    class_type = extract_val("class")
-    order = extract_val("order")
+    columns = pd.read_csv(data_path, usecols=get_raw_cols(cols), nrows=0).columns
+    out_dirs = {}
+    tmp_files = {}
+    digests = {}
+    for species_code, species_meta in species_metas.items():
+        species = species_code.upper()
+        out_dirs[species] = get_species_dir(data_dir, species_meta)
+        tmp_files[species] = join_path(out_dirs[species], f"{outfile}.{os.getpid()}.tmp")
+        digests[species] = new_species_digest(species_meta, settings, columns)
 
-    # Make dirs
-    out_dir = join_path(data_dir, class_type, order, species)
-    Path(out_dir).mkdir(parents=True, exist_ok=True)
+    write_args = [data_path, tmp_files, cols, lowercase_list, drop_na, chunk_size]
+    chunk_dtypes, species_dtypes = write_species_chunks(*write_args, dtypes, digests)
+    resolved_dtypes = resolve_dtypes(chunk_dtypes)
+    if any(chunk.to_dict() != resolved_dtypes for chunk in chunk_dtypes):
+        # Columns inferred with different dtypes across chunks are written
+        # again, formatted as when the whole dataset is read at once.
+        _, species_dtypes = write_species_chunks(*write_args, resolved_dtypes)
 
-    # Load data
-    dataset_file = extract_val("dataset")
-    data_path = join_path(data_dir, dataset_file)
-    species_code = species_code.upper()
-    data_df = pd.read_csv(data_path).query("Species == @species_code")
+    hexdigests = {}
+    for species_code, species_meta in species_metas.items():
+        species = species_code.upper()
+        digest = digests[species].hexdigest()
+        if is_species_unchanged(
+            manifest, species_code, species_meta, digest, data_dir, outfile
+        ):
+            os.remove(tmp_files[species])
+            continue
 
-    # Preprocess
-    data_df["age"] = data_df["AgeAgree"]
-    data_df.columns = data_df.columns.str.lower()
-    data_df = data_df[cols]
-    if drop_na:
-        data_df = data_df.dropna(axis=0)
-    for lower_col in lowercase_list:
-        data_df[lower_col] = data_df[lower_col].astype("str").str.lower()
+        species_file = join_path(out_dirs[species], outfile)
+        os.replace(tmp_files[species], species_file)
+        if parquet_outfile is not None:
+            write_species_parquet(
+                species_file,
+                join_path(out_dirs[species], parquet_outfile),
+                chunk_size,
+                parquet_dtypes,
+                resolve_dtypes(species_dtypes[species]) or None,
+            )
+        write_species_readme(out_dirs[species], species_meta)
+        hexdigests[species_code] = digest
 
-    # Write data
-    outfile = join_path(out_dir, outfile)
-    data_df.to_csv(outfile, index=False)
+    return hexdigests
 
-    source = extract_val("source")
-    outfile = join_path(out_dir, "README.md")
-    with open(outfile, "w+") as f:
-        f.writelines(source)
+
+def load_manifest(manifest_file: str) -> dict:
+    """
+    Load the manifest of preprocessed species.
+
+    Args:
+        manifest_file (str):
+            The manifest file.
+
+    Returns:
+        dict:
+            The input hash of each species code.
+    """
+    if not os.path.exists(manifest_file):
+        return {}
+
+    with open(manifest_file) as f:
+        return json.load(f)
+
+
+def save_manifest(manifest: dict, manifest_file: str) -> None:
+    """
+    Save the manifest of preprocessed species.
+
+    Args:
+        manifest (dict):
+            The input hash of each species code.
+        manifest_file (str):
+            The manifest file.
+    """
+    tmp_file = f"{manifest_file}.{os.getpid()}.tmp"
+    with open(tmp_file, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_file, manifest_file)
 
 
 @hydra.main(version_base=None, config_path="../conf", config_name="config")
@@ -85,6 +586,11 @@ def main(config: DictConfig) -> None:
     """
     The main entry point for the preprocess pipeline.
 
+    Each source dataset is read once and split by species. Species are written
+    in parallel, and only if their source rows, index metadata, or
+    preprocessing settings have changed since the last run. If a chunk size is
+    set, datasets are instead streamed in chunks of rows, with bounded memory.
+
     Args:
         config (DictConfig):
             The pipeline configuration.
@@ -96,20 +602,105 @@ def main(config: DictConfig) -> None:
     DATA_DIR = data_config["dir"]
     INDEX = data_config["index"]
     OUTFILE = data_config["out"]
+    PARQUET_OUTFILE = data_config.get("parquet")
 
     preprocess_config = config["preprocess"]
-    COLS = preprocess_config["cols"]
+    COLS = list(preprocess_config["cols"])
     DROP_NA = preprocess_config["drop_na"]
-    LOWERCASE = preprocess_config["lowercase"]
+    LOWERCASE = list(preprocess_config["lowercase"])
+    N_WORKERS = preprocess_config.get("n_workers")
+    INCREMENTAL = preprocess_config.get("incremental", True)
+    MANIFEST = join_path(
+        DATA_DIR, preprocess_config.get("manifest", "preprocess_manifest.json")
+    )
+    CHUNK_SIZE = preprocess_config.get("chunk_size")
+    DTYPES = dict(preprocess_config.get("dtypes", {}))
+    PARQUET_DTYPES = dict(preprocess_config.get("parquet_dtypes", {}))
+
+    settings = {
+        "out": OUTFILE,
+        "parquet": PARQUET_OUTFILE,
+        **OmegaConf.to_container(preprocess_config, resolve=True),
+    }
+    for k in ["n_workers", "incremental", "manifest", "chunk_size"]:
+        settings.pop(k, None)
 
     # Load data
     index_file = join_path(DATA_DIR, INDEX)
-    index_df = pd.read_csv(index_file)
+    index_df = pd.read_csv(index_file).set_index("species_code", drop=False)
+
+    manifest = load_manifest(MANIFEST) if INCREMENTAL else {}
+    species_list = list(SPECIES_LIST)
+    datasets = index_df.loc[species_list, "dataset"].unique()
+
+    tasks = {}
+    for dataset in datasets:
+        data_path = join_path(DATA_DIR, dataset)
+        species_metas = {
+            species_code: index_df.loc[species_code].to_dict()
+            for species_code in species_list
+            if index_df.loc[species_code, "dataset"] == dataset
+        }
 
-    for species_code in SPECIES_LIST:
-        write_species_csv(
-            species_code, index_df, DATA_DIR, COLS, OUTFILE, LOWERCASE, DROP_NA
+        if CHUNK_SIZE is not None:
+            # Stream large datasets, holding a chunk of rows in memory at once.
+            digests = stream_species_csv(
+                data_path,
+                species_metas,
+                settings,
+                manifest,
+                DATA_DIR,
+                COLS,
+                OUTFILE,
+                LOWERCASE,
+                DROP_NA,
+                PARQUET_OUTFILE,
+                CHUNK_SIZE,
+                DTYPES,
+                PARQUET_DTYPES,
+            )
+            manifest.update(digests)
+            continue
+
+        dataset_df = pd.read_csv(data_path, dtype=DTYPES)
+        groups = dict(list(dataset_df.groupby("Species", sort=False)))
+
+        for species_code, species_meta in species_metas.items():
+            data_df = groups.get(species_code.upper(), dataset_df.iloc[:0])
+            digest = hash_species_inputs(data_df, species_meta, settings)
+            if is_species_unchanged(
+                manifest, species_code, species_meta, digest, DATA_DIR, OUTFILE
+            ):
+                continue
+
+            tasks[species_code] = (digest, data_df, species_meta)
+
+    if N_WORKERS is None:
+        N_WORKERS = min(len(tasks), os.cpu_count())
+
+    write_args = [
+        (
+            data_df,
+            species_meta,
+            DATA_DIR,
+            COLS,
+            OUTFILE,
+            LOWERCASE,
+            DROP_NA,
+            PARQUET_OUTFILE,
+            PARQUET_DTYPES,
         )
+        for _, data_df, species_meta in tasks.values()
+    ]
+    if N_WORKERS > 1 and len(write_args) > 1:
+        with ProcessPoolExecutor(max_workers=N_WORKERS) as executor:
+            species_codes = list(executor.map(write_species_csv, *zip(*write_args)))
+    else:
+        species_codes = [write_species_csv(*args) for args in write_args]
+
+    for species_code in species_codes:
+        manifest[species_code] = tasks[species_code][0]
+    save_manifest(manifest, MANIFEST)
 
 
 if __name__ == "__main__":
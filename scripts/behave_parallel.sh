@@ -0,0 +1,18 @@
+#!/usr/bin/env bash
+
+. .env
+
+###################################################################
+# Constants
+###################################################################
+
+export AWS_ACCESS_KEY_ID=$AWS_ACCESS_KEY_ID
+export AWS_SECRET_ACCESS_KEY=$AWS_SECRET_ACCESS_KEY
+export MLFLOW_S3_ENDPOINT_URL=$MLFLOW_S3_ENDPOINT_URL
+
+###################################################################
+# Main
+###################################################################
+
+cd growth_modelling/behaviour_tests
+python scheduler.py --tags $BEHAVE_TAGS --junit "$@"
@@ -0,0 +1,10 @@
+#!/usr/bin/env bash
+
+###################################################################
+# Main
+###################################################################
+
+# Results are stored per commit in growth_modelling/.asv/results.
+cd growth_modelling
+asv machine --yes
+asv run --python=same --set-commit-hash "$(git rev-parse HEAD)" "$@"
\ No newline at end of file
@@ -21,9 +21,11 @@ cd growth_modelling
 dvc stage add --force -n preprocess \
     -d src/preprocess.py -d data/limbatus.csv -d data/spot_tail_shark.csv -d conf/config.yaml \
     -d conf/common/carcharhiniformes.yaml -d conf/preprocess/carcharhiniformes.yaml \
-    -o ${OUT_DIR}/carcharhinus_limbatus/data.csv -o ${OUT_DIR}/carcharhinus_tilstoni/data.csv \
-    -o ${OUT_DIR}/carcharhinus_sorrah/data.csv -o ${OUT_DIR}/carcharhinus_limbatus/README.md \
-    -o ${OUT_DIR}/carcharhinus_tilstoni/README.md  -o ${OUT_DIR}/carcharhinus_sorrah/README.md \
+    --outs-persist ${OUT_DIR}/carcharhinus_limbatus/data.csv --outs-persist ${OUT_DIR}/carcharhinus_tilstoni/data.csv \
+    --outs-persist ${OUT_DIR}/carcharhinus_sorrah/data.csv --outs-persist ${OUT_DIR}/carcharhinus_limbatus/README.md \
+    --outs-persist ${OUT_DIR}/carcharhinus_tilstoni/README.md  --outs-persist ${OUT_DIR}/carcharhinus_sorrah/README.md \
+    --outs-persist ${OUT_DIR}/carcharhinus_limbatus/data.parquet --outs-persist ${OUT_DIR}/carcharhinus_tilstoni/data.parquet \
+    --outs-persist ${OUT_DIR}/carcharhinus_sorrah/data.parquet --outs-persist data/preprocess_manifest.json \
     python src/preprocess.py
     
 dvc stage add --force -n plot_curves \